@@ -0,0 +1,142 @@
+"""
+⏱️ BENCHMARK PARSING PDF
+========================
+
+Compare le débit (pages/s) de l'ancien chemin à deux bibliothèques
+(PyPDF2 pour le texte, puis fitz ouvert à nouveau pour les images)
+avec le moteur PyMuPDF en une seule passe (pdf_engine.py), puis mesure
+le passage à l'échelle de l'extraction parallèle selon le nombre de workers.
+
+Usage:
+    python benchmark_pdf.py document.pdf [autre.pdf ...] [--runs 5] [--workers 1,2,4,8]
+
+Auteur: BelikanM
+Date: 13 Novembre 2025
+"""
+
+import argparse
+import io
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any
+
+import fitz  # PyMuPDF
+import PyPDF2
+
+from pdf_engine import PDFIngestionEngine, create_pdf_process_pool, extract_pages_parallel
+
+
+def legacy_two_library_path(data: bytes) -> Dict[str, Any]:
+    """Ancien chemin: PyPDF2 pour le texte + fitz pour les images"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    all_text = ""
+    for page_num, page in enumerate(pdf_reader.pages):
+        text = page.extract_text()
+        if text.strip():
+            all_text += f"\n\n=== Page {page_num + 1} ===\n\n{text}"
+
+    image_count = 0
+    pdf_document = fitz.open(stream=data, filetype="pdf")
+    for page_num in range(min(len(pdf_document), 10)):
+        for img in pdf_document[page_num].get_images()[:3]:
+            pdf_document.extract_image(img[0])
+            image_count += 1
+    pdf_document.close()
+
+    return {"pages": len(pdf_reader.pages), "characters": len(all_text), "images": image_count}
+
+
+def single_pass_engine_path(data: bytes) -> Dict[str, Any]:
+    """Nouveau chemin: un seul document PyMuPDF parcouru une fois"""
+    all_text = ""
+    image_count = 0
+    with PDFIngestionEngine.open(data=data) as engine:
+        for page in engine.iter_pages():
+            if page.text.strip():
+                all_text += f"\n\n=== Page {page.number + 1} ===\n\n{page.text}"
+            if page.number < 10:
+                for xref in page.image_xrefs[:3]:
+                    engine.extract_image(xref)
+                    image_count += 1
+        pages = engine.page_count
+
+    return {"pages": pages, "characters": len(all_text), "images": image_count}
+
+
+def benchmark(name: str, func: Callable[[bytes], Dict[str, Any]], data: bytes, runs: int) -> Dict[str, Any]:
+    """Exécuter `runs` fois et retourner la médiane"""
+    timings = []
+    info = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        info = func(data)
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    return {
+        "name": name,
+        "median_s": median,
+        "pages_per_sec": info["pages"] / median if median > 0 else float("inf"),
+        **info
+    }
+
+
+def benchmark_scaling(pdf_path: str, page_count: int, worker_counts, runs: int):
+    """Débit de l'extraction parallèle pour chaque nombre de workers (workers lisant le fichier)"""
+    print(f"   📈 Passage à l'échelle (extraction parallèle, {page_count} pages):")
+    baseline_s = None
+    baseline_workers = worker_counts[0]
+    for workers in worker_counts:
+        with create_pdf_process_pool(workers) as pool:
+            # Préchauffage: démarrage des processus hors mesure
+            extract_pages_parallel(pool, min(page_count, workers), workers, path=pdf_path)
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                extract_pages_parallel(pool, page_count, workers, path=pdf_path)
+                timings.append(time.perf_counter() - start)
+
+        median = statistics.median(timings)
+        if baseline_s is None:
+            baseline_s = median
+        speedup = baseline_s / median
+        efficiency = speedup / (workers / baseline_workers)
+        print(
+            f"      {workers:>2} workers  {median * 1000:8.1f} ms  "
+            f"{page_count / median:8.1f} pages/s  x{speedup:.2f}  "
+            f"(efficacité {efficiency * 100:.0f}%)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing PDF: PyPDF2 + fitz vs moteur PyMuPDF")
+    parser.add_argument("pdfs", nargs="+", help="Fichiers PDF à analyser")
+    parser.add_argument("--runs", type=int, default=5, help="Nombre d'exécutions par chemin (médiane)")
+    parser.add_argument(
+        "--workers", default="1,2,4,8",
+        help="Nombres de workers à mesurer, séparés par des virgules (vide = pas de mesure)"
+    )
+    args = parser.parse_args()
+
+    for pdf_path in args.pdfs:
+        data = Path(pdf_path).read_bytes()
+        legacy = benchmark("PyPDF2 + fitz", legacy_two_library_path, data, args.runs)
+        engine = benchmark("PyMuPDF (1 passe)", single_pass_engine_path, data, args.runs)
+
+        print(f"\n📄 {pdf_path} ({legacy['pages']} pages, {len(data) / 1024:.0f} Ko)")
+        for result in (legacy, engine):
+            print(
+                f"   {result['name']:<20} {result['median_s'] * 1000:8.1f} ms  "
+                f"{result['pages_per_sec']:8.1f} pages/s  "
+                f"{result['characters']:>8} caractères  {result['images']:>3} images"
+            )
+        print(f"   ⚡ Accélération: x{legacy['median_s'] / engine['median_s']:.2f}")
+
+        worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+        if worker_counts:
+            benchmark_scaling(pdf_path, engine["pages"], worker_counts, args.runs)
+
+
+if __name__ == "__main__":
+    main()
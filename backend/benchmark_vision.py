@@ -0,0 +1,121 @@
+"""
+⏱️ BENCHMARK VISION CPU (SmolVLM)
+=================================
+
+Compare le mode CPU de référence (fp32) avec la quantification dynamique
+int8 (VISION_CPU_MODE=int8):
+- Latence médiane par image
+- Mémoire résidente (RSS) après chargement et en pic
+- Similarité des sorties avec la référence fp32
+
+Chaque mode est mesuré dans un processus séparé (RSS non pollué par l'autre modèle).
+
+Usage:
+    python benchmark_vision.py image.jpg [autre.png ...] [--runs 3] [--modes fp32,int8] [--max-new-tokens 128]
+
+Auteur: BelikanM
+Date: 13 Novembre 2025
+"""
+
+import argparse
+import difflib
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List
+
+MODELS_DIR = Path(__file__).parent / "models"
+QUESTION = "Décris cette image en détail"
+
+
+def current_rss_bytes() -> int:
+    """RSS courante du processus (Linux: /proc/self/statm)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    """RSS maximale du processus (ru_maxrss: Ko sous Linux, octets sous macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_mode(mode: str, image_paths: List[str], runs: int, max_new_tokens: int) -> Dict[str, Any]:
+    """Charger SmolVLM dans le mode demandé et mesurer (exécuté dans un processus dédié)"""
+    sys.path.append(str(MODELS_DIR))
+    from unified_agent import VisionTool, load_image
+
+    load_start = time.perf_counter()
+    tool = VisionTool(model_path=str(MODELS_DIR / "smolvlm" / "cache"), cpu_mode=mode)
+    load_seconds = time.perf_counter() - load_start
+    if not tool.is_ready:
+        raise RuntimeError(f"SmolVLM non chargé en mode {mode}")
+    rss_loaded = current_rss_bytes()
+
+    images = [load_image(path) for path in image_paths]
+    # Préchauffage (allocations, éventuelle compilation) hors mesure
+    tool.execute_batch(images[:1], QUESTION, batch_size=1, max_new_tokens=max_new_tokens)
+
+    timings = []
+    outputs = []
+    for _ in range(runs):
+        outputs = []
+        for image in images:
+            start = time.perf_counter()
+            result = tool.execute_batch([image], QUESTION, batch_size=1, max_new_tokens=max_new_tokens)[0]
+            timings.append(time.perf_counter() - start)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            outputs.append(result["description"])
+
+    return {
+        "mode": tool.runtime.get("mode", mode),
+        "runtime": tool.runtime,
+        "load_s": load_seconds,
+        "median_s": statistics.median(timings),
+        "rss_loaded": rss_loaded,
+        "rss_peak": peak_rss_bytes(),
+        "outputs": outputs
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SmolVLM CPU: fp32 vs int8 dynamique")
+    parser.add_argument("images", nargs="+", help="Images à analyser")
+    parser.add_argument("--runs", type=int, default=3, help="Passes sur les images (médiane)")
+    parser.add_argument("--modes", default="fp32,int8", help="Modes à comparer, le premier sert de référence")
+    parser.add_argument("--max-new-tokens", type=int, default=128, help="Longueur max des réponses")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    results = []
+    for mode in modes:
+        # Un processus neuf par mode: RSS et réglages de threads indépendants
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(pool.submit(run_mode, mode, args.images, args.runs, args.max_new_tokens).result())
+
+    baseline = results[0]
+    print(f"\n👁️ SmolVLM CPU - {len(args.images)} images x {args.runs} passes, {args.max_new_tokens} tokens max")
+    for result in results:
+        similarity = statistics.mean(
+            difflib.SequenceMatcher(None, reference, output).ratio()
+            for reference, output in zip(baseline["outputs"], result["outputs"])
+        )
+        print(
+            f"   {result['mode']:<6} {result['median_s'] * 1000:9.1f} ms/image  "
+            f"x{baseline['median_s'] / result['median_s']:.2f}  "
+            f"RSS {result['rss_loaded'] / 1024 ** 2:7.0f} Mo (pic {result['rss_peak'] / 1024 ** 2:.0f} Mo)  "
+            f"similarité {similarity * 100:5.1f}%  "
+            f"(chargement {result['load_s']:.1f}s, {result['runtime'].get('threads')} threads)"
+        )
+
+
+if __name__ == "__main__":
+    main()
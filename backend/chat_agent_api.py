@@ -18,35 +18,50 @@ import sys
 import logging
 import socket
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterable, Iterator, AsyncIterator, Awaitable, Callable, Tuple, Union
 from datetime import datetime
 import json
 import base64
+import hashlib
 import io
+import time
+import asyncio
+import mmap
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from itertools import chain, islice
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
 # Imports pour traitement
 from PIL import Image
-import PyPDF2
 import fitz  # PyMuPDF pour extraction d'images des PDFs
 import numpy as np
-
-# Imports IA
-from sentence_transformers import SentenceTransformer
-import faiss
+from pdf_engine import (
+    PDFIngestionEngine,
+    create_pdf_process_pool,
+    iter_pages_parallel
+)
+from vision_scheduler import VisionBatchScheduler
 
 # Charger variables d'environnement
 load_dotenv(Path(__file__).parent / "models" / ".env")
 
+# Mémoire vectorielle (après load_dotenv: sa configuration FAISS_* est lue à l'import)
+from memory_store import FAISSMemoryManager
+
 # Ajouter le chemin des modèles
 sys.path.append(str(Path(__file__).parent / "models"))
-from unified_agent import UnifiedAgent
+from unified_agent import (
+    UnifiedAgent, ToolBusyError, PipelineDAG, VISION_BATCH_SIZE, DEFAULT_VISION_EDGE,
+    TOOL_LAZY_LOAD, chat_prompt_prefix, preprocess_image, run_cancellable, stream_cancellable
+)
 
 # Configuration
 logging.basicConfig(level=logging.INFO)
@@ -110,12 +125,37 @@ Sois ultra-concis : maximum 3-4 phrases pour tout résumé."""
 CONVERSATION_PROMPT = """Maintiens une conversation naturelle et engageante. 
 Pose des questions de clarification si nécessaire. Sois amical mais professionnel."""
 
+# Prompt système de chaque branche de l'étape 7 du chat, placé en tête du prompt
+# final (après le prompt de chat de l'agent): KV-cache Mistral précalculé au démarrage.
+# "general" (toutes les autres intentions) garde SYSTEM_PROMPT, comme avant la mise
+# en cache; il est distinct de CONVERSATION_PROMPT (get_prompt_by_intent)
+CHAT_PROMPT_PREFIXES = {
+    "explain_app": EXPLAIN_APP_PROMPT,
+    "search": SEARCH_PROMPT,
+    "problem_solving": PROBLEM_SOLVING_PROMPT,
+    "summarization": SUMMARIZATION_PROMPT,
+    "general": SYSTEM_PROMPT
+}
+
 # Paramètres de performance optimisés
 MAX_TOKENS_FAST = 150  # Réponses rapides
 MAX_TOKENS_NORMAL = 300  # Réponses standard
 TEMPERATURE_PRECISE = 0.3  # Précis et factuel
 TEMPERATURE_BALANCED = 0.7  # Équilibré
 
+# Réception des uploads en streaming
+MAX_UPLOAD_SIZE = int(float(os.getenv("MAX_UPLOAD_SIZE", "50")) * 1024 * 1024)  # Taille max (Mo)
+UPLOAD_FORM_OVERHEAD = 64 * 1024  # Marge multipart (séparateurs, champ description) au-delà de la taille du fichier
+UPLOAD_READ_CHUNK = 1024 * 1024  # Relecture par blocs de 1 Mo (empreinte SHA-256)
+
+# Extraction PDF parallèle (ProcessPoolExecutor)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))  # Workers d'extraction
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))  # Pages extraites au maximum par document
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))  # En dessous: extraction dans un thread
+
+# Regroupement des requêtes vision entre uploads concurrents (lots ≤ VISION_BATCH_SIZE)
+VISION_BATCH_MAX_WAIT_MS = float(os.getenv("VISION_BATCH_MAX_WAIT_MS", "10"))  # Attente max pour compléter un lot
+
 # ==========================================
 # DÉTECTION AUTOMATIQUE DE L'IP
 # ==========================================
@@ -132,7 +172,69 @@ def get_local_ip():
     except Exception:
         return "127.0.0.1"
 
-app = FastAPI(title="Chat Agent API", version="1.0.0")
+class UploadTooLargeMiddleware:
+    """
+    Refuser (413) un upload trop volumineux avant qu'il soit mis en tampon
+    
+    Le Content-Length annoncé est vérifié avant toute lecture du corps; sans
+    lui (transfert chunked), les octets sont comptés à la réception et la
+    lecture est interrompue dès que la limite est dépassée.
+    
+    `max_body_size` borne le corps complet (fichier + enveloppe multipart);
+    le message d'erreur annonce `max_file_size`, la limite vue par l'utilisateur.
+    """
+    
+    def __init__(
+        self,
+        app,
+        max_body_size: int,
+        max_file_size: Optional[int] = None,
+        paths: Tuple[str, ...] = ("/upload",)
+    ):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = paths
+        limit = max_body_size if max_file_size is None else max_file_size
+        self.detail = f"Fichier trop volumineux (max {limit // (1024 * 1024)} Mo)"
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            await JSONResponse(status_code=413, content={"detail": self.detail})(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(413, self.detail)  # Relancée telle quelle par l'analyse du formulaire
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Cycle de vie de l'API: à l'arrêt, compacter le journal FAISS (le prochain démarrage ouvre le snapshot sans rejeu)"""
+    yield
+    if chat_manager is not None:
+        chat_manager.memory.close(str(chat_manager.storage_path))
+
+app = FastAPI(title="Chat Agent API", version="1.0.0", lifespan=lifespan)
+
+# Taille des uploads plafonnée avant lecture du corps (ajouté avant CORS: les 413 gardent les en-têtes CORS)
+app.add_middleware(
+    UploadTooLargeMiddleware,
+    max_body_size=MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD,
+    max_file_size=MAX_UPLOAD_SIZE
+)
 
 # CORS
 app.add_middleware(
@@ -143,6 +245,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Backpressure: pool LLM saturé (429 file pleine, 503 attente trop longue)
+# ou budget mémoire des modèles épuisé (503), avec Retry-After
+@app.exception_handler(ToolBusyError)
+async def tool_busy_handler(request: Request, exc: ToolBusyError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # ==========================================
 # MODÈLES PYDANTIC
 # ==========================================
@@ -159,6 +271,8 @@ class ChatRequest(BaseModel):
     use_vision: bool = True
     use_memory: bool = True
     temperature: float = 0.7
+    nprobe: Optional[int] = None  # Rappel/latence pour index IVF
+    ef_search: Optional[int] = None  # Rappel/latence pour index HNSW
 
 class ChatResponse(BaseModel):
     response: str
@@ -168,141 +282,134 @@ class ChatResponse(BaseModel):
     timestamp: str
 
 # ==========================================
-# GESTIONNAIRE DE MÉMOIRE VECTORIELLE FAISS
+# RÉCEPTION DES UPLOADS (STREAMING)
 # ==========================================
 
-class FAISSMemoryManager:
-    """Gestionnaire de mémoire avec FAISS pour recherche vectorielle"""
+class UploadBuffer:
+    """
+    Contenu d'un upload, partagé par tous les parseurs sans être recopié
     
-    def __init__(self, embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        try:
-            # Essayer de charger le modèle depuis le cache local
-            self.embedding_model = SentenceTransformer(embedding_model, local_files_only=True)
-        except Exception as e:
-            logger.warning(f"⚠️ Impossible de charger le modèle d'embeddings: {e}")
-            logger.info("ℹ️ Fonctionnement sans recherche vectorielle FAISS")
-            self.embedding_model = None
-        
-        self.dimension = 384  # Dimension des embeddings MiniLM
-        
-        # Index FAISS (IndexFlatL2 pour recherche exacte)
-        self.index = faiss.IndexFlatL2(self.dimension) if self.embedding_model else None
-        
-        # Stockage des métadonnées
-        self.documents: List[Dict[str, Any]] = []
-        self.document_embeddings: List[np.ndarray] = []
-        
-        # Conversations
-        self.conversations: Dict[str, List[ChatMessage]] = {}
-        
-        if self.embedding_model:
-            logger.info(f"✅ FAISS Memory Manager initialisé (dim={self.dimension})")
-        else:
-            logger.info("✅ Memory Manager initialisé (mode simple sans FAISS)")
+    Starlette a déjà reçu le fichier dans un SpooledTemporaryFile (en RAM
+    sous 1 Mo, sur disque au-delà): ce fichier est réutilisé tel quel.
+    PyMuPDF lit le contenu à travers une vue mémoire (tampon RAM ou mmap
+    du fichier disque), PIL à travers le fichier lui-même.
+    """
     
-    def add_document(
-        self,
-        text: str,
-        metadata: Dict[str, Any],
-        doc_type: str = "text"
-    ) -> int:
-        """Ajouter un document à la mémoire vectorielle"""
-        
-        if not self.embedding_model:
-            # Mode simple : juste stocker sans embeddings
-            doc_id = len(self.documents)
-            self.documents.append({
-                "id": doc_id,
-                "text": text,
-                "type": doc_type,
-                "metadata": metadata,
-                "timestamp": datetime.now().isoformat()
-            })
-            return doc_id
-        
-        # Mode FAISS : avec embeddings
-        # Générer l'embedding
-        embedding = self.embedding_model.encode([text])[0]
-        
-        # Ajouter à FAISS
-        self.index.add(np.array([embedding], dtype=np.float32))
-        
-        # Stocker les métadonnées
-        doc_id = len(self.documents)
-        self.documents.append({
-            "id": doc_id,
-            "text": text,
-            "type": doc_type,
-            "metadata": metadata,
-            "timestamp": datetime.now().isoformat()
-        })
-        self.document_embeddings.append(embedding)
-        
-        logger.info(f"📄 Document ajouté: {doc_type} (ID: {doc_id})")
-        return doc_id
+    def __init__(self, file, size: int, sha256: str, temp_dir: Optional[Path] = None):
+        self._file = file
+        self.size = size
+        self.sha256 = sha256
+        self._temp_dir = temp_dir
+        self._view: Optional[memoryview] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self.path: Optional[str] = None
     
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Rechercher les documents les plus similaires"""
-        
-        if not self.embedding_model:
-            # Mode simple : retourner les derniers documents
-            return self.documents[-k:] if self.documents else []
-        
-        if self.index.ntotal == 0:
-            return []
-        
-        # Générer l'embedding de la requête
-        query_embedding = self.embedding_model.encode([query])[0]
-        
-        # Recherche dans FAISS
-        distances, indices = self.index.search(
-            np.array([query_embedding], dtype=np.float32),
-            min(k, self.index.ntotal)
-        )
-        
-        # Récupérer les documents
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:
-                doc = self.documents[idx].copy()
-                doc["similarity"] = float(1 / (1 + distances[0][i]))  # Convertir distance en similarité
-                results.append(doc)
-        
-        logger.info(f"🔍 Recherche: {len(results)} résultats pour '{query[:50]}...'")
-        return results
+    @property
+    def in_memory(self) -> bool:
+        return isinstance(getattr(self._file, "_file", self._file), io.BytesIO)
     
-    def add_to_conversation(self, conv_id: str, message: ChatMessage):
-        """Ajouter un message à une conversation"""
-        if conv_id not in self.conversations:
-            self.conversations[conv_id] = []
-        self.conversations[conv_id].append(message)
+    @property
+    def data(self) -> memoryview:
+        """Contenu en vue mémoire, sans copie (tampon du fichier en RAM, ou mmap du fichier disque)"""
+        if self._view is None:
+            inner = getattr(self._file, "_file", self._file)  # SpooledTemporaryFile: BytesIO ou fichier disque
+            if isinstance(inner, io.BytesIO):
+                self._view = inner.getbuffer()
+            elif self.size == 0:
+                self._view = memoryview(b"")
+            else:
+                self._mmap = mmap.mmap(inner.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+        return self._view
     
-    def get_conversation(self, conv_id: str) -> List[ChatMessage]:
-        """Récupérer une conversation"""
-        return self.conversations.get(conv_id, [])
+    def open_stream(self):
+        """Flux binaire positionné au début (PIL)"""
+        self._file.seek(0)
+        return self._file
     
-    def save_to_disk(self, path: str):
-        """Sauvegarder l'index FAISS sur disque"""
-        faiss.write_index(self.index, f"{path}/faiss.index")
-        
-        with open(f"{path}/documents.json", "w", encoding="utf-8") as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"💾 Index FAISS sauvegardé: {path}")
+    def open_pdf(self):
+        """Document PyMuPDF sur le même contenu"""
+        return fitz.open(stream=self.data, filetype="pdf")
     
-    def load_from_disk(self, path: str):
-        """Charger l'index FAISS depuis le disque"""
-        index_path = f"{path}/faiss.index"
-        docs_path = f"{path}/documents.json"
-        
-        if os.path.exists(index_path):
-            self.index = faiss.read_index(index_path)
-            logger.info(f"📂 Index FAISS chargé: {self.index.ntotal} vecteurs")
+    def materialize(self) -> str:
+        """
+        Chemin d'une copie du contenu sur disque (workers du pool PDF)
         
-        if os.path.exists(docs_path):
-            with open(docs_path, "r", encoding="utf-8") as f:
-                self.documents = json.load(f)
-            logger.info(f"📂 {len(self.documents)} documents chargés")
+        Le fichier de Starlette est anonyme et une vue mémoire ne se transmet
+        pas à un autre processus: une copie nommée est écrite une fois,
+        chaque worker l'ouvre ensuite lui-même.
+        """
+        if self.path is None:
+            if self._temp_dir is not None:
+                self._temp_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                prefix="upload_", dir=str(self._temp_dir) if self._temp_dir else None, delete=False
+            ) as copy:
+                copy.write(self.data)
+            self.path = copy.name
+        return self.path
+    
+    def close(self):
+        """Libérer les vues sur le contenu et supprimer la copie sur disque (le fichier reste à Starlette)"""
+        try:
+            if self._view is not None:
+                self._view.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            logger.debug("Vue sur l'upload encore référencée: libérée par le ramasse-miettes")
+        self._view = None
+        self._mmap = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+def hash_upload_file(file) -> Tuple[int, str]:
+    """Taille et SHA-256 du fichier reçu, relu par blocs depuis le début"""
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    while True:
+        chunk = file.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        size += len(chunk)
+        digest.update(chunk)
+    file.seek(0)
+    return size, digest.hexdigest()
+
+async def receive_upload(
+    file: UploadFile,
+    max_size: int = MAX_UPLOAD_SIZE,
+    temp_dir: Optional[Path] = None
+) -> UploadBuffer:
+    """Empreinte et taille d'un upload reçu par Starlette (relu hors de la boucle asyncio, jamais recopié)"""
+    loop = asyncio.get_running_loop()
+    size, sha256 = await loop.run_in_executor(None, hash_upload_file, file.file)
+    if size > max_size:
+        raise HTTPException(413, f"Fichier trop volumineux (max {max_size // (1024 * 1024)} Mo)")
+    return UploadBuffer(file.file, size, sha256, temp_dir=temp_dir)
+
+# Mesures de l'ingestion d'origine (extraction, encodage, lots vision): sans objet pour un doublon
+INGESTION_STATS_KEYS = ("ingestion", "parsing", "preprocessing", "processing_ms", "memory")
+
+def deduplicated_result(previous: Dict[str, Any], filename: Optional[str], content_hash: str) -> Dict[str, Any]:
+    """Résultat d'un contenu déjà ingéré: documents et analyse d'origine, sans ses statistiques"""
+    results = {key: value for key, value in previous["result"].items() if key not in INGESTION_STATS_KEYS}
+    if "total_pages" in results:
+        results.pop("vision", None)  # PDF: statistiques des lots vision (images: description conservée)
+    results.update({
+        "filename": filename,
+        "content_hash": content_hash,
+        "duplicate": True,
+        "duplicate_of": previous["filename"],
+        "ingested_at": previous["created_at"]
+    })
+    return results
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formater un événement Server-Sent Events (données JSON sur une ligne)"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
 
 # ==========================================
 # GESTIONNAIRE DE CHAT
@@ -312,15 +419,39 @@ class ChatAgentManager:
     """Gestionnaire principal du chat agent"""
     
     def __init__(self):
-        # Désactiver temporairement les modèles lourds pour permettre le démarrage rapide
+        # Modèles chargés à leur premier appel: le démarrage reste rapide.
+        # Sans chargement paresseux, les modèles lourds restent désactivés
         self.agent = UnifiedAgent(
-            enable_voice=False,
-            enable_vision=False,
-            enable_detection=False,
-            enable_llm=False
+            enable_voice=TOOL_LAZY_LOAD,
+            enable_vision=TOOL_LAZY_LOAD,
+            enable_detection=TOOL_LAZY_LOAD,
+            enable_llm=TOOL_LAZY_LOAD,
+            lazy_load=TOOL_LAZY_LOAD
         )
         self.memory = FAISSMemoryManager()
         
+        # MiniLM reste chargé: sa mémoire est déduite du budget des modèles
+        if self.memory.embedding_model is not None:
+            self.agent.residency.reserve_static("embeddings (MiniLM)", sum(
+                t.numel() * t.element_size() for t in self.memory.embedding_model.parameters()
+            ))
+        
+        # Pool d'extraction PDF (créé au premier PDF volumineux)
+        self._pdf_pool = None
+        
+        # Ordonnanceur de lots vision partagé par tous les uploads (créé au premier usage)
+        self._vision_scheduler: Optional[VisionBatchScheduler] = None
+        
+        # Ingestions en cours par empreinte SHA-256: un même contenu envoyé deux fois
+        # en parallèle n'est analysé qu'une fois, le second envoi attend le premier
+        self._ingestions_in_flight: Dict[str, asyncio.Future] = {}
+        
+        # Précalculer le KV-cache des prompts système (si Mistral est chargé)
+        if "llm" in self.agent.tools and self.agent.tools["llm"].is_ready:
+            self.agent.tools["llm"].register_prefixes({
+                name: chat_prompt_prefix(text) for name, text in CHAT_PROMPT_PREFIXES.items()
+            })
+        
         # Créer le dossier de stockage
         self.storage_path = Path(__file__).parent / "storage" / "chat_memory"
         self.storage_path.mkdir(parents=True, exist_ok=True)
@@ -372,6 +503,115 @@ class ChatAgentManager:
         }
         return prompts.get(intent, CONVERSATION_PROMPT)
     
+    def _get_pdf_pool(self):
+        """Pool de processus pour l'extraction PDF (création paresseuse)"""
+        if self._pdf_pool is None:
+            self._pdf_pool = create_pdf_process_pool(PDF_WORKERS)
+            logger.info(f"⚙️ Pool d'extraction PDF démarré: {PDF_WORKERS} workers")
+        return self._pdf_pool
+    
+    def _iter_pdf_pages(self, upload: UploadBuffer, pdf_engine: PDFIngestionEngine, page_count: int) -> Iterator[tuple]:
+        """
+        Texte et xrefs d'images page par page (générateur bloquant, consommé dans un thread de l'exécuteur)
+        
+        Les gros documents sont répartis par plages de pages sur le pool de
+        processus (chaque worker rouvre le fichier); les petits sont parcourus
+        sur le document déjà ouvert (pas de surcoût IPC).
+        """
+        if PDF_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+            yield from iter_pages_parallel(self._get_pdf_pool(), page_count, PDF_WORKERS, path=upload.materialize())
+            return
+        
+        for page in pdf_engine.iter_pages(0, page_count):
+            yield page.number, page.text, page.image_xrefs
+    
+    async def _run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Appel bloquant (décodage, encodage MiniLM, SQLite, fsync) exécuté hors de la boucle asyncio
+
+        Non interruptible: une annulation de l'appelant laisse le thread finir son appel
+        (les uploads protègent donc leur ingestion, voir `process_upload`)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+    
+    def _get_vision_scheduler(self) -> VisionBatchScheduler:
+        """Ordonnanceur de lots vision (création paresseuse)"""
+        if self._vision_scheduler is None:
+            self._vision_scheduler = VisionBatchScheduler(
+                self.agent.tools["vision"],
+                max_batch_size=VISION_BATCH_SIZE,
+                max_wait_ms=VISION_BATCH_MAX_WAIT_MS,
+                propagate=(ToolBusyError,)
+            )
+        return self._vision_scheduler
+    
+    def get_llm_pool(self):
+        """Pool d'instances Mistral (None si le LLM n'est pas chargé)"""
+        llm = self.agent.tools.get("llm")
+        return llm.pool if llm is not None and llm.is_ready else None
+    
+    def get_llm_metrics(self) -> Optional[Dict[str, Any]]:
+        """Métriques du pool LLM (file d'attente, refus, temps d'attente et de génération)"""
+        pool = self.get_llm_pool()
+        return pool.get_metrics() if pool else None
+    
+    def get_prefix_metrics(self) -> Optional[Dict[str, Any]]:
+        """Économies du cache de préfixes Mistral par intention (None si le LLM n'est pas chargé)"""
+        llm = self.agent.tools.get("llm")
+        return llm.get_prefix_stats() if llm is not None and llm.is_ready else None
+    
+    def get_vision_metrics(self) -> Optional[Dict[str, Any]]:
+        """Métriques du regroupement vision (None tant qu'aucune image n'a été analysée)"""
+        return self._vision_scheduler.get_metrics() if self._vision_scheduler else None
+    
+    async def _describe_images(
+        self,
+        images: Iterable[Any],
+        questions: Union[str, List[str]]
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Décrire des images en mémoire avec SmolVLM via l'ordonnanceur de lots
+        
+        Les images sont soumises par fenêtres de VISION_BATCH_SIZE: un générateur
+        (rendu de pages) n'est matérialisé que fenêtre par fenêtre, et les lots
+        peuvent être complétés par les images d'autres uploads concurrents.
+        
+        Returns:
+            (une description par image, "" en cas d'échec ; débit de cette requête)
+        """
+        scheduler = self._get_vision_scheduler()
+        loop = asyncio.get_running_loop()
+        images = iter(images)
+        descriptions: List[str] = []
+        errors = 0
+        start_time = time.perf_counter()
+        
+        while True:
+            # Matérialiser la fenêtre (rendu des pages) hors de la boucle asyncio
+            window = await loop.run_in_executor(None, lambda: list(islice(images, scheduler.max_batch_size)))
+            if not window:
+                break
+            offset = len(descriptions)
+            window_questions = (
+                questions if isinstance(questions, str)
+                else questions[offset:offset + len(window)]
+            )
+            for index, result in enumerate(await scheduler.submit_many(window, window_questions)):
+                if "error" in result:
+                    errors += 1
+                    logger.warning(f"⚠️ Erreur analyse image {offset + index + 1}: {result['error']}")
+                descriptions.append(result.get("description", ""))
+        
+        elapsed = time.perf_counter() - start_time
+        stats = {
+            "images": len(descriptions),
+            "errors": errors,
+            "seconds": round(elapsed, 4),
+            "images_per_sec": round(len(descriptions) / elapsed, 3) if elapsed > 0 else None
+        }
+        return descriptions, stats
+    
     async def process_upload(
         self,
         file: UploadFile,
@@ -379,11 +619,97 @@ class ChatAgentManager:
     ) -> Dict[str, Any]:
         """Traiter un fichier uploadé (image ou PDF) - Supporte TOUS les formats"""
         
-        file_content = await file.read()
-        file_type = file.content_type
-        filename = file.filename
+        if self.memory.read_only:
+            raise HTTPException(503, "Mémoire en lecture seule sur ce worker (FAISS_READ_ONLY_WORKERS): envoyer les uploads au worker écrivain")
+        
+        start_time = time.perf_counter()
         
-        results = {"filename": filename, "type": file_type, "documents": []}
+        # Tampon de Starlette réutilisé par tous les parseurs (taille déjà plafonnée par UploadTooLargeMiddleware)
+        upload = await receive_upload(file, temp_dir=Path(__file__).parent / "storage" / "temp")
+
+        # Ingestion protégée de l'annulation (client déconnecté): les appels de `_run_blocking`
+        # ne sont pas interruptibles, le document PDF, le fichier reçu et la réservation du
+        # contenu ne sont libérés qu'une fois le dernier thread terminé
+        ingestion = asyncio.ensure_future(
+            self._ingest_received_upload(upload, file.content_type, file.filename, description, start_time)
+        )
+        try:
+            return await asyncio.shield(ingestion)
+        except asyncio.CancelledError:
+            logger.info(f"🔌 Upload {file.filename} abandonné par le client: indexation menée à terme")
+            # Garder la requête ouverte: Starlette ferme le fichier reçu dès qu'elle se termine
+            while not ingestion.done():
+                try:
+                    await asyncio.wait({ingestion})
+                except asyncio.CancelledError:
+                    continue
+            if not ingestion.cancelled() and ingestion.exception() is not None:
+                logger.warning(f"⚠️ Upload {file.filename} abandonné: {ingestion.exception()}")
+            raise
+
+    async def _ingest_received_upload(
+        self,
+        upload: UploadBuffer,
+        file_type: Optional[str],
+        filename: Optional[str],
+        description: Optional[str],
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Ingérer un upload reçu puis libérer son tampon (fichier temporaire ou matérialisé)"""
+        try:
+            results = await self._process_upload_buffer(upload, file_type, filename, description, start_time)
+        finally:
+            upload.close()
+
+        results["memory"] = {
+            "upload_bytes": upload.size,
+            "spooled_to_disk": not upload.in_memory
+        }
+        return results
+    
+    async def _process_upload_buffer(
+        self,
+        upload: UploadBuffer,
+        file_type: Optional[str],
+        filename: Optional[str],
+        description: Optional[str],
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Analyser et indexer le contenu d'un upload déjà reçu (une seule ingestion par contenu)"""
+        content_hash = upload.sha256
+        
+        # Même contenu en cours d'ingestion: attendre la fin puis réutiliser son résultat
+        while content_hash in self._ingestions_in_flight:
+            await asyncio.shield(self._ingestions_in_flight[content_hash])
+        claim = asyncio.get_running_loop().create_future()
+        self._ingestions_in_flight[content_hash] = claim
+        
+        try:
+            # Déduplication: un contenu déjà ingéré n'est ni ré-extrait ni ré-encodé
+            previous = await self._run_blocking(self.memory.find_ingestion, content_hash)
+            if previous:
+                logger.info(f"♻️ Fichier déjà ingéré ({content_hash[:12]}…): {filename} → {len(previous['doc_ids'])} documents existants")
+                results = deduplicated_result(previous, filename, content_hash)
+                results["processing_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+                return results
+            
+            return await self._ingest_upload_buffer(upload, file_type, filename, description)
+        finally:
+            # Échec ou analyse incomplète: les envois en attente ne trouvent rien et ré-analysent
+            del self._ingestions_in_flight[content_hash]
+            claim.set_result(None)
+    
+    async def _ingest_upload_buffer(
+        self,
+        upload: UploadBuffer,
+        file_type: Optional[str],
+        filename: Optional[str],
+        description: Optional[str]
+    ) -> Dict[str, Any]:
+        """Extraire, analyser et indexer un contenu jamais ingéré"""
+        content_hash = upload.sha256
+        results = {"filename": filename, "type": file_type, "documents": [], "content_hash": content_hash}
+        degraded: List[str] = []  # Analyses incomplètes: le résultat n'est pas enregistré pour la déduplication
         
         try:
             # === DÉTECTION UNIVERSELLE DU TYPE DE FICHIER ===
@@ -424,7 +750,7 @@ class ChatAgentManager:
             if file_type in ["application/octet-stream", None, ""] or not file_type.startswith("image/"):
                 try:
                     # Essayer d'ouvrir comme image avec PIL
-                    test_image = Image.open(io.BytesIO(file_content))
+                    test_image = Image.open(upload.open_stream())
                     detected_format = test_image.format.lower() if test_image.format else "unknown"
                     file_type = f"image/{detected_format}"
                     logger.info(f"📎 Détection par contenu: {detected_format.upper()}")
@@ -441,44 +767,44 @@ class ChatAgentManager:
             # === TRAITEMENT IMAGE (TOUS FORMATS) ===
             if file_type and file_type.startswith("image/"):
                 try:
-                    image = Image.open(io.BytesIO(file_content))
-                    
-                    # Convertir en RGB si nécessaire (pour PNG avec transparence, etc.)
-                    if image.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', image.size, (255, 255, 255))
-                        if image.mode == 'P':
-                            image = image.convert('RGBA')
-                        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                        image = background
-                        logger.info(f"🔄 Image convertie de {image.mode} en RGB")
+                    # Décodage réduit à la résolution du modèle (draft JPEG, EXIF, réduction puis RGB)
+                    vision_tool = self.agent.tools.get("vision")
+                    max_edge = vision_tool.input_resolution if vision_tool and vision_tool.is_ready else DEFAULT_VISION_EDGE
+                    image, preprocessing = await self._run_blocking(preprocess_image, upload.open_stream(), max_edge=max_edge)
+                    width, height = preprocessing["original_size"]
+                    results["preprocessing"] = preprocessing
+                    logger.info(
+                        f"🖼️ Image {width}x{height} → {image.width}x{image.height} "
+                        f"({preprocessing['decode_ms']:.0f} ms, {preprocessing['decoded_bytes'] / 1024 ** 2:.1f} Mo décodés"
+                        f"{', draft JPEG' if preprocessing['draft'] else ''})"
+                    )
+                    vision_result = {}
                     
                     # Analyser l'image avec SmolVLM + YOLO (si disponibles)
                     logger.info(f"👁️ [Analyse Image] Traitement de l'image: {filename} ({file_type})")
                     
                     # Vérifier si les outils visuels sont disponibles
                     if ("vision" in self.agent.tools and self.agent.tools["vision"].is_ready) or ("detection" in self.agent.tools and self.agent.tools["detection"].is_ready):
-                        # Sauvegarder temporairement l'image pour process_image
-                        temp_path = Path(__file__).parent / "storage" / "temp" / filename
-                        temp_path.parent.mkdir(parents=True, exist_ok=True)
-                        image.save(temp_path)
-                        
                         # UTILISER TOUS LES OUTILS: SmolVLM + YOLO + Mistral + Tavily
-                        analysis = self.agent.process_image(
-                            image_path=str(temp_path),
+                        # L'image déjà décodée est transmise en mémoire (pas de fichier temporaire);
+                        # analyse hors de la boucle asyncio, annulée si le client se déconnecte.
+                        # SmolVLM passe par l'ordonnanceur: lots partagés avec les autres uploads
+                        analysis = await self.agent.aprocess_image(
+                            image_path=image,
                             question=description or "Analyse cette image en détail avec tous les objets visibles.",
-                            detect_objects=True  # ✅ TOUJOURS ACTIVER YOLO
+                            detect_objects=True,  # ✅ TOUJOURS ACTIVER YOLO
+                            vision_scheduler=(
+                                self._get_vision_scheduler() if vision_tool is not None and vision_tool.is_ready else None
+                            )
                         )
                         
-                        # Nettoyer le fichier temporaire
-                        if temp_path.exists():
-                            temp_path.unlink()
-                        
                         # Extraire la description depuis le résultat
                         # process_image retourne: {vision: {description: ...}, detection: ..., synthesis: ...}
                         if "error" in analysis:
                             logger.warning(f"⚠️ Erreur analyse IA: {analysis['error']}")
+                            degraded.append(f"analyse image: {analysis['error']}")
                             # Analyse basique sans IA
-                            description_text = f"Image {file_type} de dimensions {image.width}x{image.height} pixels"
+                            description_text = f"Image {file_type} de dimensions {width}x{height} pixels"
                             synthesis_text = f"Image chargée avec succès. Modèles IA temporairement désactivés pour les tests."
                             analysis = {"tools_used": ["Mode Basique"]}
                         else:
@@ -488,35 +814,42 @@ class ChatAgentManager:
                     else:
                         # Mode basique sans modèles IA
                         logger.info("📝 [Mode Basique] Analyse image sans IA")
-                        description_text = f"Image {file_type} de dimensions {image.width}x{image.height} pixels"
+                        degraded.append("analyse image: modèles de vision indisponibles")
+                        description_text = f"Image {file_type} de dimensions {width}x{height} pixels"
                         synthesis_text = f"Image chargée avec succès. Modèles IA temporairement désactivés pour permettre les tests de connectivité."
                         analysis = {"tools_used": ["Mode Basique"]}
                     
                     # Combiner vision et synthèse pour FAISS
                     full_description = f"{description_text}\n\nSynthèse: {synthesis_text}" if synthesis_text else description_text
                     
-                    # Ajouter à la mémoire FAISS
-                    doc_id = self.memory.add_document(
-                        text=full_description,
-                        metadata={
-                            "filename": filename,
-                            "type": "image",
-                            "format": file_type,
-                            "size": len(file_content),
-                            "dimensions": f"{image.width}x{image.height}",
-                            "vision": vision_result,
-                            "synthesis": synthesis_text,
-                            "analysis": analysis
-                        },
-                        doc_type="image"
-                    )
+                    # Ajouter à la mémoire FAISS (encodage et écriture hors de la boucle asyncio)
+                    def index_image() -> int:
+                        image_ids = self.memory.add_documents(
+                            texts=[full_description],
+                            metadatas=[{
+                                "filename": filename,
+                                "type": "image",
+                                "format": file_type,
+                                "size": upload.size,
+                                "dimensions": f"{width}x{height}",
+                                "vision": vision_result,
+                                "synthesis": synthesis_text,
+                                "analysis": analysis
+                            }],
+                            doc_type="image"
+                        )
+                        # Statistiques lues dans le thread qui a ingéré
+                        results["ingestion"] = self.memory.last_ingestion_stats
+                        return image_ids[0]
+                    
+                    doc_id = await self._run_blocking(index_image)
                     
                     # AJOUTER LES RÉSULTATS AU FORMAT FLUTTER
                     results["documents"].append({
                         "id": doc_id,
                         "type": "image",
                         "format": file_type,
-                        "dimensions": f"{image.width}x{image.height}",
+                        "dimensions": f"{width}x{height}",
                         "description": description_text,
                         "synthesis": synthesis_text,
                         "analysis": analysis
@@ -530,9 +863,11 @@ class ChatAgentManager:
                     results["tools_used"] = analysis.get("tools_used", [])
                     results["web_search"] = analysis.get("web_search")
                     
-                    logger.info(f"✅ Image analysée: {filename} ({image.width}x{image.height})")
+                    logger.info(f"✅ Image analysée: {filename} ({width}x{height})")
                     image.close()
                     
+                except (ToolBusyError, HTTPException):
+                    raise
                 except Exception as e:
                     logger.error(f"❌ Erreur traitement image: {e}")
                     raise HTTPException(500, f"Erreur traitement image: {str(e)}")
@@ -541,198 +876,246 @@ class ChatAgentManager:
             elif file_type == "application/pdf":
                 logger.info(f"📄 Traitement PDF RAG: {filename}")
                 
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-                all_text = ""
+                # Un seul document PyMuPDF pour le texte, les images et le rendu des pages
+                pdf_engine = await self._run_blocking(lambda: PDFIngestionEngine(upload.open_pdf()))
+                total_pages = pdf_engine.page_count
+                extracted_pages = min(total_pages, PDF_MAX_PAGES)
                 total_chunks = 0
+                image_refs = []  # (page, index, xref) des images embarquées à analyser
                 
-                # ÉTAPE 1: Extraire tout le texte
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text = page.extract_text()
-                    if text.strip():
-                        all_text += f"\n\n=== Page {page_num + 1} ===\n\n{text}"
-                
-                logger.info(f"📖 PDF: {len(pdf_reader.pages)} pages, {len(all_text)} caractères")
-                
-                # ÉTAPE 1.5: Si le PDF n'a pas de texte (PDF scanné), extraire le texte des images
-                is_scanned_pdf = len(all_text.strip()) < 100  # Moins de 100 caractères = probablement scanné
-                
-                if is_scanned_pdf:
-                    logger.info(f"🖼️ PDF scanné détecté - Extraction du texte via analyse d'images...")
-                    try:
-                        pdf_document = fitz.open(stream=file_content, filetype="pdf")
-                        
-                        # Limiter à 20 pages pour éviter les traitements trop longs
-                        max_pages = min(len(pdf_document), 20)
-                        logger.info(f"📸 Analyse de {max_pages} pages (sur {len(pdf_document)})...")
-                        
-                        # Créer un dossier temporaire pour les images
-                        temp_dir = Path(__file__).parent / "storage" / "temp"
-                        temp_dir.mkdir(parents=True, exist_ok=True)
-                        
-                        for page_num in range(max_pages):
-                            page = pdf_document[page_num]
-                            
-                            # Convertir la page en image
-                            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom pour meilleure qualité
+                try:
+                    # ÉTAPE 1: Extraire le texte et repérer les images au fil du découpage (jamais tout le document en mémoire)
+                    parsing = {"text_chars": 0, "seconds": 0.0}
+                    
+                    def extracted_pages_stream() -> Iterator[tuple]:
+                        """Pages extraites à la demande: xrefs des images, caractères et temps d'extraction"""
+                        page_iter = self._iter_pdf_pages(upload, pdf_engine, extracted_pages)
+                        while True:
+                            extract_start = time.perf_counter()
+                            page = next(page_iter, None)
+                            parsing["seconds"] += time.perf_counter() - extract_start
+                            if page is None:
+                                return
+                            page_num, page_text, image_xrefs = page
+                            parsing["text_chars"] += len(page_text.strip())
+                            if page_num < 10:  # Max 10 pages pour les images
+                                for img_index, xref in enumerate(image_xrefs[:3]):  # Max 3 images par page
+                                    image_refs.append((page_num, img_index, xref))
+                            yield page
+                    
+                    pages = extracted_pages_stream()
+                    
+                    # Lire juste assez de pages pour savoir si le PDF a du texte (tout le document s'il est scanné)
+                    def read_head() -> List[tuple]:
+                        head = []
+                        for page in pages:
+                            head.append(page)
+                            if parsing["text_chars"] >= 100:
+                                break
+                        return head
+                    
+                    head_pages = await self._run_blocking(read_head)
+                    
+                    def page_sections() -> Iterator[str]:
+                        """Texte page par page, sans concaténer le document entier"""
+                        for page_num, page_text, _ in chain(head_pages, pages):
+                            if page_text.strip():
+                                yield f"\n\n=== Page {page_num + 1} ===\n\n{page_text}"
+                    
+                    sections: Iterable[str] = page_sections()
+                    
+                    # ÉTAPE 1.5: Si le PDF n'a pas de texte (PDF scanné), extraire le texte des images
+                    is_scanned_pdf = parsing["text_chars"] < 100  # Moins de 100 caractères = probablement scanné
+                    
+                    if is_scanned_pdf:
+                        logger.info(f"🖼️ PDF scanné détecté - Extraction du texte via analyse d'images...")
+                        sections = list(sections)
+                        try:
+                            # Limiter à 20 pages pour éviter les traitements trop longs
+                            max_pages = min(total_pages, 20)
+                            logger.info(f"📸 Analyse de {max_pages} pages (sur {total_pages})...")
                             
-                            # Sauvegarder temporairement
-                            temp_img_path = temp_dir / f"pdf_page_{page_num}.png"
-                            pix.save(str(temp_img_path))
+                            vision_ready = "vision" in self.agent.tools and self.agent.tools["vision"].is_ready
+                            # Zoom adapté à la résolution d'entrée du modèle (au lieu d'un 2x fixe)
+                            max_edge = self.agent.tools["vision"].input_resolution if vision_ready else None
                             
-                            # Analyser l'image avec SmolVLM
-                            try:
-                                if "vision" in self.agent.tools and self.agent.tools["vision"].is_ready:
-                                    page_analysis = await self.agent.process_image(
-                                        image_path=str(temp_img_path),
-                                        query=f"Extrais et décris tout le texte visible sur cette page {page_num + 1}. Décris aussi les schémas, tableaux et éléments visuels importants.",
-                                        detect_objects=False  # Pas besoin de YOLO pour du texte
-                                    )
-                                    
-                                    page_text = page_analysis.get("vision", "")
+                            if vision_ready:
+                                # Rendu en mémoire et paresseux: seules les pages du lot en cours existent
+                                # en pixmap, transmises telles quelles à SmolVLM (aucun PNG temporaire)
+                                page_texts, results["vision"] = await self._describe_images(
+                                    (pdf_engine.render_page(page_num, max_edge=max_edge) for page_num in range(max_pages)),
+                                    [
+                                        f"Extrais et décris tout le texte visible sur cette page {page_num + 1}. Décris aussi les schémas, tableaux et éléments visuels importants."
+                                        for page_num in range(max_pages)
+                                    ]
+                                )
+                                if results["vision"]["errors"]:
+                                    degraded.append(f"pages scannées: {results['vision']['errors']} analyses en échec")
+                                for page_num, page_text in enumerate(page_texts):
                                     if page_text:
-                                        all_text += f"\n\n=== Page {page_num + 1} (analysée visuellement) ===\n\n{page_text}"
-                                else:
-                                    # Mode basique
-                                    logger.info(f"📝 [Mode Basique] Page {page_num + 1} - OCR non disponible")
-                                    all_text += f"\n\n=== Page {page_num + 1} (PDF scanné - OCR désactivé) ===\n\n[Texte non extractible - modèles IA temporairement désactivés]"
-                                
-                                # Nettoyer l'image temporaire
-                                if temp_img_path.exists():
-                                    temp_img_path.unlink()
-                                    
-                            except Exception as e:
-                                logger.warning(f"⚠️ Erreur analyse page {page_num + 1}: {e}")
-                                # Nettoyer même en cas d'erreur
-                                if temp_img_path.exists():
-                                    temp_img_path.unlink()
-                                continue
-                        
-                        pdf_document.close()
-                        logger.info(f"✅ Analyse visuelle complétée: {len(all_text)} caractères extraits")
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Erreur extraction visuelle PDF: {e}")
-                
-                # ÉTAPE 2: CHUNKING INTELLIGENT (découper en morceaux optimaux)
-                if len(all_text.strip()) > 0:
-                    chunk_size = 1000  # ~1000 caractères par chunk
-                    chunk_overlap = 200  # 200 caractères de chevauchement
+                                        sections.append(f"\n\n=== Page {page_num + 1} (analysée visuellement) ===\n\n{page_text}")
+                            else:
+                                # Mode basique
+                                logger.info(f"📝 [Mode Basique] {max_pages} pages - OCR non disponible")
+                                degraded.append("pages scannées: modèle de vision indisponible")
+                                for page_num in range(max_pages):
+                                    sections.append(f"\n\n=== Page {page_num + 1} (PDF scanné - OCR désactivé) ===\n\n[Texte non extractible - modèles IA temporairement désactivés]")
+                            
+                            logger.info(f"✅ Analyse visuelle complétée: {sum(len(section) for section in sections)} caractères extraits")
+                            
+                        except ToolBusyError:
+                            raise
+                        except Exception as e:
+                            logger.error(f"❌ Erreur extraction visuelle PDF: {e}")
+                            degraded.append(f"pages scannées: {e}")
                     
-                    chunks = []
-                    start = 0
-                    while start < len(all_text):
-                        end = start + chunk_size
-                        
-                        # Trouver la fin d'une phrase pour ne pas couper au milieu
-                        if end < len(all_text):
-                            # Chercher le dernier point, point d'exclamation ou point d'interrogation
-                            last_period = max(
-                                all_text.rfind('.', start, end),
-                                all_text.rfind('!', start, end),
-                                all_text.rfind('?', start, end),
-                                all_text.rfind('\n', start, end)
+                    # ÉTAPE 2 + 3: CHUNKING EN FLUX → FAISS EN LOTS
+                    # Les chunks sont produits au fil des pages et encodés par lots de batch_size
+                    chunker = self.memory.create_chunker()
+                    previews: List[str] = []
+                    
+                    def chunk_documents() -> Iterator[tuple]:
+                        for i, chunk in enumerate(chunker.chunk(sections)):
+                            previews.append(chunk[:150] + "...")
+                            yield chunk, {
+                                "filename": filename,
+                                "chunk_index": i,
+                                "type": "pdf_chunk",
+                                "chunk_size": len(chunk)
+                            }
+                    
+                    def index_chunks() -> List[int]:
+                        """Découpage, encodage MiniLM et écriture FAISS/SQLite (thread de l'exécuteur)"""
+                        chunk_ids = self.memory.add_document_stream(chunk_documents(), doc_type="pdf_rag")
+                        if chunk_ids:
+                            logger.info(f"✂️ PDF découpé en {len(chunk_ids)} chunks intelligents")
+                        else:
+                            logger.warning(f"⚠️ Aucun texte extrait du PDF - Création d'un chunk de métadonnées")
+                            fallback = f"Document PDF: {filename} - {total_pages} pages (PDF scanné sans texte extractible)"
+                            chunk_ids = self.memory.add_documents(
+                                texts=[fallback],
+                                metadatas=[{
+                                    "filename": filename,
+                                    "chunk_index": 0,
+                                    "type": "pdf_chunk",
+                                    "chunk_size": len(fallback)
+                                }],
+                                doc_type="pdf_rag"
                             )
-                            if last_period != -1 and last_period > start + chunk_size // 2:
-                                end = last_period + 1
-                        
-                        chunk = all_text[start:end].strip()
-                        if chunk:
-                            chunks.append(chunk)
-                        
-                        start = end - chunk_overlap  # Chevauchement pour garder le contexte
+                            previews[:] = [fallback[:150] + "..."]
+                        results["ingestion"] = {
+                            **self.memory.last_ingestion_stats,
+                            "max_chars": chunker.max_chars,
+                            "max_tokens": chunker.max_tokens
+                        }
+                        # Le nombre total de chunks n'est connu qu'à la fin du flux
+                        self.memory.update_metadata(chunk_ids, {"total_chunks": len(chunk_ids)})
+                        return chunk_ids
                     
-                    logger.info(f"✂️ PDF découpé en {len(chunks)} chunks intelligents")
-                else:
-                    logger.warning(f"⚠️ Aucun texte extrait du PDF - Création d'un chunk de métadonnées")
-                    chunks = [f"Document PDF: {filename} - {len(pdf_reader.pages)} pages (PDF scanné sans texte extractible)"]
-                
-                # ÉTAPE 3: Ajouter chaque chunk à FAISS
-                for i, chunk in enumerate(chunks):
-                    doc_id = self.memory.add_document(
-                        text=chunk,
-                        metadata={
-                            "filename": filename,
-                            "chunk_index": i,
-                            "total_chunks": len(chunks),
-                            "type": "pdf_chunk",
-                            "chunk_size": len(chunk)
-                        },
-                        doc_type="pdf_rag"
-                    )
+                    chunk_ids = await self._run_blocking(index_chunks)
                     
-                    total_chunks += 1
+                    # Extraction terminée avec le découpage: mesures de l'étape 1
+                    parse_seconds = parsing["seconds"]
+                    parallel = PDF_WORKERS > 1 and extracted_pages >= PDF_PARALLEL_MIN_PAGES
+                    results["parsing"] = {
+                        "engine": "pymupdf",
+                        "workers": PDF_WORKERS if parallel else 1,
+                        "pages_extracted": extracted_pages,
+                        "truncated": extracted_pages < total_pages,
+                        "seconds": round(parse_seconds, 4),
+                        "pages_per_sec": round(extracted_pages / parse_seconds, 2) if parse_seconds > 0 else None
+                    }
+                    if extracted_pages < total_pages:
+                        logger.warning(f"⚠️ PDF tronqué à {extracted_pages} pages (sur {total_pages}, PDF_MAX_PAGES)")
+                    logger.info(f"📖 PDF: {extracted_pages} pages, {parsing['text_chars']} caractères ({parse_seconds:.2f}s)")
                     
-                    results["documents"].append({
-                        "id": doc_id,
-                        "type": "pdf_chunk",
-                        "chunk_index": i,
-                        "preview": chunk[:150] + "..."
-                    })
-                
-                # ÉTAPE 4: Extraire et analyser les images du PDF (SEULEMENT si ce n'est PAS un PDF scanné)
-                # Car si c'est scanné, on a déjà analysé les pages complètes ci-dessus
-                if not is_scanned_pdf:
-                    try:
-                        pdf_document = fitz.open(stream=file_content, filetype="pdf")
+                    for i, (doc_id, preview) in enumerate(zip(chunk_ids, previews)):
+                        total_chunks += 1
                         
-                        for page_num in range(min(len(pdf_document), 10)):  # Max 10 pages pour les images
-                            page = pdf_document[page_num]
-                            images = page.get_images()
+                        results["documents"].append({
+                            "id": doc_id,
+                            "type": "pdf_chunk",
+                            "chunk_index": i,
+                            "preview": preview
+                        })
+                    
+                    # ÉTAPE 4: Analyser les images du PDF repérées à l'étape 1 (SEULEMENT si ce n'est PAS un PDF scanné)
+                    # Car si c'est scanné, on a déjà analysé les pages complètes ci-dessus
+                    if not is_scanned_pdf:
+                        try:
+                            image_texts = []
+                            image_metadatas = []
                             
-                            for img_index, img in enumerate(images[:3]):  # Max 3 images par page
-                                try:
-                                    xref = img[0]
-                                    base_image = pdf_document.extract_image(xref)
-                                    image_bytes = base_image["image"]
-                                    
-                                    # Analyser l'image
-                                    if "vision" in self.agent.tools and self.agent.tools["vision"].is_ready:
-                                        analysis = await self.agent.process_image(
-                                            image_path=str(temp_img_path),
-                                            query="Décris cette image extraite d'un document PDF.",
-                                            detect_objects=False
-                                        )
-                                        
-                                        vision_desc = analysis.get("vision", "")
-                                    else:
-                                        # Mode basique
-                                        logger.info(f"📝 [Mode Basique] Image PDF {page_num + 1}.{img_index} - analyse désactivée")
-                                        vision_desc = f"Image extraite de la page {page_num + 1} du PDF (analyse IA temporairement désactivée)"
-                                    
-                                    # Nettoyer
-                                    if temp_img_path.exists():
-                                        temp_img_path.unlink()
-                                    
-                                    # Ajouter à FAISS seulement si on a une description
-                                    if vision_desc:
-                                        doc_id = self.memory.add_document(
-                                            text=f"Image page {page_num + 1}: {vision_desc}",
-                                            metadata={
-                                                "filename": filename,
-                                                "page": page_num + 1,
-                                                "image_index": img_index,
-                                                "type": "pdf_image"
-                                            },
-                                            doc_type="pdf_image"
-                                        )
-                                        
-                                        results["documents"].append({
-                                            "id": doc_id,
-                                            "type": "pdf_image",
-                                            "page": page_num + 1
-                                        })
-                                        
-                                except Exception as e:
-                                    logger.warning(f"⚠️ Erreur image PDF page {page_num}: {e}")
-                                    continue
-                        
-                        pdf_document.close()
-                    except Exception as e:
-                        logger.warning(f"⚠️ Extraction images PDF échouée: {e}")
+                            # Extraire les octets des images (décodés en mémoire par la vision)
+                            def extract_images() -> List[tuple]:
+                                extracted = []
+                                for page_num, img_index, xref in image_refs:
+                                    try:
+                                        extracted.append((page_num, img_index, pdf_engine.extract_image(xref)["image"]))
+                                    except Exception as e:
+                                        logger.warning(f"⚠️ Erreur image PDF page {page_num}: {e}")
+                                        degraded.append(f"image page {page_num + 1}: {e}")
+                                return extracted
+                            
+                            extracted = await self._run_blocking(extract_images)
+                            
+                            # Analyser les images par lots (un model.generate pour plusieurs images)
+                            if extracted and "vision" in self.agent.tools and self.agent.tools["vision"].is_ready:
+                                vision_descs, results["vision"] = await self._describe_images(
+                                    [image_bytes for _, _, image_bytes in extracted],
+                                    "Décris cette image extraite d'un document PDF."
+                                )
+                                if results["vision"]["errors"]:
+                                    degraded.append(f"images PDF: {results['vision']['errors']} analyses en échec")
+                            else:
+                                # Mode basique
+                                if extracted:
+                                    logger.info(f"📝 [Mode Basique] {len(extracted)} images PDF - analyse désactivée")
+                                    degraded.append("images PDF: modèle de vision indisponible")
+                                vision_descs = [
+                                    f"Image extraite de la page {page_num + 1} du PDF (analyse IA temporairement désactivée)"
+                                    for page_num, _, _ in extracted
+                                ]
+                            
+                            for (page_num, img_index, _), vision_desc in zip(extracted, vision_descs):
+                                # Ajouter à FAISS seulement si on a une description
+                                if vision_desc:
+                                    image_texts.append(f"Image page {page_num + 1}: {vision_desc}")
+                                    image_metadatas.append({
+                                        "filename": filename,
+                                        "page": page_num + 1,
+                                        "image_index": img_index,
+                                        "type": "pdf_image"
+                                    })
+                            
+                            # Indexer toutes les descriptions d'images en un seul lot
+                            def index_images() -> List[int]:
+                                image_ids = self.memory.add_documents(
+                                    texts=image_texts,
+                                    metadatas=image_metadatas,
+                                    doc_type="pdf_image"
+                                )
+                                results["ingestion"]["images"] = self.memory.last_ingestion_stats
+                                return image_ids
+                            
+                            image_ids = await self._run_blocking(index_images)
+                            for doc_id, metadata in zip(image_ids, image_metadatas):
+                                results["documents"].append({
+                                    "id": doc_id,
+                                    "type": "pdf_image",
+                                    "page": metadata["page"]
+                                })
+                        except ToolBusyError:
+                            raise
+                        except Exception as e:
+                            logger.warning(f"⚠️ Extraction images PDF échouée: {e}")
+                            degraded.append(f"images PDF: {e}")
+                finally:
+                    pdf_engine.close()
                 
-                results["total_pages"] = len(pdf_reader.pages)
+                results["total_pages"] = total_pages
                 results["total_chunks"] = total_chunks
-                results["description"] = f"PDF traité: {len(pdf_reader.pages)} pages, {total_chunks} chunks ajoutés à la base de connaissances"
+                results["description"] = f"PDF traité: {total_pages} pages, {total_chunks} chunks ajoutés à la base de connaissances"
                 results["synthesis"] = f"✅ Document '{filename}' ajouté à votre base de connaissances RAG avec {total_chunks} sections indexées. Vous pouvez maintenant poser des questions sur ce document !"
                 
                 logger.info(f"✅ PDF RAG traité: {total_chunks} chunks + images indexés")
@@ -740,9 +1123,24 @@ class ChatAgentManager:
             else:
                 raise HTTPException(400, f"Type de fichier non supporté: {file_type}")
             
-            # Sauvegarder la mémoire
-            self.memory.save_to_disk(str(self.storage_path))
+            # Enregistrer l'empreinte puis sauvegarder la mémoire (validés ensemble).
+            # Une analyse incomplète (mode basique, erreurs) n'est pas enregistrée:
+            # le prochain envoi du même fichier sera analysé à nouveau
+            if degraded:
+                results["degraded"] = degraded
+                logger.warning(f"⚠️ Analyse incomplète, non enregistrée pour la déduplication: {'; '.join(degraded)}")
+            
+            def commit_ingestion():
+                """Empreinte (SQLite) puis journal WAL et fsync"""
+                if not degraded:
+                    self.memory.register_ingestion(content_hash, filename, results)
+                self.memory.save_to_disk(str(self.storage_path))
             
+            await self._run_blocking(commit_ingestion)
+            
+        except (ToolBusyError, HTTPException):
+            # 429/503 (+ Retry-After) et erreurs HTTP déjà qualifiées
+            raise
         except Exception as e:
             logger.error(f"❌ Erreur traitement fichier: {e}")
             raise HTTPException(500, f"Erreur traitement: {str(e)}")
@@ -754,7 +1152,9 @@ class ChatAgentManager:
         message: str,
         conversation_id: str,
         use_memory: bool = True,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
     ) -> ChatResponse:
         """
         🔥 CHAT ULTRA-INTELLIGENT - UTILISE TOUS LES OUTILS DISPONIBLES
@@ -766,7 +1166,151 @@ class ChatAgentManager:
         4. SmolVLM + YOLO → Analyse visuelle si contexte pertinent
         5. Mistral-7B (LLM) → Synthèse intelligente avec tous les outils
         """
+        plan = self._plan_chat(message, conversation_id, use_memory, nprobe, ef_search)
+        tools_used = plan["tools_used"]
+        
+        # ========================================
+        # ÉTAPE 8: GÉNÉRATION AVEC MISTRAL-7B (OU RÉPONSE PAR DÉFAUT)
+        # ========================================
+        if "llm" in self.agent.tools and self.agent.tools["llm"].is_ready:
+            logger.info("🧠 [Mistral-7B] Génération de réponse avec tous les contextes...")
+            agent_result = self.agent.chat(
+                message=plan["full_message"],
+                with_voice=False,
+                context=plan["agent_context"]
+            )
+            
+            response_text = agent_result.get("response", "Aucune réponse générée")
+            tools_used.append("Mistral-7B (LLM)")
+        else:
+            response_text = self._basic_response(message, plan["intent"])
+            tools_used.append("Mode Basique (sans LLM)")
+        
+        return self._complete_chat(plan, message, conversation_id, response_text)
+    
+    def chat_stream(
+        self,
+        message: str,
+        conversation_id: str,
+        use_memory: bool = True,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> Iterator[str]:
+        """
+        Chat en streaming Server-Sent Events
         
+        Même pipeline que `chat`; la réponse est émise token par token.
+        Événements: `token` ({"text"}), puis `done` (ChatResponse complète +
+        `timing` avec ttft_ms distinct de total_ms), ou `error`.
+        """
+        start_time = time.perf_counter()
+        first_token_at = None
+        
+        try:
+            plan = self._plan_chat(message, conversation_id, use_memory, nprobe, ef_search)
+            tools_used = plan["tools_used"]
+            response_text = ""
+            llm_timing: Optional[Dict[str, Any]] = None
+            
+            if "llm" in self.agent.tools and self.agent.tools["llm"].is_ready:
+                logger.info("🧠 [Mistral-7B] Génération en streaming avec tous les contextes...")
+                for event in self.agent.chat_stream(
+                    message=plan["full_message"],
+                    with_voice=False,
+                    context=plan["agent_context"]
+                ):
+                    if event["type"] == "token":
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        yield sse_event("token", {"text": event["text"]})
+                    elif event["type"] == "error":
+                        yield sse_event("error", {"error": event["error"]})
+                        return
+                    else:
+                        response_text = event["result"].get("response") or "Aucune réponse générée"
+                        llm_timing = event["result"].get("timing")
+                tools_used.append("Mistral-7B (LLM)")
+            else:
+                response_text = self._basic_response(message, plan["intent"])
+                tools_used.append("Mode Basique (sans LLM)")
+                first_token_at = time.perf_counter()
+                yield sse_event("token", {"text": response_text})
+            
+            response = self._complete_chat(plan, message, conversation_id, response_text)
+            # Latences vues par le client: premier token vs réponse complète (étapes FAISS/Tavily incluses)
+            timing = {
+                "ttft_ms": round((first_token_at - start_time) * 1000, 1) if first_token_at else None,
+                "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                "llm": llm_timing,  # Génération seule (ttft_ms, total_ms, tokens/s)
+                "stages": plan["stage_timings"]  # Contexte: FAISS ∥ Tavily
+            }
+            logger.info(f"⏱️ Streaming: premier token {timing['ttft_ms']} ms, total {timing['total_ms']} ms")
+            yield sse_event("done", {**response.dict(), "timing": timing})
+            
+        except ToolBusyError as e:
+            # En-têtes déjà envoyés: la saturation est signalée dans le flux
+            logger.warning(f"⏳ Chat streaming refusé: {e}")
+            yield sse_event("error", {"error": str(e), "status": e.status_code, "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"❌ Erreur chat streaming: {e}")
+            yield sse_event("error", {"error": str(e)})
+    
+    async def achat(
+        self,
+        message: str,
+        conversation_id: str,
+        use_memory: bool = True,
+        temperature: float = 0.7,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> ChatResponse:
+        """Version asynchrone de `chat`: boucle asyncio libre, génération annulée avec la tâche"""
+        return await run_cancellable(
+            self.agent.request_pool, self.chat,
+            message, conversation_id, use_memory, temperature, nprobe, ef_search,
+            gate=self.agent.request_gate
+        )
+    
+    async def achat_stream(
+        self,
+        message: str,
+        conversation_id: str,
+        use_memory: bool = True,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Version asynchrone de `chat_stream`: la génération s'arrête si le client se déconnecte"""
+        try:
+            async for event in stream_cancellable(
+                self.agent.request_pool, self.chat_stream,
+                message, conversation_id, use_memory, nprobe, ef_search,
+                gate=self.agent.request_gate
+            ):
+                yield event
+        except ToolBusyError as e:
+            # Refus de la porte d'admission après l'ouverture du flux: signalé dans le flux
+            logger.warning(f"⏳ Chat streaming refusé: {e}")
+            yield sse_event("error", {"error": str(e), "status": e.status_code, "retry_after": e.retry_after})
+    
+    def _basic_response(self, message: str, intent: str) -> str:
+        """Réponse par défaut quand les modèles sont désactivés"""
+        logger.info("📝 [Mode Basique] Génération de réponse simple (modèles désactivés)")
+        if intent == "explain_app":
+            return "L'application CENTER est une plateforme de gestion d'employés avec chat IA, reconnaissance faciale et tableau de bord. Elle permet de gérer les profils employés, faire du pointage automatique et communiquer avec un assistant IA intelligent."
+        elif intent == "search":
+            return "Fonction de recherche disponible. Les modèles IA sont temporairement désactivés pour permettre les tests de connectivité."
+        else:
+            return f"Bonjour ! Je suis Kibali, votre assistant IA. Les modèles avancés sont temporairement désactivés pour les tests, mais je peux vous aider avec des réponses de base. Votre message : '{message}'"
+    
+    def _plan_chat(
+        self,
+        message: str,
+        conversation_id: str,
+        use_memory: bool,
+        nprobe: Optional[int],
+        ef_search: Optional[int]
+    ) -> Dict[str, Any]:
+        """Étapes 1 à 7 du chat: contexte (FAISS, historique, Tavily) et prompt enrichi"""
         # ========================================
         # ÉTAPE 1: DÉTECTION D'INTENTION
         # ========================================
@@ -777,21 +1321,40 @@ class ChatAgentManager:
         
         tools_used = []  # Tracer les outils utilisés
         
+        message_lower = message.lower()
+        
+        # Triggers de recherche web élargis
+        needs_web_search = (
+            intent == "search" or
+            any(keyword in message_lower for keyword in [
+                "actualité", "news", "aujourd'hui", "récent", "maintenant",
+                "qui est", "c'est quoi", "qu'est-ce", "définition",
+                "recherche", "trouve", "cherche", "google",
+                "dernière", "dernier", "nouveau", "nouvelle",
+                "site web", "internet", "en ligne",
+                # Ajouter des triggers pour logos/marques
+                "logo", "marque", "entreprise", "société", "produit"
+            ])
+        )
+        
         # ========================================
-        # ÉTAPE 2: RECHERCHE DANS LA MÉMOIRE FAISS
+        # ÉTAPES 2 ET 6 EN PARALLÈLE: MÉMOIRE FAISS ∥ RECHERCHE WEB TAVILY
         # ========================================
-        relevant_docs = []
+        pipeline = PipelineDAG(self.agent.pipeline_pool, name="chat_context")
         if use_memory:
-            logger.info("💾 [FAISS] Recherche dans la mémoire vectorielle...")
-            relevant_docs = self.memory.search(message, k=5)  # Augmenté à 5 pour plus de contexte
-            if relevant_docs:
-                tools_used.append(f"FAISS ({len(relevant_docs)} docs)")
-                logger.info(f"   ✓ {len(relevant_docs)} documents pertinents trouvés")
+            pipeline.add("memory_search", lambda results: self._search_memory(message, nprobe, ef_search))
+        if needs_web_search and TAVILY_AVAILABLE and tavily_client:
+            pipeline.add("web_search", lambda results: self._search_web(message))
+        stages = pipeline.run()
+        stage_timings = pipeline.get_timings()
+        
+        relevant_docs = stages.get("memory_search") or []
+        if relevant_docs:
+            tools_used.append(f"FAISS ({len(relevant_docs)} docs)")
         
         # ========================================
         # ÉTAPE 3: ANALYSE DU BESOIN D'OUTILS VISUELS
         # ========================================
-        message_lower = message.lower()
         needs_visual_search = any(keyword in message_lower for keyword in [
             "image", "photo", "voir", "montre", "visuel", "capture",
             "précédent", "dernier", "avant", "historique visuel"
@@ -840,53 +1403,20 @@ class ChatAgentManager:
                 history_text += f"{msg.role}: {msg.content}\n"
         
         # ========================================
-        # ÉTAPE 6: RECHERCHE WEB TAVILY (Si nécessaire)
+        # ÉTAPE 6: RÉSULTATS DE LA RECHERCHE WEB (lancée avec la mémoire)
         # ========================================
-        web_search_context = ""
-        
-        # Triggers de recherche web élargis
-        needs_web_search = (
-            intent == "search" or
-            any(keyword in message_lower for keyword in [
-                "actualité", "news", "aujourd'hui", "récent", "maintenant",
-                "qui est", "c'est quoi", "qu'est-ce", "définition",
-                "recherche", "trouve", "cherche", "google",
-                "dernière", "dernier", "nouveau", "nouvelle",
-                "site web", "internet", "en ligne",
-                # Ajouter des triggers pour logos/marques
-                "logo", "marque", "entreprise", "société", "produit"
-            ])
-        )
-        
-        if needs_web_search and TAVILY_AVAILABLE and tavily_client:
-            try:
-                logger.info(f"🌐 [Tavily] Recherche internet: '{message[:60]}...'")
-                search_results = tavily_client.search(
-                    query=message, 
-                    max_results=3,
-                    search_depth="basic"
-                )
-                
-                if search_results.get("results"):
-                    web_search_context = "\n🌐 RECHERCHE INTERNET (Tavily):\n"
-                    for i, result in enumerate(search_results.get("results", [])[:3], 1):
-                        title = result.get('title', 'N/A')
-                        content = result.get('content', '')[:200]
-                        url = result.get('url', '')
-                        web_search_context += f"{i}. {title}\n   {content}...\n   Source: {url}\n\n"
-                    
-                    tools_used.append(f"Tavily ({len(search_results.get('results', []))} résultats)")
-                    logger.info(f"   ✓ {len(search_results.get('results', []))} résultats trouvés")
-            except Exception as e:
-                logger.warning(f"⚠️ Recherche Tavily échouée: {e}")
+        web_search_context, web_results_count = stages.get("web_search") or ("", 0)
+        if web_results_count:
+            tools_used.append(f"Tavily ({web_results_count} résultats)")
         
         # ========================================
         # ÉTAPE 7: CONSTRUIRE PROMPT ENRICHI AVEC TOUS LES OUTILS
         # ========================================
+        # Le prompt système (préfixe stable) est transmis à part: l'agent le
+        # place en tête du prompt pour réutiliser son KV-cache précalculé
         if intent == "explain_app":
-            full_message = f"""{EXPLAIN_APP_PROMPT}
-
-{context}
+            prefix_name = "explain_app"
+            full_message = f"""{context}
 {web_search_context}
 
 Question: {message}
@@ -896,9 +1426,8 @@ Réponds en 3-4 phrases claires et pratiques."""
             temp = 0.3
             
         elif intent == "search" or web_search_context:
-            full_message = f"""{SEARCH_PROMPT}
-
-{web_search_context}
+            prefix_name = "search"
+            full_message = f"""{web_search_context}
 {context}
 
 Question: {message}
@@ -908,13 +1437,8 @@ Résume les informations trouvées en 3-5 phrases."""
             temp = 0.3
             
         elif intent in ["problem_solving", "summarization"]:
-            prompt_map = {
-                "problem_solving": PROBLEM_SOLVING_PROMPT,
-                "summarization": SUMMARIZATION_PROMPT
-            }
-            full_message = f"""{prompt_map[intent]}
-
-{context}
+            prefix_name = intent
+            full_message = f"""{context}
 {web_search_context}
 
 {message}"""
@@ -923,9 +1447,8 @@ Résume les informations trouvées en 3-5 phrases."""
             
         else:
             # Conversation normale avec TOUS les contextes disponibles
-            full_message = f"""{SYSTEM_PROMPT}
-
-{history_text}
+            prefix_name = "general"
+            full_message = f"""{history_text}
 {context}
 {web_search_context}
 
@@ -935,35 +1458,78 @@ Réponds de manière naturelle et concise."""
             max_tokens = 150
             temp = 0.7
         
-        # ========================================
-        # ÉTAPE 8: GÉNÉRATION AVEC MISTRAL-7B (OU RÉPONSE PAR DÉFAUT)
-        # ========================================
-        if "llm" in self.tools and self.tools["llm"].is_ready:
-            logger.info("🧠 [Mistral-7B] Génération de réponse avec tous les contextes...")
-            agent_result = self.agent.chat(
-                message=full_message,
-                with_voice=False,
-                context={
-                    "intent": intent,
-                    "max_tokens": max_tokens,
-                    "temperature": temp,
-                    "tools_used": tools_used
-                }
+        return {
+            "intent": intent,
+            "full_message": full_message,
+            "agent_context": {
+                "intent": intent,
+                "system_prompt": CHAT_PROMPT_PREFIXES[prefix_name],
+                "max_tokens": max_tokens,
+                "temperature": temp,
+                "tools_used": tools_used
+            },
+            "tools_used": tools_used,
+            "relevant_docs": relevant_docs,
+            "pdf_chunks_count": pdf_chunks_count,
+            "pdf_files": pdf_files,
+            "stage_timings": stage_timings
+        }
+    
+    def _search_memory(
+        self,
+        message: str,
+        nprobe: Optional[int],
+        ef_search: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """Étape 2 du chat: documents pertinents dans la mémoire FAISS"""
+        logger.info("💾 [FAISS] Recherche dans la mémoire vectorielle...")
+        relevant_docs = self.memory.search(
+            message,
+            k=5,  # Augmenté à 5 pour plus de contexte
+            nprobe=nprobe,
+            ef_search=ef_search
+        )
+        if relevant_docs:
+            logger.info(f"   ✓ {len(relevant_docs)} documents pertinents trouvés")
+        return relevant_docs
+    
+    def _search_web(self, message: str) -> Tuple[str, int]:
+        """Étape 6 du chat: recherche Tavily mise en forme pour le prompt (contexte, nombre de résultats)"""
+        try:
+            logger.info(f"🌐 [Tavily] Recherche internet: '{message[:60]}...'")
+            search_results = tavily_client.search(
+                query=message, 
+                max_results=3,
+                search_depth="basic"
             )
             
-            response_text = agent_result.get("response", "Aucune réponse générée")
-            tools_used.append("Mistral-7B (LLM)")
-        else:
-            # Réponse par défaut quand les modèles sont désactivés
-            logger.info("📝 [Mode Basique] Génération de réponse simple (modèles désactivés)")
-            if intent == "explain_app":
-                response_text = "L'application CENTER est une plateforme de gestion d'employés avec chat IA, reconnaissance faciale et tableau de bord. Elle permet de gérer les profils employés, faire du pointage automatique et communiquer avec un assistant IA intelligent."
-            elif intent == "search":
-                response_text = "Fonction de recherche disponible. Les modèles IA sont temporairement désactivés pour permettre les tests de connectivité."
-            else:
-                response_text = f"Bonjour ! Je suis Kibali, votre assistant IA. Les modèles avancés sont temporairement désactivés pour les tests, mais je peux vous aider avec des réponses de base. Votre message : '{message}'"
+            if not search_results.get("results"):
+                return "", 0
+            web_search_context = "\n🌐 RECHERCHE INTERNET (Tavily):\n"
+            for i, result in enumerate(search_results.get("results", [])[:3], 1):
+                title = result.get('title', 'N/A')
+                content = result.get('content', '')[:200]
+                url = result.get('url', '')
+                web_search_context += f"{i}. {title}\n   {content}...\n   Source: {url}\n\n"
             
-            tools_used.append("Mode Basique (sans LLM)")
+            logger.info(f"   ✓ {len(search_results.get('results', []))} résultats trouvés")
+            return web_search_context, len(search_results.get("results", []))
+        except Exception as e:
+            logger.warning(f"⚠️ Recherche Tavily échouée: {e}")
+            return "", 0
+    
+    def _complete_chat(
+        self,
+        plan: Dict[str, Any],
+        message: str,
+        conversation_id: str,
+        response_text: str
+    ) -> ChatResponse:
+        """Étape 9 du chat: statistiques RAG, mémorisation et réponse finale"""
+        tools_used = plan["tools_used"]
+        relevant_docs = plan["relevant_docs"]
+        pdf_chunks_count = plan["pdf_chunks_count"]
+        pdf_files = plan["pdf_files"]
         
         # Ajouter les statistiques PDF si présentes
         if pdf_chunks_count > 0:
@@ -988,6 +1554,7 @@ Réponds de manière naturelle et concise."""
         # Résumé des outils utilisés
         tools_summary = " + ".join(tools_used)
         logger.info(f"✅ Réponse générée - Outils: {tools_summary}")
+        logger.info(f"⏱️ Contexte (FAISS ∥ Tavily): {plan['stage_timings']['total_ms']} ms")
         
         # Ajouter un footer avec les statistiques si des PDFs ont été utilisés
         if pdf_chunks_count > 0:
@@ -1012,12 +1579,41 @@ Réponds de manière naturelle et concise."""
 # INSTANCE GLOBALE
 # ==========================================
 
-chat_manager = ChatAgentManager()
+# Les workers du pool PDF (spawn) ré-importent le module principal sous le nom
+# __mp_main__: ne pas y recharger l'agent ni la mémoire
+chat_manager = ChatAgentManager() if __name__ != "__mp_main__" else None
 
 # ==========================================
 # ROUTES API
 # ==========================================
 
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable, poll_interval: float = 0.5) -> Any:
+    """
+    Attendre `awaitable` en surveillant la connexion du client
+    
+    Si le client se déconnecte avant la fin, la tâche est annulée et on
+    attend qu'elle se termine. Pour les appels `run_cancellable` (chat),
+    le jeton d'annulation arrête la génération en cours et libère le
+    modèle; un upload, lui, protège son ingestion et la mène à terme avant
+    de libérer ses ressources. Aucune erreur n'est levée (personne pour la
+    recevoir): la déconnexion est journalisée et une réponse vide 499 clôt
+    la requête côté serveur.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.wait({task})  # Jeton levé, ou ingestion d'upload terminée
+                logger.info(f"🔌 Client déconnecté: {request.url.path} annulé")
+                return Response(status_code=499)
+    finally:
+        if not task.done():
+            task.cancel()  # Requête elle-même annulée (arrêt du serveur)
+
 @app.get("/")
 async def root():
     """Page d'accueil de l'API"""
@@ -1028,6 +1624,7 @@ async def root():
         "endpoints": {
             "upload": "/upload",
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "history": "/conversation/{conv_id}",
             "search": "/search",
             "stats": "/stats"
@@ -1036,6 +1633,7 @@ async def root():
 
 @app.post("/upload")
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...),
     description: Optional[str] = Form(None)
 ):
@@ -1043,35 +1641,61 @@ async def upload_file(
     Upload un fichier (image ou PDF) pour analyse
     
     Le fichier est analysé et ajouté à la mémoire vectorielle FAISS.
+    Les modèles tournent hors de la boucle asyncio; l'analyse est annulée
+    si le client se déconnecte.
     """
-    return JSONResponse(content={
-        "filename": file.filename,
-        "type": file.content_type,
-        "description": "Upload temporairement désactivé - modèles IA non chargés",
-        "synthesis": "Fonctionnalité disponible une fois les modèles réactivés",
-        "documents": []
-    })
+    return await cancel_on_disconnect(request, chat_manager.process_upload(file, description))
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Envoyer un message de chat
     
     L'agent utilise FAISS pour rechercher le contexte pertinent
-    et génère une réponse intelligente.
+    et génère une réponse intelligente (réponse basique si le LLM est
+    désactivé). La génération est annulée si le client se déconnecte.
     """
     # Générer un ID de conversation si non fourni
     conv_id = request.conversation_id or f"conv_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    # Réponse par défaut
-    response_text = f"Bonjour ! Je suis Kibali, votre assistant IA. Les modèles avancés sont temporairement désactivés pour les tests, mais je peux confirmer que votre message a été reçu : '{request.message}'"
-    
-    return ChatResponse(
-        response=response_text,
+    # File LLM pleine (429) ou attente trop longue (503): LLMBusyError levée par le pool
+    return await cancel_on_disconnect(http_request, chat_manager.achat(
+        message=request.message,
         conversation_id=conv_id,
-        sources=None,
-        reasoning="Mode Basique (sans LLM)",
-        timestamp=datetime.now().isoformat()
+        use_memory=request.use_memory,
+        temperature=request.temperature,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search
+    ))
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Envoyer un message de chat et recevoir la réponse en streaming (Server-Sent Events)
+    
+    Événements: `token` au fil de la génération, puis `done` avec la réponse
+    complète (sources, raisonnement) et les latences (premier token / total).
+    """
+    conv_id = request.conversation_id or f"conv_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    # Backpressure avant d'ouvrir le flux (ensuite le statut HTTP ne peut plus changer).
+    # Un refus du pool LLM (file pleine, délai dépassé) arrive ensuite en événement `error`
+    request_gate = chat_manager.agent.request_gate
+    if request_gate.is_full():
+        raise ToolBusyError("Trop de requêtes en cours", 429, request_gate.retry_after())
+    
+    # Générateur asynchrone: la génération tourne dans l'exécuteur de l'agent et
+    # s'arrête quand Starlette annule le flux (déconnexion du client)
+    return StreamingResponse(
+        chat_manager.achat_stream(
+            message=request.message,
+            conversation_id=conv_id,
+            use_memory=request.use_memory,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @app.get("/conversation/{conv_id}")
@@ -1109,6 +1733,11 @@ async def get_stats():
             "images": 0,
             "other_documents": 0
         },
+        "memory_persistence": chat_manager.memory.get_persistence_status(str(chat_manager.storage_path)),
+        "vision_batching": chat_manager.get_vision_metrics(),
+        "llm_pool": chat_manager.get_llm_metrics(),
+        "llm_prefix_cache": chat_manager.get_prefix_metrics(),
+        "request_admission": chat_manager.agent.request_gate.get_metrics(),
         "note": "Statistiques temporairement désactivées - modèles IA non chargés"
     }
 
@@ -0,0 +1,1261 @@
+"""
+🧠 MÉMOIRE VECTORIELLE FAISS (PERSISTANCE)
+==========================================
+
+Mémoire du chat agent, indépendante de l'API FastAPI:
+- Fabrique d'index FAISS (flat, HNSW, IVF-Flat, IVF-PQ) et migration
+- Stockage SQLite des textes et métadonnées, indexé par l'ID FAISS
+- Persistance incrémentale: snapshot FAISS + journal append-only (WAL)
+
+Le modèle d'embeddings est chargé par son nom (SentenceTransformer) ou
+fourni déjà construit (tout objet exposant `encode`).
+
+Auteur: BelikanM
+Date: 13 Novembre 2025
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Union, TYPE_CHECKING
+
+import faiss
+import numpy as np
+
+from text_chunker import TextChunker, make_token_counter
+
+if TYPE_CHECKING:
+    from chat_agent_api import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Paramètres d'ingestion FAISS
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # Chunks encodés par passe
+
+# Découpage RAG: budgets par chunk (le budget en tokens suit la limite de l'encodeur, MiniLM: 256)
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1000"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", "200"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))  # 0 = limite de l'encodeur
+
+# Backend d'index FAISS: flat (exact), hnsw, ivf_flat, ivf_pq
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "256"))  # Nombre de listes IVF
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))  # Sous-quantificateurs PQ (doit diviser 384)
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))  # Voisins par nœud HNSW
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # Listes IVF visitées par requête
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))  # Largeur de recherche HNSW
+# Réentraîner le quantificateur IVF quand le corpus a été multiplié par ce facteur
+# depuis le dernier entraînement (0 = jamais: centroïdes figés sur le premier corpus)
+FAISS_RETRAIN_FACTOR = float(os.getenv("FAISS_RETRAIN_FACTOR", "4"))
+
+# Persistance incrémentale: journal (WAL) compacté en snapshot au-delà de ce seuil
+FAISS_WAL_COMPACT_MB = float(os.getenv("FAISS_WAL_COMPACT_MB", "64"))
+
+# Ouvrir le snapshot FAISS en mmap lecture seule (page cache partagé entre workers uvicorn)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() in ("1", "true", "yes")
+
+# Plusieurs processus sur un même stockage: un seul écrit (verrou memory.lock). Sans
+# cette option, un second processus refuse de démarrer au lieu de servir en lecture seule
+FAISS_READ_ONLY_WORKERS = os.getenv("FAISS_READ_ONLY_WORKERS", "false").lower() in ("1", "true", "yes")
+FAISS_READER_REFRESH_S = float(os.getenv("FAISS_READER_REFRESH_S", "2"))  # Suivi du journal par les lecteurs
+
+# ==========================================
+# FABRIQUE D'INDEX FAISS
+# ==========================================
+
+FAISS_INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+def create_faiss_index(
+    index_type: str,
+    dimension: int,
+    nlist: int = FAISS_NLIST,
+    pq_m: int = FAISS_PQ_M,
+    hnsw_m: int = FAISS_HNSW_M
+):
+    """Créer un index FAISS vide selon le backend demandé"""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        return faiss.index_factory(dimension, f"HNSW{hnsw_m},Flat")
+    if index_type == "ivf_flat":
+        return faiss.index_factory(dimension, f"IVF{nlist},Flat")
+    if index_type == "ivf_pq":
+        return faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}")
+    raise ValueError(f"Type d'index FAISS inconnu: {index_type} (attendu: {', '.join(FAISS_INDEX_TYPES)})")
+
+def get_faiss_index_type(index) -> str:
+    """Identifier le backend d'un index FAISS existant"""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def faiss_min_training_size(index_type: str, nlist: int = FAISS_NLIST) -> int:
+    """Nombre de vecteurs nécessaires avant d'entraîner un index IVF"""
+    if index_type == "ivf_flat":
+        return 39 * nlist  # Minimum recommandé par k-means FAISS
+    if index_type == "ivf_pq":
+        return max(39 * nlist, 256)  # 256 centroïdes par sous-quantificateur PQ (8 bits)
+    return 0
+
+def read_faiss_index(index_path: str, mmap: bool = False):
+    """
+    Lire un index FAISS, en mmap lecture seule si demandé
+    
+    Retourne (index, mmapped). Le mmap s'applique aux listes inversées des
+    index IVF, et aux codes des index plats/HNSW si FAISS fournit
+    IO_FLAG_MMAP_IFC (FAISS >= 1.10). Sinon l'index est lu en RAM.
+    """
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            flags |= faiss.IO_FLAG_MMAP_IFC
+        try:
+            index = faiss.read_index(index_path, flags)
+            index_type = get_faiss_index_type(index)
+            mmapped = index_type in ("ivf_flat", "ivf_pq") or hasattr(faiss, "IO_FLAG_MMAP_IFC")
+            return index, mmapped
+        except Exception as e:
+            logger.warning(f"⚠️ Lecture mmap impossible ({e}), chargement en RAM")
+    return faiss.read_index(index_path), False
+
+def fsync_directory(path: str):
+    """Rendre durables les créations/renommages de fichiers d'un dossier (sans effet sous Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def lock_storage(lock_path: str):
+    """
+    Verrou exclusif non bloquant sur un dossier de stockage (un seul processus écrivain)
+    
+    Retourne le fichier verrouillé (à garder ouvert), ou None si un autre
+    processus détient déjà le verrou. Libéré à la fermeture du fichier ou à
+    la fin du processus.
+    """
+    handle = open(lock_path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+# ==========================================
+# STOCKAGE DES DOCUMENTS (SQLITE)
+# ==========================================
+
+class DocumentStore:
+    """
+    Stockage SQLite des textes et métadonnées, indexé par l'ID FAISS
+    
+    Les documents ne sont plus gardés en RAM: la recherche ne lit que les
+    k résultats, et l'ouverture ne parse rien (contrairement à documents.json).
+    Les insertions restent dans une transaction ouverte jusqu'à `commit()`.
+    """
+    
+    def __init__(self, db_path: str = ":memory:"):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        if db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                type TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(type)")
+        # Registre d'ingestion adressé par contenu (SHA-256 du fichier)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS ingestions (
+                sha256 TEXT PRIMARY KEY,
+                filename TEXT,
+                doc_ids TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )"""
+        )
+        # Réglages persistés avec les documents (ex: taille du corpus d'entraînement IVF)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+    
+    @staticmethod
+    def _row_to_doc(row) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "type": row[1],
+            "text": row[2],
+            "metadata": json.loads(row[3]),
+            "timestamp": row[4]
+        }
+    
+    def add_many(self, docs: List[Dict[str, Any]]):
+        """Insérer des documents (non validés avant `commit()`)"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (id, type, text, metadata, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (doc["id"], doc["type"], doc["text"],
+                     json.dumps(doc.get("metadata", {}), ensure_ascii=False), doc["timestamp"])
+                    for doc in docs
+                ]
+            )
+    
+    def update_metadata(self, doc_ids: List[int], updates: Dict[str, Any]):
+        """Fusionner `updates` dans les métadonnées des documents (non validé avant `commit()`)"""
+        with self._lock:
+            for doc_id, doc in self.get_many(doc_ids).items():
+                metadata = {**doc["metadata"], **updates}
+                self._conn.execute(
+                    "UPDATE documents SET metadata = ? WHERE id = ?",
+                    (json.dumps(metadata, ensure_ascii=False), doc_id)
+                )
+    
+    def commit(self):
+        """Valider les insertions en attente"""
+        with self._lock:
+            self._conn.commit()
+    
+    def get_many(self, doc_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Lire uniquement les documents demandés"""
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, type, text, metadata, timestamp FROM documents WHERE id IN ({placeholders})",
+                [int(doc_id) for doc_id in doc_ids]
+            ).fetchall()
+        return {row[0]: self._row_to_doc(row) for row in rows}
+    
+    def get(self, doc_id: int) -> Optional[Dict[str, Any]]:
+        """Lire un document par son ID"""
+        return self.get_many([doc_id]).get(doc_id)
+    
+    def last(self, k: int) -> List[Dict[str, Any]]:
+        """Les k derniers documents ajoutés (ordre chronologique)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, type, text, metadata, timestamp FROM documents ORDER BY id DESC LIMIT ?",
+                (k,)
+            ).fetchall()
+        return [self._row_to_doc(row) for row in reversed(rows)]
+    
+    def get_ingestion(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Retrouver une ingestion précédente par empreinte du contenu"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, filename, doc_ids, result, created_at FROM ingestions WHERE sha256 = ?",
+                (sha256,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "sha256": row[0],
+            "filename": row[1],
+            "doc_ids": json.loads(row[2]),
+            "result": json.loads(row[3]),
+            "created_at": row[4]
+        }
+    
+    def put_ingestion(self, sha256: str, filename: Optional[str], doc_ids: List[int], result: Dict[str, Any]):
+        """Enregistrer une ingestion (non validée avant `commit()`)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingestions (sha256, filename, doc_ids, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (sha256, filename, json.dumps(doc_ids),
+                 json.dumps(result, ensure_ascii=False, default=str), datetime.now().isoformat())
+            )
+    
+    def get_setting(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set_setting(self, key: str, value: str):
+        """Enregistrer un réglage (non validé avant `commit()`)"""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+    
+    def next_id(self) -> int:
+        """Prochain ID libre"""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM documents").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+# ==========================================
+# GESTIONNAIRE DE MÉMOIRE VECTORIELLE FAISS
+# ==========================================
+
+class FAISSMemoryManager:
+    """Gestionnaire de mémoire avec FAISS pour recherche vectorielle"""
+    
+    def __init__(
+        self,
+        embedding_model: Union[str, Any, None] = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        index_type: str = FAISS_INDEX_TYPE,
+        dimension: int = 384,
+        nlist: int = FAISS_NLIST,
+        retrain_factor: float = FAISS_RETRAIN_FACTOR
+    ):
+        if isinstance(embedding_model, str):
+            try:
+                # Essayer de charger le modèle depuis le cache local
+                from sentence_transformers import SentenceTransformer
+                self.embedding_model = SentenceTransformer(embedding_model, local_files_only=True)
+            except Exception as e:
+                logger.warning(f"⚠️ Impossible de charger le modèle d'embeddings: {e}")
+                logger.info("ℹ️ Fonctionnement sans recherche vectorielle FAISS")
+                self.embedding_model = None
+        else:
+            self.embedding_model = embedding_model  # Encodeur déjà construit (ou None: mode simple)
+        
+        self.dimension = dimension  # Dimension des embeddings (MiniLM: 384)
+        self.batch_size = max(1, batch_size)
+        
+        # Index FAISS: flat et HNSW sont créés directement; les index IVF démarrent
+        # en IndexFlatL2 (exact) et migrent dès qu'il y a assez de vecteurs pour
+        # les entraîner, puis sont réentraînés quand le corpus a assez grandi
+        if index_type not in FAISS_INDEX_TYPES:
+            raise ValueError(f"Type d'index FAISS inconnu: {index_type} (attendu: {', '.join(FAISS_INDEX_TYPES)})")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.retrain_factor = retrain_factor
+        self.index_trained_on = 0  # Vecteurs du dernier entraînement IVF (persisté dans SQLite)
+        self.index = None
+        if self.embedding_model:
+            initial_type = index_type if faiss_min_training_size(index_type, nlist) == 0 else "flat"
+            self.index = create_faiss_index(initial_type, self.dimension, nlist=nlist)
+        self.index_mmapped = False  # Snapshot partagé en lecture seule (voir FAISS_MMAP)
+        
+        # Stockage des métadonnées (SQLite en mémoire jusqu'à load_from_disk)
+        self.store = DocumentStore()
+        self._next_id = 0  # Compteur local: sûr car un seul processus écrit (verrou de stockage)
+        
+        # Écrivain unique: les autres processus ouvrent le stockage en lecture seule
+        self._storage_lock = None
+        self.read_only = False
+        self.storage_path: Optional[str] = None
+        
+        # Lecteur: vecteurs ajoutés par l'écrivain depuis le snapshot, rejoués en RAM
+        # dans un index séparé (le snapshot, éventuellement en mmap, n'est jamais copié)
+        self.delta_index = None
+        self._wal_offsets: Dict[tuple, int] = {}  # (inode, premier ID) -> octets déjà lus
+        self._snapshot_identity: Optional[tuple] = None
+        self._last_refresh = 0.0
+        
+        # Journal d'écriture (WAL): vecteurs ajoutés depuis la dernière sauvegarde
+        self._wal_pending: List[tuple] = []
+        self._lock = threading.RLock()
+        # Reconstruction d'index en cours (hors verrou): lots ajoutés entre-temps, repris à l'échange
+        self._rebuild_backlog: Optional[List[np.ndarray]] = None
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._compaction_error: Optional[BaseException] = None
+        self.last_compaction: Dict[str, Any] = {}  # Statut de la dernière compaction (voir get_persistence_status)
+        
+        # Statistiques de la dernière ingestion (chunks/s), par thread: un upload
+        # lit les siennes dans le thread qui a ingéré, même si d'autres ingèrent en parallèle
+        self._ingestion_stats = threading.local()
+        
+        # Conversations
+        self.conversations: Dict[str, List["ChatMessage"]] = {}
+        
+        if self.embedding_model:
+            logger.info(f"✅ FAISS Memory Manager initialisé (dim={self.dimension}, batch={self.batch_size}, index={self.index_type})")
+        else:
+            logger.info("✅ Memory Manager initialisé (mode simple sans FAISS)")
+    
+    @property
+    def last_ingestion_stats(self) -> Dict[str, Any]:
+        """Statistiques de la dernière ingestion lancée depuis ce thread"""
+        return getattr(self._ingestion_stats, "stats", {})
+    
+    def add_document(
+        self,
+        text: str,
+        metadata: Dict[str, Any],
+        doc_type: str = "text"
+    ) -> int:
+        """Ajouter un document à la mémoire vectorielle"""
+        return self.add_documents([text], [metadata], doc_type=doc_type)[0]
+    
+    def add_documents(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        doc_type: str = "text"
+    ) -> List[int]:
+        """
+        Ajouter plusieurs documents en lot à la mémoire vectorielle
+        
+        Returns:
+            Liste des IDs attribués, dans l'ordre des textes
+        """
+        if len(texts) != len(metadatas):
+            raise ValueError("texts et metadatas doivent avoir la même longueur")
+        return self.add_document_stream(zip(texts, metadatas), doc_type=doc_type)
+    
+    def add_document_stream(
+        self,
+        documents: Iterable[Tuple[str, Dict[str, Any]]],
+        doc_type: str = "text"
+    ) -> List[int]:
+        """
+        Ajouter un flux de documents (texte, métadonnées) à la mémoire vectorielle
+        
+        Le flux est consommé par lots de `batch_size`: chaque lot est encodé
+        en un passage et ajouté à FAISS en un seul appel à `index.add`, sans
+        jamais matérialiser l'ensemble des documents.
+        
+        Returns:
+            Liste des IDs attribués, dans l'ordre du flux
+        """
+        if self.read_only:
+            raise RuntimeError("Mémoire ouverte en lecture seule: un autre processus écrit dans ce stockage")
+        
+        start_time = time.perf_counter()
+        doc_ids: List[int] = []
+        batches = 0
+        documents = iter(documents)
+        self._ingestion_stats.stats = {}  # Jamais les statistiques d'un appel précédent
+        
+        while True:
+            batch = list(islice(documents, self.batch_size))
+            if not batch:
+                break
+            batches += 1
+            batch_texts = [text for text, _ in batch]
+            
+            embeddings = None
+            if self.embedding_model:
+                # Mode FAISS : un seul passage de l'encodeur et un seul index.add par lot
+                embeddings = self.embedding_model.encode(
+                    batch_texts,
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True
+                ).astype(np.float32)
+            
+            with self._lock:
+                if embeddings is not None:
+                    self._ensure_index_writable()
+                    self.index.add(embeddings)
+                    if self._rebuild_backlog is not None:
+                        self._rebuild_backlog.append(embeddings)
+                
+                # Stocker les métadonnées
+                timestamp = datetime.now().isoformat()
+                batch_docs = []
+                for i, (text, metadata) in enumerate(batch):
+                    doc_id = self._next_id
+                    self._next_id += 1
+                    batch_docs.append({
+                        "id": doc_id,
+                        "text": text,
+                        "type": doc_type,
+                        "metadata": metadata,
+                        "timestamp": timestamp
+                    })
+                    if embeddings is not None:
+                        self._wal_pending.append((doc_id, embeddings[i]))
+                    doc_ids.append(doc_id)
+                self.store.add_many(batch_docs)
+        
+        if doc_ids and self.embedding_model:
+            self._maybe_migrate_index()
+        
+        elapsed = time.perf_counter() - start_time
+        chunks_per_sec = len(doc_ids) / elapsed if elapsed > 0 else float(len(doc_ids))
+        self._ingestion_stats.stats = {
+            "chunks": len(doc_ids),
+            "batch_size": self.batch_size,
+            "batches": batches,
+            "seconds": round(elapsed, 4),
+            "chunks_per_sec": round(chunks_per_sec, 2)
+        }
+        
+        if not doc_ids:
+            return []
+        
+        logger.info(
+            f"📄 {len(doc_ids)} documents ajoutés: {doc_type} "
+            f"(IDs {doc_ids[0]}-{doc_ids[-1]}, {chunks_per_sec:.1f} chunks/s)"
+        )
+        return doc_ids
+    
+    def update_metadata(self, doc_ids: List[int], updates: Dict[str, Any]):
+        """Compléter les métadonnées de documents déjà stockés (ex: total_chunks connu après coup)"""
+        with self._lock:
+            self.store.update_metadata(doc_ids, updates)
+    
+    def create_chunker(self) -> TextChunker:
+        """
+        Découpeur RAG aligné sur l'encodeur
+        
+        Le budget en tokens est la longueur max du modèle (MiniLM: 256) moins
+        [CLS]/[SEP], pour que rien ne soit tronqué silencieusement à l'encodage.
+        """
+        max_tokens = CHUNK_MAX_TOKENS
+        count_tokens = None
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        if tokenizer is not None:
+            count_tokens = make_token_counter(tokenizer)
+            limit = (self.embedding_model.max_seq_length or 256) - 2
+            max_tokens = min(max_tokens, limit) if max_tokens > 0 else limit
+        return TextChunker(
+            max_chars=CHUNK_MAX_CHARS,
+            overlap_chars=CHUNK_OVERLAP_CHARS,
+            max_tokens=max_tokens or None,
+            count_tokens=count_tokens
+        )
+    
+    def _ensure_index_writable(self):
+        """Recharger en RAM un index ouvert en mmap lecture seule avant d'y écrire"""
+        if not self.index_mmapped:
+            return
+        start_time = time.perf_counter()
+        # Copie en RAM de l'état courant (pas de relecture: le fichier a pu être compacté)
+        self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        self.index_mmapped = False
+        logger.info(
+            f"📝 Index FAISS rechargé en RAM pour écriture "
+            f"({self.index.ntotal} vecteurs, {time.perf_counter() - start_time:.2f}s)"
+        )
+    
+    def _enable_reconstruct(self):
+        """Activer la reconstruction des vecteurs (table directe pour les index IVF)"""
+        if get_faiss_index_type(self.index) in ("ivf_flat", "ivf_pq"):
+            ivf = faiss.extract_index_ivf(self.index)
+            if ivf.direct_map.no():
+                ivf.make_direct_map()
+    
+    def get_vectors(self, doc_ids: List[int]) -> np.ndarray:
+        """
+        Récupérer les embeddings de documents par ID (re-ranking, export)
+        
+        L'index FAISS est l'unique source des vecteurs. Pour IVF-PQ les
+        vecteurs reconstruits sont l'approximation quantifiée.
+        
+        Returns:
+            Matrice float32 (len(doc_ids), dimension)
+        """
+        if self.index is None:
+            raise RuntimeError("Aucun index FAISS (mode simple sans embeddings)")
+        
+        with self._lock:
+            ntotal = self._vector_count()
+            for doc_id in doc_ids:
+                if not 0 <= doc_id < ntotal:
+                    raise IndexError(f"ID de vecteur hors index: {doc_id} (ntotal={ntotal})")
+            
+            self._enable_reconstruct()
+            base = self.index.ntotal
+            vectors = np.empty((len(doc_ids), self.dimension), dtype=np.float32)
+            for row, doc_id in enumerate(doc_ids):
+                if doc_id < base:
+                    vectors[row] = self.index.reconstruct(int(doc_id))
+                else:
+                    vectors[row] = self.delta_index.reconstruct(int(doc_id - base))
+        return vectors
+    
+    def iter_vectors(self, batch_size: int = 10000):
+        """Parcourir tous les vecteurs par blocs contigus: (premier ID, matrice float32)"""
+        if self.index is None:
+            return
+        
+        with self._lock:
+            self._enable_reconstruct()
+            index, delta_index = self.index, self.delta_index
+        
+        # Snapshot puis, chez un lecteur, les vecteurs rejoués depuis le journal
+        base = index.ntotal
+        for source, offset in ((index, 0), (delta_index, base)):
+            ntotal = source.ntotal if source is not None else 0
+            for start in range(0, ntotal, batch_size):
+                count = min(batch_size, ntotal - start)
+                with self._lock:
+                    vectors = source.reconstruct_n(start, count)
+                yield offset + start, vectors
+    
+    def _vector_count(self) -> int:
+        """Vecteurs consultables: index principal + journal rejoué (lecteur)"""
+        if self.index is None:
+            return 0
+        return self.index.ntotal + (self.delta_index.ntotal if self.delta_index is not None else 0)
+    
+    def _maybe_migrate_index(self):
+        """Migrer l'index courant vers le backend configuré dès que possible, réentraîner un IVF qui a grandi"""
+        with self._lock:
+            if self.index is None or self.read_only:
+                return  # Lecteur: l'écrivain migre, le nouveau snapshot est repris par refresh()
+            current_type = get_faiss_index_type(self.index)
+            ntotal = self.index.ntotal
+            retrain = (
+                current_type == self.index_type and current_type in ("ivf_flat", "ivf_pq")
+                and self.retrain_factor > 0 and self.index_trained_on
+                and ntotal >= self.retrain_factor * self.index_trained_on
+            )
+            # Pas assez de vecteurs pour entraîner l'IVF: rester en recherche exacte
+            migrate = current_type != self.index_type and ntotal >= faiss_min_training_size(self.index_type, self.nlist)
+        
+        if retrain:
+            self.retrain_index()
+        elif migrate:
+            start_time = time.perf_counter()
+            if self._rebuild_index():
+                logger.info(
+                    f"🔀 Index FAISS migré: {current_type} → {self.index_type} "
+                    f"({self.index_trained_on} vecteurs, {time.perf_counter() - start_time:.2f}s)"
+                )
+    
+    def retrain_index(self):
+        """
+        Réentraîner le quantificateur IVF sur tous les vecteurs actuels
+        
+        Les centroïdes appris sur le premier corpus ne suivent pas sa
+        croissance (listes déséquilibrées, rappel en baisse): l'index est
+        reconstruit, automatiquement quand le corpus a été multiplié par
+        `retrain_factor`. Les recherches continuent sur l'ancien index
+        pendant la reconstruction.
+        """
+        with self._lock:
+            if self.index is None or self.read_only or get_faiss_index_type(self.index) not in ("ivf_flat", "ivf_pq"):
+                return
+            previous = self.index_trained_on
+        start_time = time.perf_counter()
+        if self._rebuild_index():
+            logger.info(
+                f"🏋️ Index {self.index_type} réentraîné: {previous} → {self.index_trained_on} vecteurs "
+                f"({time.perf_counter() - start_time:.2f}s)"
+            )
+    
+    def _rebuild_index(self) -> bool:
+        """
+        Recréer l'index du backend configuré, entraîné sur tous les vecteurs actuels
+        
+        Le nouvel index est entraîné et rempli hors du verrou; seuls la
+        lecture des vecteurs (par blocs) et l'échange final le prennent. Les
+        lots ajoutés pendant la construction sont rejoués dans le nouvel
+        index au moment de l'échange.
+        
+        Returns:
+            False si une reconstruction est déjà en cours
+        """
+        with self._lock:
+            if self._rebuild_backlog is not None:
+                return False
+            self._ensure_index_writable()
+            self._enable_reconstruct()
+            source, ntotal = self.index, self.index.ntotal
+            self._rebuild_backlog = []
+        
+        try:
+            new_index = create_faiss_index(self.index_type, self.dimension, nlist=self.nlist)
+            if ntotal > 0:
+                vectors = self._original_vectors(source, ntotal)
+                if not new_index.is_trained:
+                    logger.info(f"🏋️ Entraînement de l'index {self.index_type} sur {ntotal} vecteurs...")
+                    new_index.train(vectors)
+                new_index.add(vectors)
+                del vectors
+            
+            with self._lock:
+                for embeddings in self._rebuild_backlog:
+                    new_index.add(embeddings)
+                self.index = new_index
+                self.index_mmapped = False
+                if self.index_type in ("ivf_flat", "ivf_pq"):
+                    self.index_trained_on = ntotal
+                    self.store.set_setting("index_trained_on", str(ntotal))  # Validé au prochain commit
+        finally:
+            with self._lock:
+                self._rebuild_backlog = None
+        return True
+    
+    def _original_vectors(self, source, ntotal: int) -> np.ndarray:
+        """
+        Embeddings d'origine des IDs 0..ntotal-1 (entraînement d'un nouvel index)
+        
+        Flat, HNSW et IVF-Flat restituent leurs vecteurs exacts. IVF-PQ ne
+        garde que leur approximation quantifiée: la réutiliser cumulerait
+        l'erreur à chaque réentraînement, les textes du DocumentStore sont
+        donc ré-encodés (approximation seulement pour un ID sans document).
+        """
+        vectors = np.empty((ntotal, self.dimension), dtype=np.float32)
+        if get_faiss_index_type(source) != "ivf_pq":
+            for start in range(0, ntotal, 10000):
+                count = min(10000, ntotal - start)
+                with self._lock:  # Jamais pendant un index.add sur le même index
+                    vectors[start:start + count] = source.reconstruct_n(start, count)
+            return vectors
+        
+        for start in range(0, ntotal, self.batch_size):
+            doc_ids = list(range(start, min(start + self.batch_size, ntotal)))
+            docs = self.store.get_many(doc_ids)
+            encoded = [row for row, doc_id in enumerate(doc_ids) if doc_id in docs]
+            if encoded:
+                vectors[[start + row for row in encoded]] = self.embedding_model.encode(
+                    [docs[doc_ids[row]]["text"] for row in encoded],
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True
+                ).astype(np.float32)
+            for row, doc_id in enumerate(doc_ids):
+                if doc_id not in docs:
+                    with self._lock:
+                        vectors[start + row] = source.reconstruct(doc_id)
+        return vectors
+    
+    def _search_params(self, nprobe: Optional[int], ef_search: Optional[int]):
+        """Paramètres de recherche par requête (compromis rappel/latence)"""
+        index_type = get_faiss_index_type(self.index)
+        if index_type in ("ivf_flat", "ivf_pq"):
+            return faiss.SearchParametersIVF(nprobe=nprobe or FAISS_NPROBE)
+        if index_type == "hnsw":
+            return faiss.SearchParametersHNSW(efSearch=ef_search or FAISS_EF_SEARCH)
+        return None
+    
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rechercher les documents les plus similaires
+        
+        Args:
+            query: Texte de la requête
+            k: Nombre de résultats
+            nprobe: Listes IVF visitées (index IVF uniquement)
+            ef_search: Largeur de recherche (index HNSW uniquement)
+        """
+        
+        if not self.embedding_model:
+            # Mode simple : retourner les derniers documents
+            return self.store.last(k)
+        
+        if self.read_only and time.monotonic() - self._last_refresh >= FAISS_READER_REFRESH_S:
+            self.refresh()
+        
+        with self._lock:
+            if self._vector_count() == 0:
+                return []
+        
+        # Générer l'embedding de la requête (hors verrou)
+        query = np.array([self.embedding_model.encode([query])[0]], dtype=np.float32)
+        
+        # Recherche dans FAISS, sous le verrou: jamais pendant un index.add,
+        # une recopie en RAM ou une migration (remplacement de self.index)
+        with self._lock:
+            hits = []
+            ntotal = self.index.ntotal
+            if ntotal:
+                search_kwargs = {}
+                params = self._search_params(nprobe, ef_search)
+                if params is not None:
+                    search_kwargs["params"] = params
+                distances, indices = self.index.search(query, min(k, ntotal), **search_kwargs)
+                hits.extend((int(idx), float(distance)) for idx, distance in zip(indices[0], distances[0]) if idx != -1)
+            if self.delta_index is not None and self.delta_index.ntotal:
+                # Lecteur: fusionner avec les vecteurs ajoutés depuis le snapshot (recherche exacte)
+                distances, indices = self.delta_index.search(query, min(k, self.delta_index.ntotal))
+                hits.extend((ntotal + int(idx), float(distance)) for idx, distance in zip(indices[0], distances[0]) if idx != -1)
+                hits = sorted(hits, key=lambda hit: hit[1])[:k]
+        
+        # Récupérer uniquement les k documents trouvés
+        docs_by_id = self.store.get_many([idx for idx, _ in hits])
+        
+        results = []
+        for idx, distance in hits:
+            doc = docs_by_id.get(idx)
+            if doc is None:
+                continue  # Vecteur sans document (sauvegarde interrompue)
+            doc["similarity"] = float(1 / (1 + distance))  # Convertir distance en similarité
+            results.append(doc)
+        
+        logger.info(f"🔍 Recherche: {len(results)} résultats ({len(hits)} vecteurs proches)")
+        return results
+    
+    def find_ingestion(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Rechercher un fichier déjà ingéré par son empreinte SHA-256 (analyses complètes uniquement)"""
+        entry = self.store.get_ingestion(content_hash)
+        if entry and entry["result"].get("degraded"):
+            return None
+        return entry
+    
+    def register_ingestion(self, content_hash: str, filename: Optional[str], result: Dict[str, Any]):
+        """Mémoriser les documents et l'analyse produits pour un contenu (persisté au prochain save_to_disk)"""
+        if self.read_only:
+            return
+        doc_ids = [doc["id"] for doc in result.get("documents", []) if "id" in doc]
+        self.store.put_ingestion(content_hash, filename, doc_ids, result)
+    
+    def add_to_conversation(self, conv_id: str, message: "ChatMessage"):
+        """Ajouter un message à une conversation"""
+        if conv_id not in self.conversations:
+            self.conversations[conv_id] = []
+        self.conversations[conv_id].append(message)
+    
+    def get_conversation(self, conv_id: str) -> List["ChatMessage"]:
+        """Récupérer une conversation"""
+        return self.conversations.get(conv_id, [])
+    
+    # ==========================================
+    # PERSISTANCE INCRÉMENTALE (SNAPSHOT + WAL)
+    # ==========================================
+    #
+    # Disque:
+    #   documents.db                  → textes et métadonnées (SQLite, clé = ID FAISS)
+    #   faiss.index                   → snapshot de l'index (réécrit à la compaction)
+    #   memory.wal                    → journal append-only des vecteurs depuis le snapshot
+    #   memory.wal.compacting         → journal gelé pendant une compaction en cours
+    #   memory.lock                   → verrou de l'unique processus écrivain
+    #
+    # Les IDs sont positionnels (ID = rang du vecteur dans l'index): un seul
+    # processus peut écrire. Les autres workers ouvrent le même stockage en
+    # lecture seule (snapshot mmap partagé) et ne voient pas les ajouts
+    # postérieurs à leur démarrage.
+    #
+    # Le journal est compacté au chargement par l'écrivain et à l'arrêt
+    # propre: au démarrage suivant il n'y a rien à rejouer et le snapshot
+    # reste ouvert en mmap.
+    #
+    # Enregistrement WAL: <uint64 ID><uint32 taille vecteur> + float32[]
+    # Le journal est écrit AVANT la validation SQLite: un document validé a
+    # toujours son vecteur, un vecteur orphelin est simplement ignoré en recherche.
+    
+    DB_FILENAME = "documents.db"
+    WAL_FILENAME = "memory.wal"
+    WAL_COMPACTING_FILENAME = "memory.wal.compacting"
+    LOCK_FILENAME = "memory.lock"
+    _WAL_HEADER = struct.Struct("<QI")
+    
+    def save_to_disk(self, path: str):
+        """Ajouter les nouveaux vecteurs au journal (WAL), valider les documents et compacter si nécessaire"""
+        if self.read_only:
+            return
+        wal_path = os.path.join(path, self.WAL_FILENAME)
+        
+        # Sous verrou: une compaction ne peut pas geler le journal pendant l'écriture
+        with self._lock:
+            pending = self._wal_pending
+            self._wal_pending = []
+            
+            if pending:
+                with open(wal_path, "ab") as f:
+                    for doc_id, vector in pending:
+                        vector_bytes = vector.astype(np.float32).tobytes()
+                        f.write(self._WAL_HEADER.pack(doc_id, len(vector_bytes)))
+                        f.write(vector_bytes)
+                    f.flush()
+                    os.fsync(f.fileno())
+                logger.info(f"💾 {len(pending)} vecteurs ajoutés au journal: {wal_path}")
+            
+            self.store.commit()
+        
+        # Journal gelé inclus: après une compaction en échec, la suivante est retentée sans attendre un nouveau seuil
+        if self._journal_bytes(path) >= FAISS_WAL_COMPACT_MB * 1024 * 1024:
+            self.compact(path)
+    
+    def compact(self, path: str, wait: bool = False):
+        """
+        Réécrire un snapshot de l'index en arrière-plan et vider le journal
+        
+        Le journal courant est gelé (renommé), puis l'index est écrit par
+        `faiss.write_index` directement dans un fichier temporaire (aucune
+        copie sérialisée en RAM), synchronisé et renommé. L'écriture se fait
+        sous le verrou de l'index: les ajouts et recherches attendent la fin
+        du snapshot. Les ajouts postérieurs au gel partent dans un journal
+        neuf; s'ils figurent aussi dans le snapshot, le rejeu les ignore.
+        
+        Raises:
+            Avec `wait`, l'erreur d'écriture du snapshot (sinon journalisée et
+            exposée par `get_persistence_status`)
+        """
+        if self.index is None:
+            return
+        
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            if wait:
+                self._compaction_thread.join()
+                self._raise_compaction_error()
+            return
+        
+        wal_path = os.path.join(path, self.WAL_FILENAME)
+        compacting_path = os.path.join(path, self.WAL_COMPACTING_FILENAME)
+        
+        with self._lock:
+            if os.path.exists(compacting_path):
+                # Compaction précédente interrompue: fusionner les deux journaux
+                if os.path.exists(wal_path):
+                    with open(compacting_path, "ab") as dst, open(wal_path, "rb") as src:
+                        while True:
+                            block = src.read(1024 * 1024)
+                            if not block:
+                                break
+                            dst.write(block)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    os.remove(wal_path)
+            elif os.path.exists(wal_path):
+                os.replace(wal_path, compacting_path)
+        
+        def _write_snapshot():
+            start_time = time.perf_counter()
+            try:
+                # Snapshot durable (fichier puis renommage) avant d'effacer le journal gelé
+                tmp_index = os.path.join(path, "faiss.index.tmp")
+                with self._lock:
+                    ntotal = self.index.ntotal
+                    faiss.write_index(self.index, tmp_index)
+                with open(tmp_index, "rb+") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp_index, os.path.join(path, "faiss.index"))
+                fsync_directory(path)
+                
+                if os.path.exists(compacting_path):
+                    os.remove(compacting_path)
+                
+                seconds = time.perf_counter() - start_time
+                self._compaction_error = None
+                self.last_compaction = {
+                    "status": "ok", "vectors": ntotal, "seconds": round(seconds, 4),
+                    "at": datetime.now().isoformat()
+                }
+                logger.info(f"🗜️ Compaction terminée: {ntotal} vecteurs ({seconds:.2f}s)")
+            except Exception as e:
+                # Le journal gelé est conservé: rejoué au démarrage, fusionné à la prochaine compaction
+                self._compaction_error = e
+                self.last_compaction = {"status": "error", "error": str(e), "at": datetime.now().isoformat()}
+                logger.error(f"❌ Erreur compaction mémoire (journal conservé, nouvelle tentative au prochain save): {e}")
+        
+        self._compaction_thread = threading.Thread(target=_write_snapshot, name="faiss-compaction", daemon=True)
+        self._compaction_thread.start()
+        if wait:
+            self._compaction_thread.join()
+            self._raise_compaction_error()
+    
+    def _journal_bytes(self, path: str) -> int:
+        """Taille du journal courant et du journal gelé"""
+        return sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in (self.WAL_COMPACTING_FILENAME, self.WAL_FILENAME)
+            if os.path.exists(os.path.join(path, name))
+        )
+    
+    def _raise_compaction_error(self):
+        if self._compaction_error is not None:
+            raise RuntimeError(f"Compaction de la mémoire en échec: {self._compaction_error}") from self._compaction_error
+    
+    def get_persistence_status(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """Journal en attente de compaction et résultat de la dernière compaction"""
+        journal_bytes = self._journal_bytes(path) if path is not None else 0
+        return {
+            "read_only": self.read_only,
+            "vectors": self._vector_count(),
+            "next_id": self._next_id,
+            "journal_bytes": journal_bytes,
+            "compaction_running": bool(self._compaction_thread and self._compaction_thread.is_alive()),
+            "last_compaction": self.last_compaction
+        }
+    
+    def _read_wal_records(self, f, offset: int = 0) -> Iterable[Tuple[int, np.ndarray, int]]:
+        """Enregistrements complets d'un journal à partir d'un offset: (ID, vecteur, offset de fin)"""
+        f.seek(offset)
+        while True:
+            header = f.read(self._WAL_HEADER.size)
+            if len(header) < self._WAL_HEADER.size:
+                return
+            doc_id, vector_len = self._WAL_HEADER.unpack(header)
+            payload = f.read(vector_len)
+            if len(payload) < vector_len:
+                return  # Enregistrement tronqué (arrêt brutal, ou écriture en cours chez l'écrivain)
+            yield doc_id, np.frombuffer(payload, dtype=np.float32), f.tell()
+    
+    def _replay_wal(self, wal_path: str) -> int:
+        """Écrivain: rejouer un journal sur l'index chargé depuis le snapshot"""
+        vectors: List[np.ndarray] = []
+        valid_size = 0
+        
+        with open(wal_path, "rb") as f:
+            for doc_id, vector, valid_size in self._read_wal_records(f):
+                # Les IDs sont positionnels: ignorer ce que le snapshot contient déjà
+                if doc_id == self.index.ntotal + len(vectors):
+                    vectors.append(vector)
+        
+        if valid_size < os.path.getsize(wal_path):
+            logger.warning(f"⚠️ Fin de journal tronquée ignorée: {wal_path}")
+            os.truncate(wal_path, valid_size)
+        
+        if vectors:
+            self._ensure_index_writable()
+            self.index.add(np.vstack(vectors))
+        
+        return len(vectors)
+    
+    def _tail_wal(self) -> int:
+        """
+        Lecteur: ajouter à l'index delta les vecteurs journalisés depuis le dernier passage
+        
+        Chaque journal est repris à l'offset déjà lu, identifié par son inode
+        et son premier ID (le gel d'une compaction renomme le fichier sans
+        changer d'inode). Le journal n'est jamais tronqué: un enregistrement
+        incomplet est une écriture en cours, relue au passage suivant.
+        """
+        added = 0
+        offsets: Dict[tuple, int] = {}
+        for wal_name in (self.WAL_COMPACTING_FILENAME, self.WAL_FILENAME):
+            try:
+                f = open(os.path.join(self.storage_path, wal_name), "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                header = f.read(self._WAL_HEADER.size)
+                if len(header) < self._WAL_HEADER.size:
+                    continue
+                key = (os.fstat(f.fileno()).st_ino, self._WAL_HEADER.unpack(header)[0])
+                offset = self._wal_offsets.get(key, 0)
+                vectors: List[np.ndarray] = []
+                for doc_id, vector, end in self._read_wal_records(f, offset):
+                    expected = self._vector_count() + len(vectors)
+                    if doc_id > expected:
+                        break  # Journal postérieur à un snapshot pas encore rechargé
+                    if doc_id == expected:
+                        vectors.append(vector)
+                    offset = end
+                offsets[key] = offset
+            if vectors:
+                self.delta_index.add(np.vstack(vectors))
+                added += len(vectors)
+        self._wal_offsets = offsets
+        return added
+    
+    @staticmethod
+    def _file_identity(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def refresh(self) -> int:
+        """
+        Lecteur: reprendre le dernier snapshot de l'écrivain et suivre son journal
+        
+        Appelé par `search` au plus toutes les FAISS_READER_REFRESH_S secondes.
+        Un nouveau snapshot (compaction, migration) est chargé hors verrou puis
+        substitué, et l'index delta repart de zéro.
+        
+        Returns:
+            Nombre de vecteurs ajoutés à l'index delta
+        """
+        if not self.read_only or self.storage_path is None or self.delta_index is None:
+            return 0
+        self._last_refresh = time.monotonic()
+        
+        index_path = os.path.join(self.storage_path, "faiss.index")
+        identity = self._file_identity(index_path)
+        if identity is not None and identity != self._snapshot_identity:
+            index, mmapped = read_faiss_index(index_path, mmap=FAISS_MMAP)
+            with self._lock:
+                self.index, self.index_mmapped = index, mmapped
+                self._snapshot_identity = identity
+                self.delta_index.reset()
+                self._wal_offsets = {}
+            logger.info(f"🔄 Nouveau snapshot de l'écrivain chargé: {index.ntotal} vecteurs")
+        
+        with self._lock:
+            return self._tail_wal()
+    
+    def _repair_missing_vectors(self) -> int:
+        """
+        Réaligner les positions FAISS sur les IDs SQLite au chargement
+        
+        Les IDs sont positionnels: des documents enregistrés sans vecteur
+        (modèle d'embeddings indisponible à l'époque) décaleraient tous les
+        vecteurs ajoutés ensuite. Leurs textes sont encodés et ajoutés à
+        l'index (et au journal); un ID sans document reçoit un vecteur nul,
+        jamais renvoyé par la recherche.
+        
+        Returns:
+            Nombre de vecteurs ajoutés
+        """
+        if self.index is None or self.embedding_model is None:
+            return 0
+        start, stop = self.index.ntotal, self.store.next_id()
+        if stop <= start:
+            return 0
+        
+        logger.warning(f"🩹 {stop - start} documents sans vecteur (IDs {start}-{stop - 1}): encodage pour réaligner l'index")
+        self._ensure_index_writable()
+        for batch_start in range(start, stop, self.batch_size):
+            doc_ids = list(range(batch_start, min(batch_start + self.batch_size, stop)))
+            docs = self.store.get_many(doc_ids)
+            vectors = np.zeros((len(doc_ids), self.dimension), dtype=np.float32)
+            rows = [row for row, doc_id in enumerate(doc_ids) if doc_id in docs]
+            if rows:
+                vectors[rows] = self.embedding_model.encode(
+                    [docs[doc_ids[row]]["text"] for row in rows],
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True
+                ).astype(np.float32)
+            self.index.add(vectors)
+            self._wal_pending.extend(zip(doc_ids, vectors))
+        return stop - start
+    
+    def _import_legacy_documents(self, docs_path: str):
+        """
+        Importer l'ancien documents.json dans SQLite, puis le renommer
+        
+        Idempotent: les IDs (positions FAISS) sont des clés primaires, un
+        import interrompu entre la validation et le renommage est simplement
+        refait au démarrage suivant, sans doublons.
+        """
+        with open(docs_path, "r", encoding="utf-8") as f:
+            legacy_documents = json.load(f)
+        
+        # Ancien format: ID = position dans la liste (et dans l'index FAISS)
+        self.store.add_many([{**doc, "id": doc.get("id", position)} for position, doc in enumerate(legacy_documents)])
+        self.store.commit()
+        os.replace(docs_path, f"{docs_path}.migrated")
+        logger.info(f"📦 {len(legacy_documents)} documents migrés de documents.json vers SQLite")
+    
+    def _open_snapshot(self, index_path: str):
+        """Charger le snapshot FAISS (mmap lecture seule si FAISS_MMAP)"""
+        start_time = time.perf_counter()
+        self._snapshot_identity = self._file_identity(index_path)
+        self.index, self.index_mmapped = read_faiss_index(index_path, mmap=FAISS_MMAP)
+        logger.info(
+            f"📂 Index FAISS chargé: {self.index.ntotal} vecteurs ({get_faiss_index_type(self.index)}"
+            f"{', mmap' if self.index_mmapped else ''}) en {time.perf_counter() - start_time:.3f}s"
+        )
+    
+    def load_from_disk(self, path: str, allow_read_only: bool = FAISS_READ_ONLY_WORKERS):
+        """
+        Ouvrir le stockage SQLite, charger le snapshot FAISS puis rejouer le journal
+        
+        Un seul processus écrit dans un dossier (verrou memory.lock). Si un
+        autre le détient, ce processus ne démarre qu'avec `allow_read_only`:
+        il sert alors les recherches sans jamais modifier le snapshot et suit
+        le journal de l'écrivain dans un index delta en RAM (voir `refresh`).
+        
+        Raises:
+            RuntimeError: stockage déjà ouvert en écriture et lecture seule non autorisée
+        """
+        index_path = f"{path}/faiss.index"
+        docs_path = f"{path}/documents.json"
+        
+        # Un seul écrivain par dossier: les autres processus restent en lecture seule
+        if self._storage_lock is None:
+            self._storage_lock = lock_storage(os.path.join(path, self.LOCK_FILENAME))
+        self.read_only = self._storage_lock is None
+        if self.read_only:
+            if not allow_read_only:
+                raise RuntimeError(
+                    f"Stockage {path} déjà ouvert en écriture par un autre processus: un seul worker peut écrire "
+                    f"(uvicorn --workers 1, ou FAISS_READ_ONLY_WORKERS=true et uploads routés vers l'écrivain)"
+                )
+            logger.warning(f"🔒 Stockage {path} déjà ouvert en écriture par un autre processus: mémoire en lecture seule")
+        self.storage_path = path
+        
+        # Ouverture sans lecture des documents (lus à la demande par la recherche)
+        self.store.close()
+        self.store = DocumentStore(os.path.join(path, self.DB_FILENAME))
+        if not self.read_only and os.path.exists(docs_path):
+            self._import_legacy_documents(docs_path)
+        
+        if os.path.exists(index_path):
+            self._open_snapshot(index_path)
+        
+        if self.index is not None and self.read_only:
+            # Lecteur: le snapshot (éventuellement en mmap) n'est jamais recopié en RAM
+            self.delta_index = faiss.IndexFlatL2(self.dimension)
+            logger.info(f"📜 Journal de l'écrivain suivi en lecture seule: {self.refresh()} vecteurs")
+        
+        # Rejouer d'abord un journal gelé par une compaction interrompue, puis le journal courant
+        elif self.index is not None:
+            snapshot_type = get_faiss_index_type(self.index)
+            replayed = 0
+            for wal_name in (self.WAL_COMPACTING_FILENAME, self.WAL_FILENAME):
+                wal_path = os.path.join(path, wal_name)
+                if os.path.exists(wal_path):
+                    count = self._replay_wal(wal_path)
+                    replayed += count
+                    logger.info(f"📜 Journal rejoué ({wal_name}): {count} vecteurs")
+            repaired = self._repair_missing_vectors()
+            if snapshot_type in ("ivf_flat", "ivf_pq"):
+                # Stockage antérieur au suivi de l'entraînement: compter à partir d'aujourd'hui
+                self.index_trained_on = int(self.store.get_setting("index_trained_on") or self.index.ntotal)
+            self._maybe_migrate_index()
+            
+            # Écrivain: intégrer le journal (ou la migration) au snapshot tout de suite,
+            # pour que les démarrages suivants ouvrent directement le snapshot en mmap
+            stale = replayed > 0 or repaired > 0 or get_faiss_index_type(self.index) != snapshot_type or any(
+                os.path.exists(os.path.join(path, name)) for name in (self.WAL_COMPACTING_FILENAME, self.WAL_FILENAME)
+            )
+            if stale:
+                try:
+                    self.compact(path, wait=True)
+                except RuntimeError as e:
+                    # L'état rejoué reste en RAM, le journal est conservé sur disque
+                    logger.error(f"❌ {e}")
+                if FAISS_MMAP and os.path.exists(index_path) and self._compaction_error is None:
+                    self._open_snapshot(index_path)
+        
+        self._next_id = max(self.store.next_id(), self._vector_count())
+        if self.index is not None and self.embedding_model is not None and self._vector_count() != self._next_id:
+            logger.warning(
+                f"⚠️ IDs SQLite ({self.store.next_id()}) et positions FAISS ({self._vector_count()}) désalignés"
+                f"{' (lecture seule: réparé par le processus écrivain)' if self.read_only else ''}"
+            )
+        logger.info(f"📂 Stockage documents ouvert: {self.store.db_path} (prochain ID: {self._next_id})")
+    
+    def close(self, path: str):
+        """Arrêt propre: valider, compacter le journal dans le snapshot et libérer le verrou d'écriture"""
+        try:
+            if not self.read_only:
+                self.save_to_disk(path)
+                if self._compaction_thread is not None:
+                    self._compaction_thread.join()  # Compaction en cours: laisser finir avant la dernière
+                if any(os.path.exists(os.path.join(path, name)) for name in (self.WAL_COMPACTING_FILENAME, self.WAL_FILENAME)):
+                    self.compact(path, wait=True)
+        finally:
+            self.store.close()
+            if self._storage_lock is not None:
+                self._storage_lock.close()
+                self._storage_lock = None
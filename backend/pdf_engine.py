@@ -0,0 +1,196 @@
+"""
+📄 MOTEUR D'INGESTION PDF (PyMuPDF)
+===================================
+
+Un seul document PyMuPDF ouvert par PDF, parcouru une seule fois:
+- Texte de chaque page
+- Références (xrefs) des images embarquées
+- Rendu de page en pixmap à la demande (PDF scannés), directement en mémoire
+
+Remplace le double parsing PyPDF2 (texte) + fitz (rendu, images).
+
+Extraction parallèle: les plages de pages sont réparties sur un
+ProcessPoolExecutor, chaque worker ouvrant le document de son côté.
+Ce module reste léger (PyMuPDF seulement) car il est importé par les workers.
+
+Auteur: BelikanM
+Date: 13 Novembre 2025
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+import fitz  # PyMuPDF
+
+# Bornes du zoom adaptatif (1.0 = 72 dpi)
+MIN_RENDER_ZOOM = 0.5
+MAX_RENDER_ZOOM = 4.0
+
+
+class PDFPage:
+    """Une page parcourue: texte et images embarquées (rendu via `PDFIngestionEngine.render_page`)"""
+
+    def __init__(self, number: int, text: str, image_xrefs: List[int]):
+        self.number = number  # Index 0-based
+        self.text = text
+        self.image_xrefs = image_xrefs
+
+    def __repr__(self) -> str:
+        return f"<PDFPage {self.number + 1} | {len(self.text)} caractères, {len(self.image_xrefs)} images>"
+
+
+class PDFIngestionEngine:
+    """Moteur d'ingestion PDF sur un unique document PyMuPDF"""
+
+    def __init__(self, document: "fitz.Document"):
+        self.document = document
+
+    @classmethod
+    def open(cls, data: Optional[bytes] = None, path: Optional[str] = None) -> "PDFIngestionEngine":
+        """Ouvrir un PDF depuis des octets en mémoire ou un chemin"""
+        if data is not None:
+            return cls(fitz.open(stream=data, filetype="pdf"))
+        if path is not None:
+            return cls(fitz.open(path, filetype="pdf"))
+        raise ValueError("data ou path requis")
+
+    @property
+    def page_count(self) -> int:
+        return self.document.page_count
+
+    def iter_pages(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        with_images: bool = True
+    ) -> Iterator[PDFPage]:
+        """
+        Parcourir les pages en une passe
+
+        Args:
+            start: Première page (0-based)
+            stop: Page de fin exclue (None = dernière page)
+            with_images: Collecter les xrefs des images embarquées
+        """
+        stop = self.page_count if stop is None else min(stop, self.page_count)
+        for number in range(start, stop):
+            page = self.document.load_page(number)
+            text = page.get_text("text")
+            image_xrefs = [img[0] for img in page.get_images()] if with_images else []
+            yield PDFPage(number, text, image_xrefs)
+
+    def zoom_for_edge(self, number: int, max_edge: int) -> float:
+        """Zoom tel que le plus grand côté de la page rendue fasse `max_edge` pixels"""
+        rect = self.document.load_page(number).rect
+        longest = max(rect.width, rect.height) or 1.0
+        return min(MAX_RENDER_ZOOM, max(MIN_RENDER_ZOOM, max_edge / longest))
+    
+    def render_page(
+        self,
+        number: int,
+        zoom: Optional[float] = None,
+        max_edge: Optional[int] = None
+    ) -> "fitz.Pixmap":
+        """
+        Rendre une page en pixmap RGB (en mémoire, aucun fichier écrit)
+        
+        Args:
+            number: Page (0-based)
+            zoom: Zoom explicite (prioritaire)
+            max_edge: Plus grand côté visé en pixels (ex: résolution d'entrée du modèle de vision)
+        """
+        if zoom is None:
+            zoom = self.zoom_for_edge(number, max_edge) if max_edge else 2.0
+        page = self.document.load_page(number)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+    def extract_image(self, xref: int) -> Dict[str, Any]:
+        """Extraire une image embarquée (octets + format)"""
+        return self.document.extract_image(xref)
+
+    def close(self):
+        self.document.close()
+
+    def __enter__(self) -> "PDFIngestionEngine":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# ==========================================
+# EXTRACTION PARALLÈLE (PROCESS POOL)
+# ==========================================
+
+# (numéro de page 0-based, texte, xrefs des images)
+PageData = Tuple[int, str, List[int]]
+
+
+def extract_page_range(
+    data: Optional[bytes],
+    path: Optional[str],
+    start: int,
+    stop: int,
+    with_images: bool = True
+) -> List[PageData]:
+    """Extraire une plage de pages (exécuté dans un worker: ouvre son propre document)"""
+    with PDFIngestionEngine.open(data=data, path=path) as engine:
+        return [
+            (page.number, page.text, page.image_xrefs)
+            for page in engine.iter_pages(start, stop, with_images=with_images)
+        ]
+
+
+def split_page_ranges(page_count: int, workers: int, min_pages_per_task: int = 4) -> List[Tuple[int, int]]:
+    """Découper [0, page_count) en plages contiguës, ~2 tâches par worker pour lisser la charge"""
+    if page_count <= 0:
+        return []
+    tasks = max(1, min(workers * 2, page_count // max(1, min_pages_per_task)))
+    step = -(-page_count // tasks)  # Division arrondie au supérieur
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+def iter_pages_parallel(
+    executor: Executor,
+    page_count: int,
+    workers: int,
+    data: Optional[bytes] = None,
+    path: Optional[str] = None,
+    with_images: bool = True
+) -> Iterator[PageData]:
+    """
+    Extraire les pages via un pool de workers, produites dans l'ordre des pages
+
+    Au plus `workers` plages sont en cours ou en attente de lecture: le texte
+    du document n'est jamais entièrement en mémoire si le consommateur
+    (découpage, encodage) est plus lent que l'extraction.
+
+    Avec un chemin, chaque worker lit le fichier lui-même; avec des octets,
+    le contenu est transmis (copié) à chaque tâche.
+    """
+    ranges = iter(split_page_ranges(page_count, workers))
+    pending = deque(
+        executor.submit(extract_page_range, data, path, start, stop, with_images)
+        for start, stop in islice(ranges, max(1, workers))
+    )
+    try:
+        while pending:
+            pages = pending.popleft().result()  # Ordre de soumission = ordre des pages
+            for start, stop in islice(ranges, 1):
+                pending.append(executor.submit(extract_page_range, data, path, start, stop, with_images))
+            yield from pages
+    finally:
+        for future in pending:
+            future.cancel()  # Consommateur interrompu: ne pas extraire la suite
+
+
+def create_pdf_process_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Pool de workers PDF en mode spawn (pas de fork d'un processus qui a chargé torch/FAISS)"""
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn")
+    )
@@ -0,0 +1,9 @@
+"""Configuration pytest: modules du backend importables depuis les tests"""
+
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(1, str(BACKEND_DIR / "models"))  # unified_agent
@@ -0,0 +1,30 @@
+"""
+🧪 TESTS DU CYCLE DE VIE DE L'API
+=================================
+
+À l'arrêt du serveur, le journal FAISS est compacté par le handler
+`lifespan` (plus de hook `on_event` déprécié).
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import chat_agent_api
+
+
+def test_shutdown_compacts_memory(monkeypatch, tmp_path):
+    closed = []
+    manager = SimpleNamespace(memory=SimpleNamespace(close=closed.append), storage_path=tmp_path)
+    monkeypatch.setattr(chat_agent_api, "chat_manager", manager)
+
+    async def serve():
+        async with chat_agent_api.lifespan(chat_agent_api.app):
+            assert closed == []  # Rien pendant que le serveur tourne
+
+    asyncio.run(serve())
+    assert closed == [str(tmp_path)]
+    assert chat_agent_api.app.router.on_shutdown == []
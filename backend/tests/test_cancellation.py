@@ -0,0 +1,85 @@
+"""
+🧪 TESTS DE L'ANNULATION DES APPELS ASYNCHRONES
+===============================================
+
+Tâche annulée pendant une étape: l'étape en cours finit, le jeton est
+visible dans son thread et l'étape suivante n'est jamais lancée. Client
+déconnecté: tâche annulée, aucune erreur levée.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from unified_agent import PipelineDAG, ToolCancelledError, cancellation_requested, run_cancellable
+
+
+def test_cancel_mid_stage_stops_before_next_stage():
+    executor = ThreadPoolExecutor(max_workers=2)
+    started = threading.Event()
+    resume = threading.Event()
+    ran = []
+    outcome = []
+
+    def slow_stage(results):
+        started.set()
+        resume.wait(timeout=2.0)
+        ran.append(("slow", cancellation_requested()))
+        return 1
+
+    def pipeline():
+        dag = PipelineDAG(executor, name="annulable")
+        dag.add("slow", slow_stage)
+        dag.add("next", lambda results: ran.append(("next", cancellation_requested())), after=["slow"])
+        try:
+            return dag.run()
+        except BaseException as e:
+            outcome.append(e)
+            raise
+
+    async def cancel_during_stage():
+        task = asyncio.ensure_future(run_cancellable(executor, pipeline))
+        assert await asyncio.get_running_loop().run_in_executor(None, started.wait, 2.0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        resume.set()
+
+    asyncio.run(cancel_during_stage())
+    executor.shutdown(wait=True)
+
+    assert ran == [("slow", True)]  # Étape en cours terminée, jeton visible dans son thread
+    assert len(outcome) == 1 and isinstance(outcome[0], ToolCancelledError)
+
+
+def test_uncancelled_call_returns_its_result():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        result = asyncio.run(run_cancellable(executor, lambda value: (value, cancellation_requested()), "ok"))
+    assert result == ("ok", False)
+
+
+def test_disconnected_client_cancels_without_raising():
+    pytest.importorskip("fastapi")
+    from chat_agent_api import cancel_on_disconnect
+
+    cancelled = []
+
+    async def never_finishes():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def disconnected():
+        return True
+
+    request = SimpleNamespace(is_disconnected=disconnected, url=SimpleNamespace(path="/chat"))
+    response = asyncio.run(cancel_on_disconnect(request, never_finishes(), poll_interval=0.01))
+
+    assert response.status_code == 499
+    assert response.body == b""
+    assert cancelled == [True]
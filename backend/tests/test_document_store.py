@@ -0,0 +1,140 @@
+"""
+🧪 TESTS DU STOCKAGE SQLITE DES DOCUMENTS
+=========================================
+
+Lecture/écriture par ID, registre d'ingestion, migration de l'ancien
+documents.json (idempotente) et alignement des IDs sur l'index FAISS.
+"""
+
+import json
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+from memory_store import DocumentStore, FAISSMemoryManager
+
+DIMENSION = 4
+
+
+class ConstantEncoder:
+    """Encodeur factice: le vecteur encode la longueur du texte"""
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        return np.array([[len(text)] * DIMENSION for text in texts], dtype=np.float32)
+
+
+def legacy_documents(count: int):
+    return [
+        {"id": i, "type": "text", "text": f"ancien {i}", "metadata": {"n": i}, "timestamp": "2025-11-13T00:00:00"}
+        for i in range(count)
+    ]
+
+
+def write_legacy_storage(path, count: int, vectors: int = None):
+    """Ancien stockage: documents.json + faiss.index aligné"""
+    with open(path / "documents.json", "w", encoding="utf-8") as f:
+        json.dump(legacy_documents(count), f)
+    index = faiss.IndexFlatL2(DIMENSION)
+    docs = legacy_documents(count)[:count if vectors is None else vectors]
+    if docs:
+        index.add(ConstantEncoder().encode([doc["text"] for doc in docs]))
+    faiss.write_index(index, str(path / "faiss.index"))
+
+
+def open_memory(path, encoder=None) -> FAISSMemoryManager:
+    memory = FAISSMemoryManager(embedding_model=encoder, dimension=DIMENSION)
+    memory.load_from_disk(str(path))
+    return memory
+
+
+def test_store_roundtrip_and_commit(tmp_path):
+    db_path = str(tmp_path / "documents.db")
+    store = DocumentStore(db_path)
+    assert store.next_id() == 0
+    store.add_many(legacy_documents(3))
+    store.update_metadata([1], {"total_chunks": 3})
+    store.commit()
+    store.close()
+
+    reopened = DocumentStore(db_path)
+    assert len(reopened) == 3
+    assert reopened.next_id() == 3
+    assert reopened.get(1)["metadata"] == {"n": 1, "total_chunks": 3}
+    assert [doc["id"] for doc in reopened.last(2)] == [1, 2]
+    assert reopened.get_many([0, 7]).keys() == {0}
+    reopened.close()
+
+
+def test_uncommitted_documents_are_lost(tmp_path):
+    db_path = str(tmp_path / "documents.db")
+    store = DocumentStore(db_path)
+    store.add_many(legacy_documents(2))
+    store._conn.close()  # Arrêt brutal avant commit()
+
+    assert len(DocumentStore(db_path)) == 0
+
+
+def test_ingestion_registry(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    assert store.get_ingestion("abc") is None
+    store.put_ingestion("abc", "doc.pdf", [4, 5], {"total_chunks": 2})
+    store.commit()
+    entry = store.get_ingestion("abc")
+    assert entry["doc_ids"] == [4, 5]
+    assert entry["filename"] == "doc.pdf"
+    assert entry["result"] == {"total_chunks": 2}
+    store.close()
+
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    write_legacy_storage(tmp_path, 3)
+
+    memory = open_memory(tmp_path)
+    assert len(memory.store) == 3
+    assert memory.store.get(2)["text"] == "ancien 2"
+    assert not (tmp_path / "documents.json").exists()
+    assert (tmp_path / "documents.json.migrated").exists()
+    memory.close(str(tmp_path))
+
+    reopened = open_memory(tmp_path)
+    assert len(reopened.store) == 3
+    reopened.close(str(tmp_path))
+
+
+def test_interrupted_migration_is_reimported_without_duplicates(tmp_path):
+    write_legacy_storage(tmp_path, 3)
+    memory = open_memory(tmp_path)
+    memory.close(str(tmp_path))
+
+    # Arrêt entre la validation SQLite et le renommage de documents.json
+    (tmp_path / "documents.json.migrated").replace(tmp_path / "documents.json")
+
+    reopened = open_memory(tmp_path)
+    assert len(reopened.store) == 3
+    assert reopened.store.next_id() == 3
+    assert not (tmp_path / "documents.json").exists()
+    reopened.close(str(tmp_path))
+
+
+def test_next_id_follows_faiss_positions(tmp_path):
+    write_legacy_storage(tmp_path, 3)
+    memory = open_memory(tmp_path, ConstantEncoder())
+    assert memory.index.ntotal == 3
+    assert memory._next_id == 3
+
+    doc_id = memory.add_document("nouveau document", {})
+    assert doc_id == 3
+    np.testing.assert_array_equal(memory.get_vectors([doc_id]), ConstantEncoder().encode(["nouveau document"]))
+    memory.close(str(tmp_path))
+
+
+def test_legacy_documents_without_vectors_are_realigned(tmp_path):
+    # Ancien stockage dont les 2 derniers documents ont été ajoutés sans modèle d'embeddings
+    write_legacy_storage(tmp_path, 5, vectors=3)
+    memory = open_memory(tmp_path, ConstantEncoder())
+    assert memory.index.ntotal == 5
+    np.testing.assert_array_equal(memory.get_vectors([3, 4]), ConstantEncoder().encode(["ancien 3", "ancien 4"]))
+    assert memory.add_document("suivant", {}) == 5
+    memory.close(str(tmp_path))
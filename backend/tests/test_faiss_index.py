@@ -0,0 +1,201 @@
+"""
+🧪 TESTS DES BACKENDS D'INDEX FAISS
+===================================
+
+Choix du backend, migration flat → IVF, réentraînement quand le corpus
+grandit (sur les embeddings d'origine, hors du verrou des recherches) et
+paramètres de recherche (nprobe, efSearch) par requête.
+"""
+
+import threading
+import zlib
+
+import pytest
+
+import memory_store
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+from memory_store import (
+    FAISSMemoryManager,
+    create_faiss_index,
+    faiss_min_training_size,
+    get_faiss_index_type
+)
+
+DIMENSION = 8
+NLIST = 2
+
+
+class RandomEncoder:
+    """Encodeur factice: vecteurs aléatoires reproductibles"""
+
+    def __init__(self, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        return self.rng.standard_normal((len(texts), DIMENSION)).astype(np.float32)
+
+
+class TextEncoder:
+    """Encodeur factice déterministe: un même texte donne toujours le même vecteur"""
+
+    def __init__(self, dimension: int = DIMENSION):
+        self.dimension = dimension
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        return np.stack([
+            np.random.default_rng(zlib.crc32(text.encode())).standard_normal(self.dimension)
+            for text in texts
+        ]).astype(np.float32)
+
+
+def make_memory(index_type: str, **kwargs) -> FAISSMemoryManager:
+    return FAISSMemoryManager(
+        embedding_model=RandomEncoder(), dimension=DIMENSION, index_type=index_type, nlist=NLIST, **kwargs
+    )
+
+
+def add_many(memory: FAISSMemoryManager, count: int):
+    return memory.add_documents([f"doc {i}" for i in range(count)], [{} for _ in range(count)])
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat", "ivf_pq"])
+def test_factory_builds_requested_backend(index_type):
+    index = create_faiss_index(index_type, DIMENSION, nlist=NLIST, pq_m=4, hnsw_m=8)
+    assert get_faiss_index_type(index) == index_type
+
+
+def test_factory_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        create_faiss_index("annoy", DIMENSION)
+    with pytest.raises(ValueError):
+        make_memory("annoy")
+
+
+def test_hnsw_is_created_directly():
+    memory = make_memory("hnsw")
+    assert get_faiss_index_type(memory.index) == "hnsw"
+    assert memory.index.ntotal == 0
+
+
+def test_ivf_migrates_once_enough_vectors_to_train():
+    memory = make_memory("ivf_flat")
+    threshold = faiss_min_training_size("ivf_flat", NLIST)
+
+    add_many(memory, threshold - 1)
+    assert get_faiss_index_type(memory.index) == "flat"
+
+    add_many(memory, 1)
+    assert get_faiss_index_type(memory.index) == "ivf_flat"
+    assert memory.index.ntotal == threshold
+    assert memory.index_trained_on == threshold
+    assert memory.store.get_setting("index_trained_on") == str(threshold)
+
+
+def test_ivf_is_retrained_when_corpus_grows():
+    memory = make_memory("ivf_flat", retrain_factor=2)
+    threshold = faiss_min_training_size("ivf_flat", NLIST)
+    add_many(memory, threshold)
+    before = memory.get_vectors([0, threshold - 1])
+
+    add_many(memory, threshold - 1)
+    assert memory.index_trained_on == threshold
+    add_many(memory, 1)
+    assert memory.index_trained_on == 2 * threshold
+    # Même contenu, positions (IDs) inchangées
+    np.testing.assert_allclose(memory.get_vectors([0, threshold - 1]), before)
+
+
+def test_pq_is_retrained_on_original_embeddings(monkeypatch):
+    # PQ réduit (2 sous-quantificateurs de 4 bits): entraînement rapide en dimension 8
+    monkeypatch.setattr(
+        memory_store, "create_faiss_index",
+        lambda index_type, dimension, nlist=NLIST: (
+            faiss.index_factory(dimension, f"IVF{nlist},PQ2x4") if index_type == "ivf_pq"
+            else create_faiss_index(index_type, dimension, nlist=nlist)
+        )
+    )
+    encoder = TextEncoder()
+    memory = FAISSMemoryManager(
+        embedding_model=encoder, dimension=DIMENSION, index_type="ivf_pq", nlist=NLIST, retrain_factor=2
+    )
+    threshold = faiss_min_training_size("ivf_pq", NLIST)
+    texts = [f"doc {i}" for i in range(2 * threshold)]
+
+    trained_on = []
+    original_train = faiss.IndexIVFPQ.train
+
+    def spy(self, x, *args):
+        trained_on.append(np.array(x))
+        return original_train(self, x, *args)
+
+    monkeypatch.setattr(faiss.IndexIVFPQ, "train", spy)
+    memory.add_documents(texts[:threshold], [{} for _ in range(threshold)])
+    memory.add_documents(texts[threshold:], [{} for _ in range(threshold)])
+
+    assert memory.index_trained_on == 2 * threshold
+    # Réentraînement sur les textes ré-encodés, pas sur les codes PQ reconstruits
+    np.testing.assert_array_equal(trained_on[-1], encoder.encode(texts))
+
+
+def test_rebuild_keeps_searches_and_ingestion_running(monkeypatch):
+    memory = make_memory("ivf_flat", retrain_factor=2)
+    threshold = faiss_min_training_size("ivf_flat", NLIST)
+    add_many(memory, threshold)  # Migration flat → IVF (premier entraînement)
+    add_many(memory, threshold - 1)
+
+    during_training = {}
+    original_train = faiss.IndexIVFFlat.train
+
+    def slow_train(self, x, *args):
+        def concurrent_work():
+            during_training["search"] = memory.search("requête", k=3)
+            during_training["added"] = add_many(memory, 5)
+
+        worker = threading.Thread(target=concurrent_work)
+        worker.start()
+        worker.join(timeout=5.0)
+        during_training["blocked"] = worker.is_alive()
+        return original_train(self, x, *args)
+
+    monkeypatch.setattr(faiss.IndexIVFFlat, "train", slow_train)
+    add_many(memory, 1)
+
+    assert during_training["blocked"] is False
+    assert len(during_training["search"]) == 3
+    assert memory.index_trained_on == 2 * threshold
+    # Lots ajoutés pendant l'entraînement repris dans le nouvel index, à leur position
+    assert memory.index.ntotal == 2 * threshold + 5
+    assert during_training["added"] == list(range(2 * threshold, 2 * threshold + 5))
+
+
+def test_retraining_disabled_keeps_first_quantizer():
+    memory = make_memory("ivf_flat", retrain_factor=0)
+    threshold = faiss_min_training_size("ivf_flat", NLIST)
+    add_many(memory, threshold)
+    add_many(memory, 3 * threshold)
+    assert memory.index_trained_on == threshold
+
+
+@pytest.mark.parametrize("index_type, index_class, kwargs, attribute, expected", [
+    ("ivf_flat", "IndexIVFFlat", {"nprobe": 2}, "nprobe", 2),
+    ("hnsw", "IndexHNSWFlat", {"ef_search": 7}, "efSearch", 7),
+])
+def test_search_parameters_are_applied(monkeypatch, index_type, index_class, kwargs, attribute, expected):
+    memory = make_memory(index_type)
+    add_many(memory, faiss_min_training_size(index_type, NLIST) or 10)
+    cls = getattr(faiss, index_class)
+    assert isinstance(memory.index, cls)
+
+    seen = []
+    original_search = cls.search
+
+    def spy(self, x, k, *args, **search_kwargs):
+        seen.append(search_kwargs.get("params"))
+        return original_search(self, x, k, *args, **search_kwargs)
+
+    monkeypatch.setattr(cls, "search", spy)
+    assert memory.search("requête", k=3, **kwargs)
+    assert getattr(seen[-1], attribute) == expected
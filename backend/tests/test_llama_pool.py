@@ -0,0 +1,99 @@
+"""
+🧪 TESTS DU POOL D'INSTANCES LLAMA.CPP
+======================================
+
+File d'attente servie dans l'ordre d'arrivée, refus 429 quand la file
+est pleine, 503 à l'échéance, et exécuteur de l'outil dimensionné sur
+le pool réellement chargé.
+"""
+
+import threading
+import time
+
+import pytest
+
+import unified_agent
+from unified_agent import LLMBusyError, LlamaPool, LLMTool
+
+
+class FakeLlama:
+    """Instance factice: seul l'emprunt au pool compte"""
+
+
+def make_pool(instances=1, **kwargs):
+    return LlamaPool([FakeLlama() for _ in range(instances)], **kwargs)
+
+
+def wait_for_queue(pool, depth, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while pool.get_metrics()["queue_depth"] != depth:
+        assert time.monotonic() < deadline, "file d'attente jamais atteinte"
+        time.sleep(0.005)
+
+
+def test_waiting_requests_are_served_in_arrival_order():
+    pool = make_pool(max_queue=4, queue_timeout=5.0)
+    served = []
+
+    def borrow(index):
+        with pool.acquire():
+            served.append(index)
+
+    threads = [threading.Thread(target=borrow, args=(i,)) for i in range(4)]
+    with pool.acquire():
+        for depth, thread in enumerate(threads, start=1):
+            thread.start()
+            wait_for_queue(pool, depth)  # Arrivées ordonnées dans la file
+    for thread in threads:
+        thread.join(timeout=2.0)
+
+    assert served == [0, 1, 2, 3]
+    metrics = pool.get_metrics()
+    assert metrics["admitted"] == 5
+    assert metrics["queue_depth"] == 0
+
+
+def test_full_queue_is_refused_with_429():
+    pool = make_pool(max_queue=1, queue_timeout=5.0)
+    waiter = threading.Thread(target=lambda: pool.acquire().__enter__())
+
+    with pool.acquire():
+        waiter.start()
+        wait_for_queue(pool, 1)
+        with pytest.raises(LLMBusyError) as error:
+            with pool.acquire():
+                pass
+    waiter.join(timeout=2.0)
+
+    assert error.value.status_code == 429
+    assert error.value.retry_after >= 1
+    assert pool.get_metrics()["rejected"] == 1
+
+
+def test_deadline_in_queue_is_refused_with_503():
+    pool = make_pool(max_queue=2, queue_timeout=0.05)
+
+    with pool.acquire():
+        with pytest.raises(LLMBusyError) as error:
+            with pool.acquire():
+                pass
+
+    assert error.value.status_code == 503
+    metrics = pool.get_metrics()
+    assert metrics["timeouts"] == 1
+    assert metrics["queue_depth"] == 0  # Place libérée pour les suivants
+
+
+def test_executor_is_sized_from_loaded_pool(tmp_path, monkeypatch):
+    model_path = tmp_path / "mistral.gguf"
+    model_path.write_bytes(b"GGUF")
+    monkeypatch.setattr(unified_agent, "LLM_POOL_SIZE", 3)
+    monkeypatch.setattr(LLMTool, "_create_llama", lambda self: FakeLlama())
+
+    tool = LLMTool(str(model_path), threads=3, lazy=True)
+    assert tool.pool is None
+    tool._begin_call()
+    tool._end_call(cold=True, seconds=0.0)
+
+    assert tool.pool.size == 3
+    assert tool.async_workers == tool.executor._max_workers == 3 + tool.pool.max_queue
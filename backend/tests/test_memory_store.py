@@ -0,0 +1,215 @@
+"""
+🧪 TESTS DE LA PERSISTANCE MÉMOIRE (SNAPSHOT + WAL)
+===================================================
+
+Rejeu du journal, fin de journal tronquée, arrêt brutal entre le snapshot
+et l'effacement du journal gelé, alignement des IDs SQLite sur FAISS,
+écrivain unique et suivi du journal par un lecteur.
+"""
+
+import hashlib
+import os
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+import memory_store
+from memory_store import FAISSMemoryManager
+
+DIMENSION = 8
+
+
+class FakeEncoder:
+    """Encodeur déterministe: un vecteur par texte, dérivé de son SHA-256"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        self.calls += 1
+        return np.array([
+            np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:DIMENSION], dtype=np.uint8)
+            for text in texts
+        ], dtype=np.float32)
+
+
+def open_memory(path, encoder=None, **kwargs) -> FAISSMemoryManager:
+    memory = FAISSMemoryManager(
+        embedding_model=encoder if encoder is not None else FakeEncoder(),
+        dimension=DIMENSION,
+        **kwargs
+    )
+    memory.load_from_disk(str(path))
+    return memory
+
+
+def crash(memory: FAISSMemoryManager):
+    """Arrêt brutal: fermer fichiers et verrou sans sauvegarder ni compacter"""
+    if memory._compaction_thread is not None:
+        memory._compaction_thread.join()
+    memory.store._conn.close()
+    memory._storage_lock.close()
+    memory._storage_lock = None
+
+
+def add_texts(memory: FAISSMemoryManager, texts):
+    return memory.add_documents(texts, [{"n": i} for i in range(len(texts))])
+
+
+def test_wal_is_replayed_after_crash(tmp_path):
+    memory = open_memory(tmp_path)
+    add_texts(memory, ["un", "deux", "trois"])
+    memory.save_to_disk(str(tmp_path))
+    crash(memory)
+
+    assert not (tmp_path / "faiss.index").exists()
+    reopened = open_memory(tmp_path)
+    assert reopened.index.ntotal == 3
+    assert reopened._next_id == 3
+    assert reopened.search("deux", k=1)[0]["text"] == "deux"
+    reopened.close(str(tmp_path))
+
+
+def test_replay_after_snapshot_appends_only_new_vectors(tmp_path):
+    memory = open_memory(tmp_path)
+    add_texts(memory, ["a", "b"])
+    memory.save_to_disk(str(tmp_path))
+    memory.compact(str(tmp_path), wait=True)
+    assert not (tmp_path / FAISSMemoryManager.WAL_FILENAME).exists()
+
+    add_texts(memory, ["c", "d"])
+    memory.save_to_disk(str(tmp_path))
+    crash(memory)
+
+    reopened = open_memory(tmp_path)
+    assert reopened.index.ntotal == 4
+    np.testing.assert_array_equal(reopened.get_vectors([2, 3]), FakeEncoder().encode(["c", "d"]))
+    # Le rejeu est intégré au snapshot par l'écrivain dès le chargement
+    assert not (tmp_path / FAISSMemoryManager.WAL_FILENAME).exists()
+    reopened.close(str(tmp_path))
+
+
+def test_truncated_last_record_is_dropped(tmp_path):
+    memory = open_memory(tmp_path)
+    add_texts(memory, ["x", "y"])
+    memory.save_to_disk(str(tmp_path))
+
+    # Arrêt brutal pendant l'écriture du vecteur suivant, avant la validation SQLite
+    add_texts(memory, ["z"])
+    wal_path = tmp_path / FAISSMemoryManager.WAL_FILENAME
+    doc_id, vector = memory._wal_pending[0]
+    with open(wal_path, "ab") as f:
+        f.write(FAISSMemoryManager._WAL_HEADER.pack(doc_id, vector.nbytes))
+        f.write(vector.tobytes()[:5])
+    crash(memory)
+
+    reopened = open_memory(tmp_path)
+    assert reopened.index.ntotal == 2
+    assert reopened._next_id == 2
+    assert not wal_path.exists()  # Partie valide intégrée au snapshot, fin tronquée écartée
+    assert add_texts(reopened, ["w"]) == [2]
+    np.testing.assert_array_equal(reopened.get_vectors([2]), FakeEncoder().encode(["w"]))
+    reopened.close(str(tmp_path))
+
+
+def test_crash_between_snapshot_and_wal_drop(tmp_path):
+    memory = open_memory(tmp_path)
+    add_texts(memory, ["p", "q", "r"])
+    memory.save_to_disk(str(tmp_path))
+
+    # Snapshot renommé mais journal gelé pas encore supprimé
+    os.replace(tmp_path / FAISSMemoryManager.WAL_FILENAME, tmp_path / FAISSMemoryManager.WAL_COMPACTING_FILENAME)
+    faiss.write_index(memory.index, str(tmp_path / "faiss.index"))
+    crash(memory)
+
+    reopened = open_memory(tmp_path)
+    assert reopened.index.ntotal == 3  # Rien n'est ajouté deux fois
+    assert not (tmp_path / FAISSMemoryManager.WAL_COMPACTING_FILENAME).exists()
+    reopened.close(str(tmp_path))
+
+
+def test_failed_compaction_keeps_journal_and_is_reported(tmp_path, monkeypatch):
+    memory = open_memory(tmp_path)
+    add_texts(memory, ["m", "n"])
+    memory.save_to_disk(str(tmp_path))
+
+    def failing_write(index, path):
+        raise OSError("disque plein")
+
+    monkeypatch.setattr(memory_store.faiss, "write_index", failing_write)
+    with pytest.raises(RuntimeError, match="disque plein"):
+        memory.compact(str(tmp_path), wait=True)
+
+    status = memory.get_persistence_status(str(tmp_path))
+    assert status["last_compaction"]["status"] == "error"
+    assert status["journal_bytes"] > 0
+    assert (tmp_path / FAISSMemoryManager.WAL_COMPACTING_FILENAME).exists()
+
+    monkeypatch.undo()
+    memory.close(str(tmp_path))
+    reopened = open_memory(tmp_path)
+    assert reopened.index.ntotal == 2
+    assert reopened.get_persistence_status()["last_compaction"] == {}
+    reopened.close(str(tmp_path))
+
+
+def test_documents_stored_without_vectors_are_realigned(tmp_path):
+    # Modèle d'embeddings indisponible: documents enregistrés sans vecteur
+    offline = FAISSMemoryManager(embedding_model=None, dimension=DIMENSION)
+    offline.load_from_disk(str(tmp_path))
+    add_texts(offline, ["hors ligne 1", "hors ligne 2"])
+    offline.close(str(tmp_path))
+
+    memory = open_memory(tmp_path)
+    assert memory.index.ntotal == 2
+    new_id = add_texts(memory, ["en ligne"])[0]
+    assert new_id == 2
+    np.testing.assert_array_equal(memory.get_vectors([new_id]), FakeEncoder().encode(["en ligne"]))
+    assert memory.search("hors ligne 2", k=1)[0]["id"] == 1
+    memory.close(str(tmp_path))
+
+
+def test_second_process_refuses_without_read_only_opt_in(tmp_path):
+    writer = open_memory(tmp_path)
+    with pytest.raises(RuntimeError, match="un seul worker peut écrire"):
+        FAISSMemoryManager(embedding_model=FakeEncoder(), dimension=DIMENSION).load_from_disk(str(tmp_path))
+    writer.close(str(tmp_path))
+
+
+def test_reader_follows_writer_journal_in_delta_index(tmp_path):
+    writer = open_memory(tmp_path)
+    add_texts(writer, ["alpha", "beta"])
+    writer.compact(str(tmp_path), wait=True)
+    add_texts(writer, ["gamma"])
+    writer.save_to_disk(str(tmp_path))
+
+    reader = FAISSMemoryManager(embedding_model=FakeEncoder(), dimension=DIMENSION)
+    reader.load_from_disk(str(tmp_path), allow_read_only=True)
+    assert reader.read_only
+    # Snapshot intact, journal rejoué à part
+    assert reader.index.ntotal == 2
+    assert reader.delta_index.ntotal == 1
+    assert reader.search("gamma", k=1)[0]["id"] == 2
+    np.testing.assert_array_equal(reader.get_vectors([2]), FakeEncoder().encode(["gamma"]))
+    with pytest.raises(RuntimeError):
+        add_texts(reader, ["refusé"])
+
+    # Nouveaux ajouts de l'écrivain: repris là où la lecture s'était arrêtée
+    add_texts(writer, ["delta", "epsilon"])
+    writer.save_to_disk(str(tmp_path))
+    assert reader.refresh() == 2
+    assert reader.refresh() == 0
+    assert reader.search("epsilon", k=1)[0]["id"] == 4
+
+    # Compaction: nouveau snapshot rechargé, delta vidé
+    writer.compact(str(tmp_path), wait=True)
+    reader.refresh()
+    assert reader.index.ntotal == 5
+    assert reader.delta_index.ntotal == 0
+    assert reader.get_persistence_status()["vectors"] == 5
+    assert [doc["id"] for doc in reader.search("beta", k=5)][0] == 1
+
+    reader.close(str(tmp_path))
+    writer.close(str(tmp_path))
@@ -0,0 +1,57 @@
+"""
+🧪 TESTS DU MOTEUR D'INGESTION PDF
+==================================
+
+Parcours des pages sur un document ouvert et extraction parallèle
+produite dans l'ordre des pages, plage par plage.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from pdf_engine import PDFIngestionEngine, iter_pages_parallel
+
+PAGE_COUNT = 40  # 4 plages pour 2 workers
+
+
+def make_pdf(path) -> bytes:
+    document = fitz.open()
+    for number in range(PAGE_COUNT):
+        document.new_page().insert_text((72, 72), f"Page numéro {number}")
+    data = document.tobytes()
+    document.close()
+    path.write_bytes(data)
+    return data
+
+
+def test_iter_pages_reads_text_from_open_document(tmp_path):
+    data = make_pdf(tmp_path / "doc.pdf")
+    with PDFIngestionEngine.open(data=memoryview(data)) as engine:
+        pages = list(engine.iter_pages(2, 5))
+    assert [page.number for page in pages] == [2, 3, 4]
+    assert "Page numéro 3" in pages[1].text
+
+
+def test_parallel_pages_are_yielded_in_order_and_lazily(tmp_path):
+    path = tmp_path / "doc.pdf"
+    make_pdf(path)
+
+    class CountingExecutor(ThreadPoolExecutor):
+        submitted = 0
+
+        def submit(self, *args, **kwargs):
+            CountingExecutor.submitted += 1
+            return super().submit(*args, **kwargs)
+
+    with CountingExecutor(max_workers=2) as executor:
+        pages = iter_pages_parallel(executor, PAGE_COUNT, workers=2, path=str(path))
+        first = next(pages)
+        assert first[0] == 0
+        assert CountingExecutor.submitted == 3  # 2 plages en cours + 1 relancée, la 4e attend
+        rest = list(pages)
+
+    assert [page[0] for page in [first, *rest]] == list(range(PAGE_COUNT))
+    assert all(f"Page numéro {number}" in text for number, text, _ in [first, *rest])
@@ -0,0 +1,146 @@
+"""
+🧪 TESTS DU PIPELINE EN GRAPHE ET DE LA PORTE D'ADMISSION
+========================================================
+
+Étapes lancées dans l'ordre des dépendances, première erreur propagée
+sans lancer les étapes qui en dépendent, pipelines imbriqués sans
+interblocage sur un pool saturé; places de la porte d'admission
+réservées, refusées (429) et rendues.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from unified_agent import AdmissionGate, PipelineDAG, ToolBusyError
+
+
+class StageFailed(Exception):
+    pass
+
+
+def test_stages_run_after_their_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def stage(name, value):
+        def run(results):
+            time.sleep(0.01)
+            with lock:
+                order.append(name)
+            return value(results)
+        return run
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        dag = PipelineDAG(executor, name="test")
+        dag.add("source", stage("source", lambda results: 2))
+        dag.add("double", stage("double", lambda results: results["source"] * 2), after=["source"])
+        dag.add("square", stage("square", lambda results: results["source"] ** 2), after=["source", "absent"])
+        dag.add("total", stage("total", lambda results: results["double"] + results["square"]), after=["double", "square"])
+        results = dag.run()
+
+    assert results == {"source": 2, "double": 4, "square": 4, "total": 8}
+    assert order[0] == "source" and order[-1] == "total"
+    stages = dag.get_timings()["stages"]
+    assert all(timing["status"] == "ok" for timing in stages.values())
+    assert stages["total"]["start_ms"] >= max(stages["double"]["start_ms"], stages["square"]["start_ms"])
+
+
+def test_failing_stage_propagates_and_skips_dependents():
+    ran = []
+
+    def fail(results):
+        raise StageFailed("étape en échec")
+
+    def independent(results):
+        time.sleep(0.02)
+        ran.append("independent")
+        return True
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        dag = PipelineDAG(executor)
+        dag.add("fail", fail)
+        dag.add("independent", independent)
+        dag.add("dependent", lambda results: ran.append("dependent"), after=["fail"])
+        with pytest.raises(StageFailed):
+            dag.run()
+
+    assert ran == ["independent"]  # Étape déjà lancée terminée, dépendante jamais lancée
+    stages = dag.get_timings()["stages"]
+    assert stages["fail"]["status"] == "error"
+    assert "dependent" not in stages
+
+
+def test_circular_dependencies_are_refused():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        dag = PipelineDAG(executor, name="cycle")
+        dag.add("a", lambda results: 1, after=["b"])
+        dag.add("b", lambda results: 2, after=["a"])
+        with pytest.raises(ValueError):
+            dag.run()
+
+
+def test_nested_pipelines_complete_on_a_saturated_pool():
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def inner(label):
+        def run(results):
+            dag = PipelineDAG(executor, name=f"inner-{label}")
+            for index in range(3):
+                dag.add(f"{label}{index}", lambda results, index=index: index)
+            return sum(dag.run().values())
+        return run
+
+    outer = PipelineDAG(executor, name="outer")
+    for label in "abc":
+        outer.add(label, inner(label))
+
+    results = {}
+    runner = threading.Thread(target=lambda: results.update(outer.run()))
+    runner.start()
+    runner.join(timeout=5.0)
+    executor.shutdown(wait=False)
+
+    assert not runner.is_alive(), "pipeline imbriqué bloqué faute de threads"
+    assert results == {"a": 3, "b": 3, "c": 3}
+
+
+def test_admission_gate_refuses_beyond_limit_and_releases_places():
+    gate = AdmissionGate(2, retry_after=lambda: 7)
+    first = gate.reserve(lambda: "premier")
+    second = gate.reserve(lambda: "second")
+
+    with pytest.raises(ToolBusyError) as error:
+        gate.reserve(lambda: "refusé")
+    assert error.value.status_code == 429
+    assert error.value.retry_after == 7
+    assert gate.is_full()
+
+    assert first() == "premier"  # Place rendue en fin d'appel
+    second.abandon()  # Retiré de l'exécuteur avant de démarrer
+    assert second() is None
+    assert gate.get_metrics() == {"limit": 2, "active": 0, "admitted": 2, "rejected": 1}
+
+
+def test_admission_gate_abandon_after_start_releases_once():
+    gate = AdmissionGate(1)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def slow():
+        started.set()
+        finish.wait(timeout=2.0)
+        return "fini"
+
+    call = gate.reserve(slow)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(call)
+        assert started.wait(timeout=2.0)
+        call.abandon()  # Déjà démarré: la place reste prise jusqu'à la fin
+        assert gate.is_full()
+        finish.set()
+        assert future.result(timeout=2.0) == "fini"
+
+    assert gate.get_metrics()["active"] == 0
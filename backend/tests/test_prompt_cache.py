@@ -0,0 +1,73 @@
+"""
+🧪 TESTS DU CACHE DE PRÉFIXES MISTRAL
+=====================================
+
+Prompts de chat: partie statique en tête, contenu inchangé. États
+llama.cpp relus à l'identique depuis le disque, sans pickle.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from unified_agent import (
+    CHAT_SYSTEM_PROMPT,
+    UnifiedAgent,
+    chat_prompt_prefix,
+    read_llama_state,
+    write_llama_state
+)
+
+INTENT_PROMPT = "Tu es un guide expert de l'application."
+
+
+def build_prompt(message, **context):
+    return UnifiedAgent._build_chat_prompt(UnifiedAgent.__new__(UnifiedAgent), message, context)
+
+
+def test_chat_prompt_keeps_framing_with_static_part_first():
+    prompt = build_prompt("Comment envoyer un PDF ?", system_prompt=INTENT_PROMPT)
+    assert prompt.startswith(chat_prompt_prefix(INTENT_PROMPT))
+    assert chat_prompt_prefix(INTENT_PROMPT).startswith(CHAT_SYSTEM_PROMPT)
+    assert "💬 Message Utilisateur: Comment envoyer un PDF ?" in prompt
+    assert prompt.endswith("Réponds de manière naturelle, informative et utile en français.")
+
+
+def test_chat_prompt_without_intent_prompt_is_unchanged():
+    prompt = build_prompt("Bonjour")
+    assert prompt.startswith(CHAT_SYSTEM_PROMPT + "\n\n")
+    assert chat_prompt_prefix(None) == CHAT_SYSTEM_PROMPT
+    assert "💬 Message Utilisateur: Bonjour" in prompt
+
+
+def test_llama_state_roundtrip(tmp_path):
+    llama_cpp = pytest.importorskip("llama_cpp")
+    state = llama_cpp.LlamaState(
+        input_ids=np.arange(6, dtype=np.intc),
+        scores=np.random.default_rng(0).standard_normal((6, 4)).astype(np.single),
+        n_tokens=6,
+        llama_state=b"\x00\x01kv-cache\xff",
+        llama_state_size=11,
+        seed=42
+    )
+    keys = {"model_hash": "m", "prefix_hash": "p"}
+    path = tmp_path / "prefix_cache" / "chat.kv"
+
+    write_llama_state(path, state, {**keys, "eval_ms": 12.5})
+    assert not path.with_suffix(".tmp").exists()
+
+    loaded = read_llama_state(path, keys)
+    assert loaded["eval_ms"] == 12.5
+    restored = loaded["state"]
+    np.testing.assert_array_equal(restored.input_ids, state.input_ids)
+    np.testing.assert_array_equal(restored.scores, state.scores)
+    assert restored.scores.dtype == state.scores.dtype
+    assert (restored.n_tokens, restored.llama_state, restored.seed) == (6, state.llama_state, 42)
+
+    # Autre modèle ou préfixe: état ignoré
+    assert read_llama_state(path, {**keys, "model_hash": "autre"}) is None
+
+    # Fichier tronqué: erreur explicite
+    path.write_bytes(path.read_bytes()[:-4])
+    with pytest.raises(ValueError):
+        read_llama_state(path, keys)
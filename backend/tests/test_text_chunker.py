@@ -0,0 +1,142 @@
+"""
+🧪 TESTS DU DÉCOUPEUR DE TEXTE (RAG)
+====================================
+
+Budgets en caractères et en tokens, chevauchement, phrases trop longues
+et frontières entre pages.
+"""
+
+import pytest
+
+from text_chunker import TextChunker
+
+
+def count_words(text: str) -> int:
+    """Compteur de tokens factice: un token par mot"""
+    return len(text.split())
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        TextChunker(max_chars=100, overlap_chars=100)
+
+
+def test_short_text_is_a_single_chunk():
+    chunker = TextChunker(max_chars=100, overlap_chars=20)
+    assert chunker.chunk_text("Une phrase. Une autre!") == ["Une phrase. Une autre!"]
+
+
+def test_empty_input_yields_nothing():
+    chunker = TextChunker(max_chars=100, overlap_chars=20)
+    assert chunker.chunk_text("") == []
+    assert list(chunker.chunk(["", "   ", ""])) == []
+
+
+def test_char_budget_is_respected():
+    text = " ".join(f"Phrase numéro {i}." for i in range(50))
+    chunker = TextChunker(max_chars=60, overlap_chars=0)
+    chunks = chunker.chunk_text(text)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    # Sans chevauchement, aucune phrase n'est perdue ni dupliquée
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_token_budget_is_respected():
+    text = " ".join("un deux trois quatre cinq." for _ in range(20))
+    chunker = TextChunker(max_chars=10_000, overlap_chars=0, max_tokens=12, count_tokens=count_words)
+    chunks = chunker.chunk_text(text)
+    assert len(chunks) > 1
+    assert all(count_words(chunk) <= 12 for chunk in chunks)
+
+
+def test_token_budget_ignored_without_counter():
+    chunker = TextChunker(max_chars=1000, overlap_chars=0, max_tokens=2)
+    assert chunker.max_tokens is None
+    assert chunker.chunk_text("Un deux trois. Quatre cinq six.") == ["Un deux trois. Quatre cinq six."]
+
+
+def test_overlap_repeats_last_sentences():
+    sentences = [f"S{i:02d} aaaaaaaaaaaaaaa." for i in range(10)]  # 20 caractères + espace
+    chunker = TextChunker(max_chars=70, overlap_chars=25)
+    chunks = chunker.chunk_text(" ".join(sentences))
+    assert len(chunks) > 1
+    for previous, current in zip(chunks, chunks[1:]):
+        # La dernière phrase du chunk précédent ouvre le suivant
+        assert current.startswith(previous.split(" ")[-2])
+    # Toutes les phrases sont couvertes
+    joined = " ".join(chunks)
+    assert all(sentence in joined for sentence in sentences)
+
+
+def test_overlap_respects_token_budget():
+    text = " ".join("un deux trois quatre." for _ in range(12))
+    chunker = TextChunker(
+        max_chars=10_000, overlap_chars=100, max_tokens=10, overlap_tokens=4, count_tokens=count_words
+    )
+    chunks = chunker.chunk_text(text)
+    assert len(chunks) > 1
+    assert all(count_words(chunk) <= 10 for chunk in chunks)
+    for chunk in chunks[1:]:
+        # Exactement une phrase (4 tokens) reprise du chunk précédent
+        assert chunk.startswith("un deux trois quatre. un deux trois quatre.")
+
+
+def test_oversized_sentence_is_split_on_spaces():
+    sentence = " ".join(["mot"] * 100) + "."  # ~400 caractères, aucune ponctuation intermédiaire
+    chunker = TextChunker(max_chars=50, overlap_chars=0)
+    chunks = chunker.chunk_text(sentence)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    # Les coupes tombent sur les espaces: aucun mot tronqué
+    assert all(word == "mot" for chunk in chunks for word in chunk.rstrip(".").split())
+
+
+def test_oversized_sentence_without_spaces_is_hard_split():
+    chunker = TextChunker(max_chars=30, overlap_chars=0)
+    chunks = chunker.chunk_text("x" * 100)
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert "".join(chunks) == "x" * 100
+
+
+def test_oversized_sentence_respects_token_budget():
+    sentence = " ".join(["mot"] * 60)
+    chunker = TextChunker(max_chars=10_000, overlap_chars=0, max_tokens=8, count_tokens=count_words)
+    chunks = chunker.chunk_text(sentence)
+    assert all(count_words(chunk) <= 8 for chunk in chunks)
+    assert sum(count_words(chunk) for chunk in chunks) == 60
+
+
+def test_page_boundary_keeps_words_apart():
+    chunker = TextChunker(max_chars=1000, overlap_chars=100)
+    chunks = list(chunker.chunk(["fin de la page un", "début de la page deux"]))
+    assert len(chunks) == 1
+    assert "un\ndébut" in chunks[0]
+    assert "undébut" not in chunks[0]
+
+
+def test_page_boundary_ends_a_sentence():
+    # Sans ponctuation finale, la dernière phrase d'une page reste une phrase distincte
+    chunker = TextChunker(max_chars=25, overlap_chars=0)
+    chunks = list(chunker.chunk(["page un sans point", "page deux sans point"]))
+    assert chunks == ["page un sans point", "page deux sans point"]
+
+
+def test_page_with_trailing_whitespace_is_unchanged():
+    chunker = TextChunker(max_chars=1000, overlap_chars=100)
+    chunks = list(chunker.chunk(["Page un.\n", "Page deux."]))
+    assert chunks == ["Page un.\nPage deux."]
+
+
+def test_texts_are_consumed_lazily():
+    consumed = []
+
+    def pages():
+        for i in range(100):
+            consumed.append(i)
+            yield f"Page {i} " + "texte " * 20 + "."
+
+    chunker = TextChunker(max_chars=200, overlap_chars=0)
+    first = next(chunker.chunk(pages()))
+    assert first
+    assert len(consumed) < 100
@@ -0,0 +1,185 @@
+"""
+🧪 TESTS DU CYCLE DE VIE DES OUTILS
+===================================
+
+Chargement paresseux unique malgré des appels simultanés, déchargement
+après inactivité (jamais pendant un appel) et rechargement au besoin.
+Budget mémoire: attente d'une place sans bloquer l'outil, chargements
+sérialisés.
+"""
+
+import threading
+import time
+
+from unified_agent import BaseTool, DetectionTool, ModelResidencyManager, tool_call
+
+MB = 1024 ** 2
+
+
+class StubTool(BaseTool):
+    """Outil factice: chargement lent et compté"""
+
+    async_workers = 4
+
+    def __init__(self, load_seconds: float = 0.05, name: str = "stub", memory_mb: int = 0):
+        super().__init__(name=name, description="Outil de test", lazy=True)
+        self.load_seconds = load_seconds
+        self.memory_mb = memory_mb
+        self.initializations = 0
+        self.releases = 0
+        self.in_call = threading.Event()
+        self.finish_call = threading.Event()
+        self.finish_call.set()
+        self._start()
+
+    def _initialize(self):
+        self.initializations += 1
+        time.sleep(self.load_seconds)
+        self.is_ready = True
+
+    def _release(self):
+        self.releases += 1
+
+    def _memory_estimate(self):
+        return self.memory_mb * MB
+
+    def _memory_footprint(self):
+        return self.memory_mb * MB
+
+    @tool_call
+    def execute(self, value):
+        self.in_call.set()
+        self.finish_call.wait(timeout=2.0)
+        return {"success": True, "value": value}
+
+
+def test_concurrent_first_calls_load_once():
+    tool = StubTool()
+    assert tool.is_ready and not tool.is_loaded
+
+    barrier = threading.Barrier(6)
+    results = []
+
+    def call(value):
+        barrier.wait()
+        results.append(tool.execute(value)["value"])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2.0)
+
+    assert sorted(results) == list(range(6))
+    assert tool.initializations == 1
+    assert tool.load_stats["loads"] == 1
+    assert tool.load_stats["cold_call_ms"] is not None
+    assert tool._active_calls == 0
+
+
+def test_idle_tool_is_unloaded_then_reloaded_on_next_call():
+    tool = StubTool(load_seconds=0.0)
+    tool.execute(1)
+
+    assert not tool.unload_if_idle(ttl=60.0)  # Utilisé à l'instant
+    assert tool.unload_if_idle(ttl=0.0)
+    assert not tool.is_loaded
+    assert tool.releases == 1
+    assert tool.load_stats["unloads"] == 1
+
+    tool.execute(2)
+    assert tool.is_loaded
+    assert tool.initializations == 2
+
+
+def test_tool_in_use_is_never_unloaded():
+    tool = StubTool(load_seconds=0.0)
+    tool.finish_call.clear()
+    caller = threading.Thread(target=tool.execute, args=(1,))
+    caller.start()
+    assert tool.in_call.wait(timeout=2.0)
+
+    assert not tool.unload_if_idle(ttl=0.0)
+    assert not tool.evict()
+    tool.finish_call.set()
+    caller.join(timeout=2.0)
+
+    assert tool.unload_if_idle(ttl=0.0)
+    assert tool.releases == 1
+
+
+def test_lazy_detection_tool_loads_on_first_call(tmp_path):
+    tool = DetectionTool(str(tmp_path), lazy=True)
+    assert tool.is_ready and not tool.is_loaded
+
+    result = tool.execute(b"image", confidence=0.3)
+    assert result["config"]["confidence_threshold"] == 0.3
+    assert tool.is_loaded
+    assert tool.load_stats["loads"] == 1
+    assert tool.load_stats["startup_ms"] is not None
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition jamais atteinte"
+        time.sleep(0.005)
+
+
+def test_waiting_for_memory_does_not_hold_the_load_lock():
+    residency = ModelResidencyManager(budget_mb=150, admission_timeout=2.0)
+    busy = StubTool(load_seconds=0.0, name="busy", memory_mb=100)
+    waiting = StubTool(load_seconds=0.0, name="waiting", memory_mb=100)
+    residency.track("busy", busy)
+    residency.track("waiting", waiting)
+
+    busy.finish_call.clear()
+    busy_caller = threading.Thread(target=busy.execute, args=(1,))
+    busy_caller.start()
+    assert busy.in_call.wait(timeout=2.0)
+
+    waiting_caller = threading.Thread(target=waiting.execute, args=(2,))
+    waiting_caller.start()
+    wait_until(lambda: residency.get_status()["waits"] == 1)
+
+    # Pendant l'attente: verrou libre, le déchargeur d'inactivité ne bloque pas
+    assert waiting._load_lock.acquire(blocking=False)
+    waiting._load_lock.release()
+    assert not waiting.unload_if_idle(ttl=0.0)
+
+    busy.finish_call.set()  # L'appel finit: le modèle inactif est évincé
+    busy_caller.join(timeout=2.0)
+    waiting_caller.join(timeout=2.0)
+
+    assert waiting.is_loaded and not busy.is_loaded
+    status = residency.get_status()
+    assert status["evictions"] == 1
+    assert status["resident_mb"] == 100
+
+
+def test_concurrent_loads_are_serialized():
+    residency = ModelResidencyManager(budget_mb=1000, admission_timeout=2.0)
+    loading = []
+    overlaps = []
+
+    class MeasuredTool(StubTool):
+        def _initialize(self):
+            loading.append(self.name)
+            overlaps.append(len(loading))
+            time.sleep(0.05)
+            loading.remove(self.name)
+            self.is_ready = True
+
+    tools = [MeasuredTool(name=f"tool-{i}", memory_mb=10) for i in range(3)]
+    for tool in tools:
+        residency.track(tool.name, tool)
+
+    threads = [threading.Thread(target=tool.execute, args=(0,)) for tool in tools]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2.0)
+
+    assert overlaps == [1, 1, 1]
+    assert all(tool.memory_bytes == 10 * MB for tool in tools)
+    assert residency.get_status()["resident_mb"] == 30
@@ -0,0 +1,106 @@
+"""
+🧪 TESTS DE LA RÉCEPTION DES UPLOADS
+====================================
+
+Limite de taille appliquée avant la mise en tampon (Content-Length ou
+comptage en transfert chunked) et réutilisation du fichier déjà reçu
+par Starlette, sans copie (copie nommée seulement pour le pool PDF).
+"""
+
+import hashlib
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from chat_agent_api import UploadBuffer, UploadTooLargeMiddleware, receive_upload
+
+MAX_SIZE = 4 * 1024 * 1024  # Au-delà du seuil de 1 Mo où Starlette bascule sur disque
+FILE_SIZE = 3 * 1024 * 1024  # Limite annoncée à l'utilisateur (corps moins l'enveloppe)
+
+
+def make_client(tmp_path):
+    received = []
+    app = FastAPI()
+    app.add_middleware(UploadTooLargeMiddleware, max_body_size=MAX_SIZE, max_file_size=FILE_SIZE)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        buffer = await receive_upload(file, max_size=MAX_SIZE, temp_dir=tmp_path)
+        try:
+            received.append(buffer)
+            return {
+                "size": buffer.size,
+                "sha256": buffer.sha256,
+                "in_memory": buffer.in_memory,
+                "same_file": buffer.open_stream() is file.file,
+                "data_sha256": hashlib.sha256(buffer.data).hexdigest()
+            }
+        finally:
+            buffer.close()
+
+    return TestClient(app), received
+
+
+@pytest.mark.parametrize("size, in_memory", [(1000, True), (2 * 1024 * 1024, False)])
+def test_upload_reuses_starlette_file(tmp_path, size, in_memory):
+    client, _ = make_client(tmp_path)
+    content = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+
+    response = client.post("/upload", files={"file": ("doc.bin", content)})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["size"] == size
+    assert body["sha256"] == body["data_sha256"] == hashlib.sha256(content).hexdigest()
+    assert body["in_memory"] is in_memory
+    assert body["same_file"] is True
+
+
+def test_declared_oversize_upload_is_refused_before_reading(tmp_path):
+    client, received = make_client(tmp_path)
+    response = client.post(
+        "/upload", content=b"", headers={"Content-Length": str(MAX_SIZE + 1), "Content-Type": "multipart/form-data; boundary=x"}
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Fichier trop volumineux (max 3 Mo)"
+    assert received == []
+
+
+def test_chunked_oversize_upload_is_refused_while_streaming(tmp_path):
+    client, received = make_client(tmp_path)
+    sent = []
+
+    def body():
+        yield b"--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.bin\"\r\n\r\n"
+        for _ in range(2 * MAX_SIZE // (1024 * 1024)):
+            sent.append(1)
+            yield b"\0" * (1024 * 1024)
+        yield b"\r\n--x--\r\n"
+
+    response = client.post("/upload", content=body(), headers={"Content-Type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Fichier trop volumineux (max 3 Mo)"
+    assert received == []
+
+
+def test_materialized_copy_is_removed_on_close(tmp_path):
+    content = b"%PDF-contenu" * 200000
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024)
+    spooled.write(content)
+    buffer = UploadBuffer(spooled, len(content), hashlib.sha256(content).hexdigest(), temp_dir=tmp_path)
+    assert not buffer.in_memory
+    assert bytes(buffer.data[:5]) == b"%PDF-"
+
+    path = buffer.materialize()
+    assert buffer.materialize() == path  # Une seule copie pour tous les workers
+    with open(path, "rb") as f:
+        assert f.read() == content
+    buffer.close()
+    assert not os.path.exists(path)
+    spooled.close()  # Le fichier reçu reste fermé par son propriétaire
@@ -0,0 +1,207 @@
+"""
+🧪 TESTS DE LA DÉDUPLICATION DES UPLOADS
+========================================
+
+Un contenu déjà ingéré renvoie ses documents sans les statistiques de
+l'ingestion d'origine; deux envois simultanés du même contenu ne sont
+analysés qu'une fois. Client déconnecté pendant un PDF: l'ingestion est
+menée à terme avant de fermer le document, le fichier et la réservation.
+"""
+
+import asyncio
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("faiss")
+
+import chat_agent_api
+from chat_agent_api import ChatAgentManager, UploadBuffer, cancel_on_disconnect
+from memory_store import FAISSMemoryManager
+
+CONTENT_HASH = "ab" * 32
+
+
+def make_manager(tmp_path, ingest):
+    """Gestionnaire sans agent ni modèles: seule l'ingestion est remplacée"""
+    manager = ChatAgentManager.__new__(ChatAgentManager)
+    manager.memory = FAISSMemoryManager(embedding_model=None)
+    manager.memory.load_from_disk(str(tmp_path))
+    manager.storage_path = tmp_path
+    manager._ingestions_in_flight = {}
+    manager._ingest_upload_buffer = ingest
+    return manager
+
+
+def pdf_result(doc_ids):
+    return {
+        "filename": "rapport.pdf",
+        "type": "application/pdf",
+        "content_hash": CONTENT_HASH,
+        "documents": [{"id": doc_id, "type": "pdf_chunk"} for doc_id in doc_ids],
+        "total_pages": 3,
+        "total_chunks": len(doc_ids),
+        "parsing": {"seconds": 1.5, "pages_extracted": 3},
+        "ingestion": {"documents": len(doc_ids), "encode_seconds": 0.4},
+        "vision": {"batches": 1, "errors": 0}
+    }
+
+
+def upload():
+    return UploadBuffer(io.BytesIO(b"%PDF"), size=4, sha256=CONTENT_HASH)
+
+
+def test_duplicate_returns_documents_without_original_stats(tmp_path):
+    async def never_called(*args):
+        raise AssertionError("contenu déjà ingéré: aucune nouvelle analyse")
+
+    manager = make_manager(tmp_path, never_called)
+    manager.memory.register_ingestion(CONTENT_HASH, "rapport.pdf", pdf_result([0, 1]))
+    manager.memory.save_to_disk(str(tmp_path))
+
+    results = asyncio.run(manager._process_upload_buffer(
+        upload(), "application/pdf", "copie.pdf", None, time.perf_counter()
+    ))
+    assert results["duplicate"] is True
+    assert results["duplicate_of"] == "rapport.pdf"
+    assert results["filename"] == "copie.pdf"
+    assert [doc["id"] for doc in results["documents"]] == [0, 1]
+    assert results["total_chunks"] == 2
+    for key in ("parsing", "ingestion", "vision"):
+        assert key not in results
+    manager.memory.close(str(tmp_path))
+
+
+def test_concurrent_uploads_of_same_content_are_ingested_once(tmp_path):
+    calls = []
+
+    async def slow_ingest(buffer, file_type, filename, description):
+        calls.append(filename)
+        await asyncio.sleep(0.05)
+        results = pdf_result([0])
+        manager.memory.register_ingestion(buffer.sha256, filename, results)
+        manager.memory.save_to_disk(str(tmp_path))
+        return results
+
+    manager = make_manager(tmp_path, slow_ingest)
+
+    async def send_twice():
+        return await asyncio.gather(*(
+            manager._process_upload_buffer(upload(), "application/pdf", name, None, time.perf_counter())
+            for name in ("premier.pdf", "second.pdf")
+        ))
+
+    first, second = asyncio.run(send_twice())
+    assert calls == ["premier.pdf"]
+    assert "duplicate" not in first
+    assert second["duplicate"] is True
+    assert second["duplicate_of"] == "premier.pdf"
+    assert manager._ingestions_in_flight == {}
+    manager.memory.close(str(tmp_path))
+
+
+def test_failed_ingestion_lets_waiting_upload_retry(tmp_path):
+    calls = []
+
+    async def failing_then_ok(buffer, file_type, filename, description):
+        calls.append(filename)
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise chat_agent_api.HTTPException(500, "Erreur traitement")
+        return pdf_result([0])
+
+    manager = make_manager(tmp_path, failing_then_ok)
+
+    async def send_twice():
+        return await asyncio.gather(*(
+            manager._process_upload_buffer(upload(), "application/pdf", name, None, time.perf_counter())
+            for name in ("premier.pdf", "second.pdf")
+        ), return_exceptions=True)
+
+    first, second = asyncio.run(send_twice())
+    assert isinstance(first, chat_agent_api.HTTPException)
+    assert calls == ["premier.pdf", "second.pdf"]
+    assert "duplicate" not in second
+    manager.memory.close(str(tmp_path))
+
+
+class RandomEncoder:
+    """Encodeur factice (dimension 8)"""
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        import numpy as np
+        return np.random.default_rng(len(texts)).standard_normal((len(texts), 8)).astype(np.float32)
+
+
+def test_disconnect_during_pdf_upload_finishes_ingestion(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    from starlette.datastructures import Headers, UploadFile
+
+    document = fitz.open()
+    for number in range(3):
+        document.new_page().insert_text((72, 72), f"Page {number}: " + "texte du rapport " * 10)
+    data = document.tobytes()
+    document.close()
+
+    manager = make_manager(tmp_path, None)
+    del manager._ingest_upload_buffer  # Vraie ingestion PDF (PyMuPDF, découpage, FAISS)
+    manager.memory = FAISSMemoryManager(embedding_model=RandomEncoder(), dimension=8)
+    manager.memory.load_from_disk(str(tmp_path))
+    manager.agent = SimpleNamespace(tools={})
+
+    events = []
+    indexing = threading.Event()
+    resume = threading.Event()
+    add_document_stream = manager.memory.add_document_stream
+
+    def slow_add(*args, doc_type=None, **kwargs):
+        if doc_type != "pdf_rag":
+            return add_document_stream(*args, doc_type=doc_type, **kwargs)
+        indexing.set()
+        resume.wait(timeout=5.0)
+        ids = add_document_stream(*args, doc_type=doc_type, **kwargs)
+        events.append("indexé")
+        return ids
+
+    manager.memory.add_document_stream = slow_add
+    engine_close = chat_agent_api.PDFIngestionEngine.close
+    upload_close = UploadBuffer.close
+    monkeypatch.setattr(
+        chat_agent_api.PDFIngestionEngine, "close",
+        lambda self: (events.append("document fermé"), engine_close(self))[1]
+    )
+    monkeypatch.setattr(UploadBuffer, "close", lambda self: (events.append("upload fermé"), upload_close(self))[1])
+
+    async def is_disconnected():
+        if not indexing.is_set():
+            return False
+        # Client parti pendant l'indexation: la réservation du contenu est toujours tenue
+        events.append(("réservé", bool(manager._ingestions_in_flight)))
+        threading.Timer(0.05, resume.set).start()
+        return True
+
+    request = SimpleNamespace(is_disconnected=is_disconnected, url=SimpleNamespace(path="/upload"))
+    file = UploadFile(io.BytesIO(data), filename="rapport.pdf", headers=Headers({"content-type": "application/pdf"}))
+
+    async def disconnect_then_retry():
+        response = await cancel_on_disconnect(request, manager.process_upload(file), poll_interval=0.01)
+        retry = await manager.process_upload(
+            UploadFile(io.BytesIO(data), filename="copie.pdf", headers=Headers({"content-type": "application/pdf"}))
+        )
+        return response, retry
+
+    response, retry = asyncio.run(disconnect_then_retry())
+
+    assert response.status_code == 499
+    # Threads de l'ingestion terminés avant la fermeture du document et du fichier
+    assert events[:4] == [("réservé", True), "indexé", "document fermé", "upload fermé"]
+    assert manager._ingestions_in_flight == {}
+    # Ingestion enregistrée: le nouvel envoi du même fichier n'est pas ré-indexé
+    assert retry["duplicate"] is True
+    assert retry["duplicate_of"] == "rapport.pdf"
+    assert events.count("indexé") == 1
+    manager.memory.close(str(tmp_path))
@@ -0,0 +1,214 @@
+"""
+🧪 TESTS DE L'ORDONNANCEUR DE LOTS VISION
+=========================================
+
+Regroupement des soumissions concurrentes en un seul appel au modèle,
+lots plafonnés et erreurs propagées à chaque appelant du lot. Aucun
+appelant n'attend indéfiniment si un lot ou la tâche de fond échoue.
+Les images envoyées seules (aprocess_image) partagent aussi les lots.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from unified_agent import AdmissionGate, UnifiedAgent
+from vision_scheduler import VisionBatchScheduler
+
+
+class FakeVision:
+    """Outil de vision factice: enregistre chaque appel à execute_batch"""
+
+    def __init__(self, error: BaseException = None):
+        self.calls = []
+        self.error = error
+        self.threads = set()
+
+    def execute_batch(self, images, questions, batch_size=None):
+        self.calls.append(list(images))
+        self.threads.add(threading.current_thread().name)
+        if self.error is not None:
+            raise self.error
+        return [{"success": True, "description": f"{question}: {image}"} for image, question in zip(images, questions)]
+
+
+class ModelRefused(Exception):
+    pass
+
+
+class ModelAborted(BaseException):
+    pass
+
+
+async def submit_concurrently(scheduler, count):
+    try:
+        return await asyncio.gather(*(scheduler.submit(f"image-{i}", "décris") for i in range(count)))
+    finally:
+        await scheduler.close()
+
+
+def test_concurrent_submits_are_served_by_one_batch():
+    vision = FakeVision()
+    scheduler = VisionBatchScheduler(vision, max_batch_size=8, max_wait_ms=200)
+
+    results = asyncio.run(submit_concurrently(scheduler, 5))
+    assert len(vision.calls) == 1
+    assert vision.calls[0] == [f"image-{i}" for i in range(5)]
+    assert [result["description"] for result in results] == [f"décris: image-{i}" for i in range(5)]
+    assert vision.threads == {"vision-batch_0"}
+
+    metrics = scheduler.get_metrics()
+    assert metrics["batches"] == 1
+    assert metrics["batch_size_histogram"] == {5: 1}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    vision = FakeVision()
+    scheduler = VisionBatchScheduler(vision, max_batch_size=2, max_wait_ms=200)
+
+    results = asyncio.run(submit_concurrently(scheduler, 5))
+    assert [len(call) for call in vision.calls] == [2, 2, 1]
+    assert len(results) == 5
+
+
+def test_propagated_error_reaches_every_caller():
+    vision = FakeVision(error=ModelRefused("budget mémoire épuisé"))
+    scheduler = VisionBatchScheduler(vision, max_batch_size=4, max_wait_ms=200, propagate=(ModelRefused,))
+
+    async def submit_all():
+        try:
+            return await asyncio.gather(
+                *(scheduler.submit(f"image-{i}", "décris") for i in range(3)), return_exceptions=True
+            )
+        finally:
+            await scheduler.close()
+
+    results = asyncio.run(submit_all())
+    assert len(vision.calls) == 1
+    assert all(isinstance(result, ModelRefused) for result in results)
+
+
+def test_other_errors_become_per_image_results():
+    vision = FakeVision(error=RuntimeError("CUDA out of memory"))
+    scheduler = VisionBatchScheduler(vision, max_batch_size=4, max_wait_ms=200)
+
+    results = asyncio.run(submit_concurrently(scheduler, 2))
+    assert results == [{"error": "CUDA out of memory"}] * 2
+    assert scheduler.get_metrics()["errors"] == 2
+
+
+def test_base_exception_reaches_callers_and_worker_keeps_running():
+    vision = FakeVision(error=ModelAborted("arrêt du modèle"))
+    scheduler = VisionBatchScheduler(vision, max_batch_size=4, max_wait_ms=50)
+
+    async def submit_twice():
+        try:
+            first = await asyncio.gather(
+                *(scheduler.submit(f"image-{i}", "décris") for i in range(2)), return_exceptions=True
+            )
+            vision.error = None
+            second = await asyncio.wait_for(scheduler.submit("image-2", "décris"), timeout=2.0)
+            return first, second
+        finally:
+            await scheduler.close()
+
+    first, second = asyncio.run(submit_twice())
+    assert all(isinstance(result, ModelAborted) for result in first)
+    assert second == {"success": True, "description": "décris: image-2"}
+
+
+def test_metrics_error_does_not_leave_callers_waiting():
+    vision = FakeVision()
+    scheduler = VisionBatchScheduler(vision, max_batch_size=4, max_wait_ms=50)
+    broken = {"calls": 0}
+    record = scheduler._record
+
+    def record_once_broken(*args):
+        broken["calls"] += 1
+        if broken["calls"] == 1:
+            raise ZeroDivisionError("métriques")
+        record(*args)
+
+    scheduler._record = record_once_broken
+
+    async def submit_twice():
+        try:
+            with pytest.raises(ZeroDivisionError):
+                await asyncio.wait_for(scheduler.submit("image-0", "décris"), timeout=2.0)
+            return await asyncio.wait_for(scheduler.submit("image-1", "décris"), timeout=2.0)
+        finally:
+            await scheduler.close()
+
+    assert asyncio.run(submit_twice())["description"] == "décris: image-1"
+
+
+def test_stopped_worker_fails_queued_jobs_and_restarts():
+    started = threading.Event()
+    release = threading.Event()
+
+    class BlockingVision(FakeVision):
+        def execute_batch(self, images, questions, batch_size=None):
+            started.set()
+            release.wait(timeout=2.0)
+            return super().execute_batch(images, questions, batch_size)
+
+    vision = BlockingVision()
+    scheduler = VisionBatchScheduler(vision, max_batch_size=1, max_wait_ms=0)
+
+    async def stop_worker_mid_batch():
+        try:
+            running = asyncio.ensure_future(scheduler.submit("image-0", "décris"))
+            queued = asyncio.ensure_future(scheduler.submit("image-1", "décris"))
+            while not started.is_set():
+                await asyncio.sleep(0.01)  # Premier lot dans le thread du modèle
+            scheduler._worker.cancel()
+            outcomes = await asyncio.gather(running, queued, return_exceptions=True)
+            release.set()
+            restarted = await asyncio.wait_for(scheduler.submit("image-2", "décris"), timeout=2.0)
+            return outcomes, restarted
+        finally:
+            await scheduler.close()
+
+    outcomes, restarted = asyncio.run(stop_worker_mid_batch())
+    assert all(isinstance(outcome, asyncio.CancelledError) for outcome in outcomes)
+    assert restarted["description"] == "décris: image-2"
+
+
+def test_standalone_image_analyses_share_a_batch():
+    class FakeVisionTool(FakeVision):
+        is_ready = True
+
+        def execute(self, image, question):
+            raise AssertionError("image seule: doit passer par l'ordonnanceur")
+
+    vision = FakeVisionTool()
+    agent = UnifiedAgent.__new__(UnifiedAgent)
+    agent.is_ready = True
+    agent.tools = {"vision": vision}
+    agent.vision_cache = SimpleNamespace(enabled=False)
+    agent.context = {"short_term": []}
+    agent.pipeline_pool = ThreadPoolExecutor(max_workers=2)
+    agent.request_pool = ThreadPoolExecutor(max_workers=4)
+    agent.request_gate = AdmissionGate(4)
+    scheduler = VisionBatchScheduler(vision, max_batch_size=4, max_wait_ms=200)
+
+    async def upload_twice():
+        try:
+            return await asyncio.gather(*(
+                agent.aprocess_image(f"image-{i}", "décris", vision_scheduler=scheduler) for i in range(2)
+            ))
+        finally:
+            await scheduler.close()
+
+    try:
+        results = asyncio.run(upload_twice())
+    finally:
+        agent.pipeline_pool.shutdown()
+        agent.request_pool.shutdown()
+
+    assert len(vision.calls) == 1 and sorted(vision.calls[0]) == ["image-0", "image-1"]
+    assert sorted(result["vision"]["description"] for result in results) == ["décris: image-0", "décris: image-1"]
+    assert scheduler.get_metrics()["batch_size_histogram"] == {2: 1}
@@ -0,0 +1,148 @@
+"""
+✂️ DÉCOUPAGE DE TEXTE EN CHUNKS (RAG)
+=====================================
+
+Découpeur en flux, en temps linéaire:
+- Consomme un générateur de textes (pages) sans construire le texte complet
+- Repère les fins de phrases en une seule passe (., !, ?, retour à la ligne)
+- Budgets en caractères ET en tokens (MiniLM: 256 tokens maximum)
+- Chevauchement entre chunks pour garder le contexte
+
+Auteur: BelikanM
+Date: 13 Novembre 2025
+"""
+
+import re
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Une "phrase": tout jusqu'à une ponctuation finale (incluse) ou un retour à la ligne
+_SENTENCE_RE = re.compile(r"[^.!?\n]*(?:[.!?]+|\n)|[^.!?\n]+$")
+
+
+def make_token_counter(tokenizer) -> Callable[[str], int]:
+    """Compteur de tokens à partir d'un tokenizer HuggingFace (sans tokens spéciaux)"""
+    def count_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return count_tokens
+
+
+class TextChunker:
+    """
+    Découpeur de texte en chunks bornés en caractères et (optionnellement) en tokens
+
+    Chaque phrase est mesurée une seule fois; un chunk est émis dès que la
+    phrase suivante dépasserait un des budgets, puis les dernières phrases
+    (dans la limite du chevauchement) ouvrent le chunk suivant.
+    """
+
+    def __init__(
+        self,
+        max_chars: int = 1000,
+        overlap_chars: int = 200,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        if overlap_chars >= max_chars:
+            raise ValueError("overlap_chars doit être inférieur à max_chars")
+        self.max_chars = max_chars
+        self.overlap_chars = overlap_chars
+        # Sans compteur, seuls les budgets en caractères s'appliquent
+        self.count_tokens = count_tokens if max_tokens else None
+        self.max_tokens = max_tokens if self.count_tokens else None
+        if self.max_tokens:
+            default_overlap = self.max_tokens * overlap_chars // max_chars
+            self.overlap_tokens = default_overlap if overlap_tokens is None else overlap_tokens
+        else:
+            self.overlap_tokens = 0
+
+    def _measure(self, text: str) -> int:
+        return self.count_tokens(text) if self.count_tokens else 0
+
+    def _split_oversized(self, sentence: str) -> Iterator[str]:
+        """Redécouper une phrase plus grande qu'un chunk (aux espaces si possible)"""
+        start = 0
+        while start < len(sentence):
+            end = min(start + self.max_chars, len(sentence))
+            if end < len(sentence):
+                space = sentence.rfind(" ", start, end)
+                if space > start:
+                    end = space + 1
+            piece = sentence[start:end]
+            if self.max_tokens and self._measure(piece) > self.max_tokens:
+                # Trop de tokens: réduire proportionnellement
+                ratio = self.max_tokens / max(1, self._measure(piece))
+                end = start + max(1, int(len(piece) * ratio * 0.9))
+                piece = sentence[start:end]
+            yield piece
+            start = end
+
+    def _sentences(self, texts: Iterable[str]) -> Iterator[tuple]:
+        """(phrase, caractères, tokens) pour chaque phrase de chaque texte, en une passe"""
+        for text in texts:
+            if not text:
+                continue
+            # Frontière entre textes (pages): la dernière phrase d'une page ne se
+            # colle pas à la première de la suivante
+            if not text[-1].isspace():
+                text += "\n"
+            for match in _SENTENCE_RE.finditer(text):
+                sentence = match.group(0)
+                if not sentence:
+                    continue
+                tokens = self._measure(sentence)
+                if len(sentence) > self.max_chars or (self.max_tokens and tokens > self.max_tokens):
+                    for piece in self._split_oversized(sentence):
+                        yield piece, len(piece), self._measure(piece)
+                else:
+                    yield sentence, len(sentence), tokens
+
+    def chunk(self, texts: Iterable[str]) -> Iterator[str]:
+        """
+        Découper un flux de textes (ex: pages) en chunks, au fil de l'eau
+
+        Args:
+            texts: Itérable de textes, consommé paresseusement
+
+        Yields:
+            Chunks non vides (espaces de bord retirés)
+        """
+        window: deque = deque()  # (phrase, caractères, tokens) du chunk courant
+        chars = 0
+        tokens = 0
+        fresh = 0  # Phrases ajoutées depuis le dernier chunk émis
+
+        for sentence, sentence_chars, sentence_tokens in self._sentences(texts):
+            over_chars = chars + sentence_chars > self.max_chars
+            over_tokens = self.max_tokens and tokens + sentence_tokens > self.max_tokens
+            if window and fresh and (over_chars or over_tokens):
+                chunk = "".join(part for part, _, _ in window).strip()
+                if chunk:
+                    yield chunk
+
+                # Garder la fin du chunk comme chevauchement
+                while window and (
+                    chars > self.overlap_chars
+                    or (self.max_tokens and tokens > self.overlap_tokens)
+                    or chars + sentence_chars > self.max_chars
+                    or (self.max_tokens and tokens + sentence_tokens > self.max_tokens)
+                ):
+                    _, dropped_chars, dropped_tokens = window.popleft()
+                    chars -= dropped_chars
+                    tokens -= dropped_tokens
+                fresh = 0
+
+            window.append((sentence, sentence_chars, sentence_tokens))
+            chars += sentence_chars
+            tokens += sentence_tokens
+            fresh += 1
+
+        if window and fresh:
+            chunk = "".join(part for part, _, _ in window).strip()
+            if chunk:
+                yield chunk
+
+    def chunk_text(self, text: str) -> List[str]:
+        """Découper un texte unique (raccourci)"""
+        return list(self.chunk([text]))
@@ -0,0 +1,243 @@
+"""
+🧮 ORDONNANCEUR DE LOTS VISION (DYNAMIC BATCHING)
+=================================================
+
+Regroupe les requêtes de vision de tous les uploads concurrents:
+- Chaque appelant soumet (image, question) et attend un futur asyncio
+- Une tâche de fond collecte les travaux pendant quelques millisecondes
+  (ou jusqu'à la taille de lot maximale)
+- Un seul `VisionTool.execute_batch` par lot, exécuté hors de la boucle asyncio
+- Métriques exportées: profondeur de file, remplissage des lots, attente
+
+Auteur: BelikanM
+Date: 13 Novembre 2025
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Type, Union
+
+logger = logging.getLogger(__name__)
+
+
+class _VisionJob:
+    """Un travail en attente: image, question et futur de l'appelant"""
+
+    __slots__ = ("image", "question", "future", "enqueued_at")
+
+    def __init__(self, image: Any, question: str, future: "asyncio.Future"):
+        self.image = image
+        self.question = question
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class VisionBatchScheduler:
+    """
+    Ordonnanceur de lots dynamiques pour VisionTool
+
+    Les lots partent d'un unique thread dédié: ils sont sérialisés, et
+    pendant qu'un lot tourne les travaux suivants s'accumulent dans la file
+    pour former le lot d'après. Les images envoyées seules y passent aussi
+    (`UnifiedAgent.aprocess_image`); les autres appels directs à
+    `VisionTool.execute` prennent le verrou du modèle entre deux lots.
+
+    Une erreur d'un lot devient un résultat {"error"} par image, sauf les
+    exceptions de `propagate` (ex: modèle refusé faute de mémoire), relancées
+    chez chaque appelant du lot. Aucun appelant n'attend indéfiniment: une
+    erreur inattendue (BaseException, métriques) est relancée chez ceux du
+    lot, et si la tâche de fond s'arrête, les travaux encore en file échouent
+    et le prochain `submit` la redémarre.
+    """
+
+    def __init__(
+        self,
+        vision_tool,
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10.0,
+        propagate: Tuple[Type[BaseException], ...] = ()
+    ):
+        self.vision = vision_tool
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.propagate = propagate
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision-batch")
+
+        # Métriques
+        self._jobs = 0
+        self._batches = 0
+        self._errors = 0
+        self._wait_seconds = 0.0
+        self._generate_seconds = 0.0
+        self._fill_histogram: Dict[int, int] = {}
+        self._last_batch: Dict[str, Any] = {}
+
+    def _ensure_started(self):
+        """Démarrer la tâche de fond dans la boucle courante (au premier travail)"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+            self._worker.add_done_callback(functools.partial(self._fail_queued, self._queue))
+            logger.info(
+                f"🧮 Ordonnanceur vision démarré (lots ≤ {self.max_batch_size}, "
+                f"attente ≤ {self.max_wait * 1000:.0f} ms)"
+            )
+
+    async def submit(self, image: Any, question: str) -> Dict[str, Any]:
+        """Soumettre une image et attendre son résultat (format `VisionTool.execute`)"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_VisionJob(image, question, future))
+        return await future
+
+    async def submit_many(self, images: List[Any], questions: Union[str, List[str]]) -> List[Dict[str, Any]]:
+        """Soumettre plusieurs images; elles peuvent être regroupées avec celles d'autres requêtes"""
+        if isinstance(questions, str):
+            questions = [questions] * len(images)
+        return list(await asyncio.gather(*(
+            self.submit(image, question) for image, question in zip(images, questions)
+        )))
+
+    async def _collect(self) -> List[_VisionJob]:
+        """Attendre un premier travail puis compléter le lot jusqu'à la taille ou au délai max"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Délai écoulé: prendre sans attendre ce qui est déjà en file
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                continue
+
+        # Ignorer les appelants qui ont abandonné (annulation)
+        return [job for job in batch if not job.future.done()]
+
+    @staticmethod
+    def _fail_queued(queue: asyncio.Queue, worker: asyncio.Task):
+        """Tâche de fond arrêtée: faire échouer les travaux restés dans sa file"""
+        error = None if worker.cancelled() else worker.exception()
+        if error is not None:
+            logger.error(f"❌ Ordonnanceur vision arrêté: {error!r}")
+        while not queue.empty():
+            job = queue.get_nowait()
+            if job.future.done():
+                continue
+            if error is None:
+                job.future.cancel()
+            else:
+                job.future.set_exception(error)
+
+    async def _run(self):
+        """Boucle de fond: collecter, exécuter un lot, distribuer les résultats"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            try:
+                await self._run_batch(loop, batch)
+            except asyncio.CancelledError:
+                for job in batch:
+                    job.future.cancel()  # Arrêt (close): les appelants du lot sont annulés
+                raise
+            except BaseException as e:
+                # Hors du cas prévu (BaseException du modèle, erreur des métriques):
+                # aucun appelant du lot ne reste en attente
+                logger.error(f"❌ Lot vision interrompu: {e!r}")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                if isinstance(e, (KeyboardInterrupt, SystemExit)):
+                    raise
+
+    async def _run_batch(self, loop: asyncio.AbstractEventLoop, batch: List[_VisionJob]):
+        """Exécuter un lot dans le thread du modèle et distribuer les résultats"""
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(
+                self._executor,
+                lambda: self.vision.execute_batch(
+                    [job.image for job in batch],
+                    [job.question for job in batch],
+                    batch_size=len(batch)
+                )
+            )
+        except self.propagate as e:
+            logger.warning(f"⏳ Lot vision refusé: {e}")
+            results = [{"error": str(e)} for _ in batch]
+            self._record(batch, results, started)
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+        except Exception as e:
+            logger.error(f"❌ Erreur lot vision: {e}")
+            results = [{"error": str(e)} for _ in batch]
+
+        self._record(batch, results, started)
+        for job, result in zip(batch, results):
+            if not job.future.done():
+                job.future.set_result(result)
+        for job in batch[len(results):]:
+            if not job.future.done():
+                job.future.set_result({"error": "Aucun résultat du modèle pour cette image"})
+
+    def _record(self, batch: List[_VisionJob], results: List[Dict[str, Any]], started: float):
+        """Mettre à jour les métriques après un lot"""
+        generate_seconds = time.perf_counter() - started
+        size = len(batch)
+        self._jobs += size
+        self._batches += 1
+        self._errors += sum(1 for result in results if "error" in result)
+        self._wait_seconds += sum(started - job.enqueued_at for job in batch)
+        self._generate_seconds += generate_seconds
+        self._fill_histogram[size] = self._fill_histogram.get(size, 0) + 1
+        self._last_batch = {
+            "size": size,
+            "fill": round(size / self.max_batch_size, 3),
+            "seconds": round(generate_seconds, 4),
+            "images_per_sec": round(size / generate_seconds, 3) if generate_seconds > 0 else None
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métriques de l'ordonnanceur (file, remplissage des lots, latences)"""
+        batches = self._batches or 1
+        jobs = self._jobs or 1
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": self._jobs,
+            "batches": self._batches,
+            "errors": self._errors,
+            "avg_batch_size": round(self._jobs / batches, 3),
+            "avg_batch_fill": round(self._jobs / (batches * self.max_batch_size), 3),
+            "batch_size_histogram": dict(sorted(self._fill_histogram.items())),
+            "avg_queue_wait_ms": round(self._wait_seconds / jobs * 1000, 2),
+            "images_per_sec": round(self._jobs / self._generate_seconds, 3) if self._generate_seconds > 0 else None,
+            "last_batch": self._last_batch
+        }
+
+    async def close(self):
+        """Arrêter la tâche de fond et libérer le thread du modèle"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)